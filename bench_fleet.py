@@ -0,0 +1,91 @@
+"""
+Offline scaling benchmark of the worker fleet.
+
+Replays the synthetic corpus through WorkerFleet with 1, 2, 4... worker
+processes against a zero-latency StubLLM, so the run is bound by the CPU
+work of the workflow (rules, tiers, prompt building, JSON parsing) rather
+than by the model. Reports throughput and its speedup over one process,
+with the latency and restarts of each worker. Scaling stops at the number
+of cores, and at SQLite's single writer (--write-behind batches the
+saves).
+
+Usage:
+    python bench_fleet.py --processes 1 2 4 --messages 2000
+    python bench_fleet.py --processes 4 --write-behind --crash-after 500
+"""
+import argparse
+import functools
+import os
+import signal
+import tempfile
+import time
+from typing import Dict, List
+
+from bench_moderation import generate_corpus
+from group_config import GroupConfig
+from stub_llm import StubLLM
+from worker_fleet import WorkerFleet
+
+
+def run(corpus: List[Dict], processes: int, args) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        config = GroupConfig("bench", db_path=os.path.join(tmp, "bench.db"))
+        fleet = WorkerFleet(
+            "stub", [config], processes=processes, threads=args.threads,
+            llm_factory=functools.partial(StubLLM, latency_ms=args.latency_ms, jitter_ms=0,
+                                          seed=args.seed),
+            use_scheduler=False, use_cache=not args.no_cache, write_behind=args.write_behind)
+        fleet.wait_ready()
+
+        start = time.perf_counter()
+        futures = []
+        for index, message in enumerate(corpus):
+            if args.crash_after and index == args.crash_after:
+                # Kill one worker mid-run; its messages must still be answered
+                os.kill(fleet.stats()['workers'][0]['pid'], signal.SIGKILL)
+            futures.append(fleet.submit(dict(message, group_id="bench")))
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                failed += 1
+        elapsed = time.perf_counter() - start
+        stats = fleet.stats()
+        fleet.close()
+
+    return {'processes': processes, 'elapsed': elapsed, 'throughput': len(corpus) / elapsed,
+            'failed': failed, 'stats': stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline worker-fleet scaling benchmark")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4, help="Threads per worker")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--crash-after", type=int, default=0,
+                        help="Kill worker 0 after this many messages were submitted")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.messages, duplicate_rate=args.duplicate_rate, seed=args.seed)
+    print(f"CPU cores: {os.cpu_count()}  messages: {len(corpus)}")
+    print(f"{'processes':>10}{'msg/s':>10}{'speedup':>10}{'failed':>8}{'restarts':>10}  "
+          f"per-worker p50/p95 ms")
+    baseline = None
+    for processes in args.processes:
+        result = run(corpus, processes, args)
+        baseline = baseline or result['throughput']
+        latencies = " ".join(f"{w['latency']['p50_ms']:g}/{w['latency']['p95_ms']:g}"
+                             for w in result['stats']['workers'])
+        print(f"{processes:>10}{result['throughput']:>10.1f}"
+              f"{result['throughput'] / baseline:>9.2f}x{result['failed']:>8}"
+              f"{result['stats']['restarts']:>10}  {latencies}")
+
+
+if __name__ == "__main__":
+    main()
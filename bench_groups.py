@@ -0,0 +1,111 @@
+"""
+Offline benchmark of several groups sharing one LLM quota.
+
+One noisy group dumps a burst of messages at once while the other groups
+keep sending at a steady rate, all through ModerationGroups against
+StubLLM with a rate-limited scheduler. Reports latency and shed
+(degraded) messages per group, with fair queuing between the groups and,
+with --no-fair, with every call in one shared queue as before. Plain
+thank-you messages are low priority and still wait behind every group's
+other calls, which shows in the quiet groups' p95.
+
+Usage:
+    python bench_groups.py --groups 4 --burst 200 --quiet-messages 20 --rpm 600 --bucket 10
+    python bench_groups.py --no-fair
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from bench_moderation import generate_corpus, percentile
+from group_config import GroupConfig
+from moderation_groups import ModerationGroups
+from stub_llm import StubLLM
+
+
+async def _run(groups: ModerationGroups, arrivals: List[Dict]) -> List[Dict]:
+    loop_start = time.perf_counter()
+
+    async def one(message: Dict) -> Dict:
+        arrival = loop_start + message['at']
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        result = await groups.agent(message['group_id']).aprocess_message(
+            message['message_id'], message['user_id'], message['content'])
+        return {'group_id': message['group_id'], 'latency': time.perf_counter() - arrival,
+                'degraded': result['degraded']}
+
+    return await asyncio.gather(*(one(m) for m in arrivals))
+
+
+def build_arrivals(group_ids: List[str], burst: int, quiet_messages: int, span_s: float,
+                   seed: int) -> List[Dict]:
+    """The first group's burst at t=0, the others spread evenly over span_s"""
+    corpus = generate_corpus(burst + quiet_messages * (len(group_ids) - 1),
+                             duplicate_rate=0.0, seed=seed)
+    arrivals = []
+    for message in corpus[:burst]:
+        arrivals.append(dict(message, group_id=group_ids[0], at=0.0))
+    rest = iter(corpus[burst:])
+    for index in range(quiet_messages):
+        for group_id in group_ids[1:]:
+            arrivals.append(dict(next(rest), group_id=group_id,
+                                 at=span_s * index / max(1, quiet_messages)))
+    return arrivals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline multi-group fairness benchmark")
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--burst", type=int, default=200, help="Messages the noisy group sends at once")
+    parser.add_argument("--quiet-messages", type=int, default=20, help="Messages per other group")
+    parser.add_argument("--span-s", type=float, default=10.0,
+                        help="Seconds over which the other groups send")
+    parser.add_argument("--rpm", type=float, default=600, help="Shared LLM requests per minute")
+    parser.add_argument("--bucket", type=float, default=10,
+                        help="Scheduler burst capacity (calls that may go out at once)")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--deadline-s", type=float, default=15.0)
+    parser.add_argument("--no-fair", action="store_true",
+                        help="One queue for all groups (calls are not tagged with their group)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    group_ids = ["noisy"] + [f"quiet{i}" for i in range(1, max(2, args.groups))]
+    arrivals = build_arrivals(group_ids, args.burst, args.quiet_messages, args.span_s, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Without rules and cache every message needs the LLM
+        configs = [GroupConfig(g, db_path=os.path.join(tmp, f"{g}.db"), use_rules=False)
+                   for g in group_ids]
+        groups = ModerationGroups("stub", configs, llm=StubLLM(latency_ms=args.latency_ms,
+                                                               seed=args.seed),
+                                  requests_per_minute=args.rpm, burst=args.bucket,
+                                  deadline_s=args.deadline_s,
+                                  use_cache=False, use_near_duplicates=False)
+        if args.no_fair:
+            for agent in groups.agents.values():
+                agent.group_id = None
+
+        start = time.perf_counter()
+        records = asyncio.run(_run(groups, arrivals))
+        elapsed = time.perf_counter() - start
+        groups.close()
+
+    print(f"Groups: {len(group_ids)}  scheduling: {'one queue' if args.no_fair else 'fair'}  "
+          f"rpm: {args.rpm:g}  elapsed: {elapsed:.1f}s")
+    print(f"{'group':<10}{'messages':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'shed':>8}")
+    for group_id in group_ids:
+        rows = [r for r in records if r['group_id'] == group_id]
+        latencies = [r['latency'] * 1000 for r in rows]
+        print(f"{group_id:<10}{len(rows):>10}{percentile(latencies, 50):>10.0f}"
+              f"{percentile(latencies, 95):>10.0f}{max(latencies):>10.0f}"
+              f"{sum(r['degraded'] for r in rows):>8}")
+
+
+if __name__ == "__main__":
+    main()
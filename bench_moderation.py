@@ -0,0 +1,374 @@
+"""
+Offline throughput/latency benchmark for ModerationAgent.
+
+Runs the full workflow against StubLLM (no network) and replays a
+synthetic Hebrew corpus at a target arrival rate, either serially
+(process_message, one at a time) or concurrently (aprocess_message on
+one event loop). Reports throughput, p50/p95/p99 latency, time per
+workflow node (from the agent's built-in metrics) and database cost, and can write the results as JSON and
+compare them with an earlier run.
+
+Usage:
+    python bench_moderation.py --messages 500 --rate 20 --mode concurrent
+    python bench_moderation.py --json results.json --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from llm_moderation_agent import ModerationAgent
+from moderation_storage import ModerationStorage
+from stub_llm import StubLLM
+
+NODES = ["rule_check", "cache_lookup", "near_duplicate", "local_classify", "get_context",
+         "llm_analyze", "make_decision"]
+
+# Synthetic corpus building blocks
+NAMES = ["לימור", "עומרי", "יפה", "דנה", "אבי", "מיכל", "יוסי", "רונית", "שירה", "איתי"]
+ITEMS = ["כריכים", "מנות חמות", "ארגזי ציוד", "מאווררים", "גרביים", "שקי שינה", "פנסים", "ערכות עזרה ראשונה"]
+PLACES = ["כפר עזה", "באר שבע", "אופקים", "שדרות", "נתיבות", "רעים", "עזה"]
+TEMPLATES = [
+    ("request", "מחפשת {qty} {item} למחר - {name} {phone}"),
+    ("request", "מחפשת {qty} {item} למחר לאיוש, תודה רבה {name} 🙏"),
+    ("request", "{qty} לוחמים ב{place} צריכים {item} - {name} {phone}"),
+    ("request", "מי יכול להסיע {item} ל{place} מחר בבוקר? יש לנו {qty} ארגזים"),
+    ("request", "צריך {qty} {item} לערב, מי יכול לעזור?"),
+    ("thanks", "תודה לכל המתנדבים!"),
+    ("thanks", "שבת שלום לכולם ❤️"),
+    ("thanks", "כל הכבוד לכולם, אלופים 🙏"),
+    ("ambiguous", "חיילים ב{place} צריכים עזרה"),
+    ("violation", "גדוד {unit} יוצא מחר בקואורדינטות 31.{qty}°N 34.5°E"),
+    ("violation", "חיילי יחידה {unit} במשימה בשעה 06:00"),
+]
+
+
+def generate_corpus(size: int, users: int = 600, duplicate_rate: float = 0.2,
+                    seed: int = 7) -> List[Dict]:
+    """Synthetic Hebrew group traffic, with a share of forwarded duplicates"""
+    rng = random.Random(seed)
+    corpus: List[Dict] = []
+    for i in range(size):
+        if corpus and rng.random() < duplicate_rate:
+            content = rng.choice(corpus)['content']
+        else:
+            _, template = rng.choice(TEMPLATES)
+            content = template.format(
+                qty=rng.randint(2, 150), item=rng.choice(ITEMS), name=rng.choice(NAMES),
+                place=rng.choice(PLACES), unit=rng.randint(100, 999),
+                phone=f"05{rng.randint(0, 9)}-{rng.randint(1000000, 9999999)}",
+            )
+        corpus.append({
+            'message_id': f"bench_{i}",
+            'user_id': f"user_{rng.randrange(users)}@c.us",
+            'content': content,
+        })
+    return corpus
+
+
+class _Timer:
+    """Thread-safe accumulator of (calls, seconds) per key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, key: str, elapsed: float) -> None:
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.seconds[key] = self.seconds.get(key, 0.0) + elapsed
+
+
+class TimedStorage(ModerationStorage):
+    """ModerationStorage that accounts time spent in SQLite"""
+
+    def __init__(self, db_path: str, timer: _Timer):
+        super().__init__(db_path)
+        self.timer = timer
+
+    def fetchone(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().fetchone(sql, params)
+        finally:
+            self.timer.add("read", time.perf_counter() - start)
+
+    def fetchall(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().fetchall(sql, params)
+        finally:
+            self.timer.add("read", time.perf_counter() - start)
+
+    @contextmanager
+    def transaction(self):
+        nested = self.connection().in_transaction
+        start = time.perf_counter()
+        with super().transaction() as conn:
+            yield conn
+        if not nested:
+            self.timer.add("write", time.perf_counter() - start)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def run_serial(agent: ModerationAgent, corpus: List[Dict], rate: float) -> List[Dict]:
+    """One message at a time, arrivals paced at `rate` per second (0 = back to back)"""
+    records = []
+    start = time.perf_counter()
+    for index, message in enumerate(corpus):
+        arrival = start + index / rate if rate > 0 else time.perf_counter()
+        now = time.perf_counter()
+        if arrival > now:
+            time.sleep(arrival - now)
+        begin = time.perf_counter()
+        result = agent.process_message(message['message_id'], message['user_id'], message['content'])
+        done = time.perf_counter()
+        records.append({'latency': done - arrival, 'service': done - begin, 'result': result})
+    return records
+
+
+async def _run_concurrent(agent: ModerationAgent, corpus: List[Dict], rate: float,
+                          concurrency: int) -> List[Dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+    loop_start = time.perf_counter()
+
+    async def one(index: int, message: Dict) -> Dict:
+        arrival = loop_start + (index / rate if rate > 0 else 0)
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            begin = time.perf_counter()
+            result = await agent.aprocess_message(
+                message['message_id'], message['user_id'], message['content'])
+            done = time.perf_counter()
+        return {'latency': done - arrival, 'service': done - begin, 'result': result}
+
+    return await asyncio.gather(*(one(i, m) for i, m in enumerate(corpus)))
+
+
+def run_concurrent(agent: ModerationAgent, corpus: List[Dict], rate: float,
+                   concurrency: int) -> List[Dict]:
+    """Open-loop arrivals at `rate` per second, up to `concurrency` in flight"""
+    return asyncio.run(_run_concurrent(agent, corpus, rate, concurrency))
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(records: List[Dict], elapsed: float, metrics: Dict,
+              db_timer: _Timer, llm: StubLLM) -> Dict:
+    latencies = [r['latency'] * 1000 for r in records]
+    services = [r['service'] * 1000 for r in records]
+    nodes = metrics['nodes']
+    node_total = sum(node['sum_s'] for node in nodes.values()) or 1.0
+
+    actions: Dict[str, int] = {}
+    for r in records:
+        actions[r['result']['action']] = actions.get(r['result']['action'], 0) + 1
+    deletes = [r['latency'] * 1000 for r in records if r['result']['action'] == 'DELETE_MESSAGE']
+
+    return {
+        'messages': len(records),
+        'elapsed_s': elapsed,
+        'throughput_msg_s': len(records) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else 0.0,
+        },
+        # Message to delete decision - the window in which details stay visible
+        'delete_latency_ms': {
+            'p50': percentile(deletes, 50),
+            'p95': percentile(deletes, 95),
+        },
+        'service_ms': {
+            'p50': percentile(services, 50),
+            'p95': percentile(services, 95),
+            'p99': percentile(services, 99),
+        },
+        'nodes': {
+            name: {
+                'calls': nodes.get(name, {}).get('count', 0),
+                'total_s': nodes.get(name, {}).get('sum_s', 0.0),
+                'avg_ms': nodes.get(name, {}).get('avg_ms', 0.0),
+                'share_pct': nodes.get(name, {}).get('sum_s', 0.0) / node_total * 100,
+            }
+            for name in NODES
+        },
+        'stages': metrics['stages'],
+        'db': {
+            kind: {
+                'calls': db_timer.calls.get(kind, 0),
+                'total_s': db_timer.seconds.get(kind, 0.0),
+                'avg_ms': (db_timer.seconds.get(kind, 0.0) / db_timer.calls[kind] * 1000)
+                if db_timer.calls.get(kind) else 0.0,
+            }
+            for kind in ("read", "write")
+        },
+        'llm_calls': llm.calls,
+        'verdict_sources': metrics['messages'],
+        'fallback_parse_rate': metrics['fallback_parse_rate'],
+        'llm_errors': metrics['llm_errors'],
+        'actions': actions,
+    }
+
+
+def print_report(summary: Dict) -> None:
+    print(f"Messages:   {summary['messages']}  in {summary['elapsed_s']:.2f} s")
+    print(f"Throughput: {summary['throughput_msg_s']:.1f} msg/s")
+    lat = summary['latency_ms']
+    print(f"Latency:    p50 {lat['p50']:.1f} ms  p95 {lat['p95']:.1f} ms  "
+          f"p99 {lat['p99']:.1f} ms  max {lat['max']:.1f} ms")
+    print(f"LLM calls:  {summary['llm_calls']}   sources: {summary['verdict_sources']}")
+    delete = summary['delete_latency_ms']
+    print(f"To delete:  p50 {delete['p50']:.1f} ms  p95 {delete['p95']:.1f} ms   "
+          f"streams stopped early: {summary.get('streams_stopped')}")
+    print(f"Actions:    {summary['actions']}")
+    print(f"LLM errors: {summary['llm_errors']}   fallback parse rate: {summary['fallback_parse_rate']}")
+    print(f"Provider 429s: {summary['provider_rate_limited']}   scheduler: {summary['scheduler']}")
+    print(f"Circuit breaker: {summary.get('circuit_breaker')}")
+    print(f"Prompt tokens: {summary.get('prompt_tokens')}   micro-batches: {summary.get('micro_batches')}")
+    print("\nNode time split:")
+    for name, node in summary['nodes'].items():
+        print(f"  {name:<14}{node['calls']:>7} calls {node['avg_ms']:>9.2f} ms avg "
+              f"{node['share_pct']:>6.1f}%")
+    for name, stage in summary['stages'].items():
+        print(f"    {name:<12}{stage['count']:>7} calls {stage['avg_ms']:>9.2f} ms avg")
+    print("\nDatabase:")
+    for kind, db in summary['db'].items():
+        print(f"  {kind:<14}{db['calls']:>7} calls {db['avg_ms']:>9.3f} ms avg "
+              f"{db['total_s']:>8.3f} s total")
+
+
+def print_comparison(current: Dict, baseline: Dict) -> None:
+    """Relative change of headline metrics against an earlier results file"""
+    def change(now: float, before: float) -> str:
+        if not before:
+            return "n/a"
+        return f"{(now - before) / before * 100:+.1f}%"
+
+    cur, base = current['summary'], baseline['summary']
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'}:")
+    print(f"  throughput  {base['throughput_msg_s']:.1f} -> {cur['throughput_msg_s']:.1f} msg/s "
+          f"({change(cur['throughput_msg_s'], base['throughput_msg_s'])})")
+    for pct in ("p50", "p95", "p99"):
+        before, now = base['latency_ms'][pct], cur['latency_ms'][pct]
+        print(f"  latency {pct} {before:.1f} -> {now:.1f} ms ({change(now, before)})")
+    print(f"  llm calls   {base['llm_calls']} -> {cur['llm_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline moderation benchmark")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=0, help="Arrivals per second (0 = as fast as possible)")
+    parser.add_argument("--mode", choices=["serial", "concurrent"], default="concurrent")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--provider-rpm", type=float,
+                        help="Simulated provider rate limit (429 + Retry-After above it)")
+    parser.add_argument("--rpm", type=float, default=100000,
+                        help="Scheduler requests-per-minute quota")
+    parser.add_argument("--no-scheduler", action="store_true")
+    parser.add_argument("--no-breaker", action="store_true", help="Disable the LLM circuit breaker")
+    parser.add_argument("--micro-batch", type=int, default=1,
+                        help="Messages per LLM call (1 = no micro-batching)")
+    parser.add_argument("--micro-batch-window-ms", type=float, default=50)
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream completions and stop once a deletion is certain")
+    parser.add_argument("--deadline-s", type=float, default=15.0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--no-rules", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    parser.add_argument("--compare", help="Earlier --json results to compare against")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.messages, duplicate_rate=args.duplicate_rate, seed=args.seed)
+    db_timer = _Timer()
+    llm = StubLLM(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                  malformed_rate=args.malformed_rate, rate_limit_rpm=args.provider_rpm,
+                  seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        agent = ModerationAgent(
+            groq_api_key="stub", db_path=db_path,
+            storage=TimedStorage(db_path, db_timer),
+            use_rules=not args.no_rules, use_cache=not args.no_cache,
+            write_behind=args.write_behind,
+            use_scheduler=not args.no_scheduler, requests_per_minute=args.rpm,
+            deadline_s=args.deadline_s, use_circuit_breaker=not args.no_breaker,
+            micro_batch_size=args.micro_batch, micro_batch_window_ms=args.micro_batch_window_ms,
+            streaming=args.stream,
+        )
+        agent.llm = llm
+
+        start = time.perf_counter()
+        if args.mode == "serial":
+            records = run_serial(agent, corpus, args.rate)
+        else:
+            records = run_concurrent(agent, corpus, args.rate, args.concurrency)
+        elapsed = time.perf_counter() - start
+        scheduler = agent.scheduler.stats() if agent.scheduler is not None else None
+        breaker = agent.breaker.stats() if agent.breaker is not None else None
+        batches = agent.batcher.stats() if agent.batcher is not None else None
+        tokens = agent.token_usage.stats()
+        agent.close()
+        agent.storage.close()
+
+    summary = summarize(records, elapsed, agent.metrics.snapshot(), db_timer, llm)
+    summary['scheduler'] = scheduler
+    summary['circuit_breaker'] = breaker
+    summary['micro_batches'] = batches
+    summary['streams_stopped'] = llm.streams_stopped
+    summary['prompt_tokens'] = tokens['prompt_tokens']
+    summary['provider_rate_limited'] = llm.rate_limited
+    print_report(summary)
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'config': vars(args),
+        'summary': summary,
+    }
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark for the rule engine fast path.
+
+Usage:
+    python bench_rule_engine.py [--messages 50000]
+"""
+import argparse
+import random
+import time
+
+from rule_engine import RuleEngine
+
+SAMPLE_MESSAGES = [
+    'גדוד 202 יוצא מחר בקואורדינטות 31.5°N 34.5°E - טלפון מפקד 050-1234567',
+    'מחפשת 100 כריכים למחר לאיוש תודה רבה לימור נמר 0523796059',
+    'חיילים בעזה צריכים עזרה',
+    '15 לוחמים בכפר עזה צריכים מאווררים - עומרי 0586314533',
+    'חיילי יחידה 8200 במשימה בשעה 06:00',
+    'תודה לכל המתנדבים!',
+    'מי יכול להסיע ציוד לדרום מחר בבוקר? יש לנו 3 ארגזים',
+    'שבת שלום לכולם ❤️',
+    'מיקום האיסוף 31.52341, 34.45123',
+    'צריך 40 מנות חמות לערב, מי יכול לבשל?',
+]
+
+
+def build_corpus(size: int, seed: int = 7) -> list:
+    """Synthetic corpus - sample messages with random numeric variation"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        message = rng.choice(SAMPLE_MESSAGES)
+        corpus.append(f"{message} {rng.randint(1, 999)}" if rng.random() < 0.3 else message)
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule engine micro-benchmark")
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+
+    start = time.perf_counter()
+    engine = RuleEngine()
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decided = sum(1 for message in corpus if engine.evaluate(message))
+    elapsed = time.perf_counter() - start
+
+    print(f"Engine build: {build_time * 1000:.2f} ms")
+    print(f"Messages: {len(corpus)}")
+    print(f"Decided by rules: {decided} ({decided / len(corpus) * 100:.1f}%)")
+    print(f"Total: {elapsed:.3f} s")
+    print(f"Throughput: {len(corpus) / elapsed:,.0f} messages/sec")
+    print(f"Per message: {elapsed / len(corpus) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark the messages table queries on a synthetic million-row table,
+before and after the indexed-schema migration.
+
+Usage:
+    python bench_schema.py [--rows 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from moderation_storage import ModerationStorage, MIGRATIONS
+
+CLASSIFICATIONS = ['APPROVED', 'APPROVED', 'APPROVED', 'CONTEXT_DEPENDENT', 'CLEAR_VIOLATION']
+ACTIONS = {'APPROVED': 'APPROVE', 'CONTEXT_DEPENDENT': 'FLAG_FOR_REVIEW', 'CLEAR_VIOLATION': 'DELETE_MESSAGE'}
+FEEDBACK = [None] * 18 + ['CORRECT', 'INCORRECT']
+
+LEGACY_HISTORY = """
+    SELECT classification, reasoning, feedback
+    FROM messages
+    WHERE user_id = ?
+    ORDER BY timestamp DESC
+    LIMIT 5
+"""
+LEGACY_DAILY = """
+    SELECT classification, action
+    FROM messages
+    WHERE date(timestamp) = date('now')
+"""
+LEGACY_DAILY_FEEDBACK = """
+    SELECT
+        COUNT(*) as total_feedback,
+        SUM(CASE WHEN feedback = 'CORRECT' THEN 1 ELSE 0 END) as correct
+    FROM messages
+    WHERE date(timestamp) = date('now', '-7 days')
+    AND feedback IS NOT NULL
+"""
+
+
+def build_legacy_table(db_path: str, rows: int, users: int = 600, days: int = 365) -> None:
+    """Original schema (primary key only) filled with synthetic rows"""
+    rng = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    MIGRATIONS[0][2](conn)
+
+    now = datetime.now()
+    batch = []
+    for i in range(rows):
+        classification = rng.choice(CLASSIFICATIONS)
+        timestamp = now - timedelta(seconds=rng.randint(0, days * 86400))
+        batch.append((
+            f"msg_{i}", f"user_{rng.randrange(users)}", "הודעה לדוגמה",
+            timestamp.isoformat(), classification, rng.random(), "ניתוח",
+            ACTIONS[classification], rng.choice(FEEDBACK)
+        ))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat: int) -> float:
+    """Average milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="messages table schema benchmark")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+
+        start = time.perf_counter()
+        build_legacy_table(db_path, args.rows)
+        print(f"Built {args.rows:,} rows in {time.perf_counter() - start:.1f} s")
+
+        storage = ModerationStorage(db_path)
+        rng = random.Random(1)
+
+        def legacy_history():
+            storage.fetchall(LEGACY_HISTORY, (f"user_{rng.randrange(600)}",))
+
+        before = {
+            'user history (LIMIT 5)': timed(legacy_history, args.repeat),
+            'daily messages': timed(lambda: storage.fetchall(LEGACY_DAILY), args.repeat),
+            'daily feedback': timed(lambda: storage.fetchone(LEGACY_DAILY_FEEDBACK), args.repeat),
+        }
+
+        start = time.perf_counter()
+        storage.setup_schema()
+        print(f"Migrated to schema v{storage.schema_version()} in {time.perf_counter() - start:.1f} s")
+
+        after = {
+            'user history (LIMIT 5)': timed(
+                lambda: storage.get_user_history(f"user_{rng.randrange(600)}"), args.repeat),
+            'daily messages': timed(lambda: storage.daily_results(0), args.repeat),
+            'daily feedback': timed(lambda: storage.daily_feedback_totals(7), args.repeat),
+        }
+
+        print(f"\n{'query':<26}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            print(f"{name:<26}{before[name]:>12.2f}{after[name]:>12.3f}{speedup:>9.0f}x")
+
+        print("\nQuery plans:")
+        for sql, params in [
+            ("SELECT classification FROM messages WHERE user_id = ? ORDER BY ts DESC LIMIT 5", ("user_1",)),
+            ("SELECT classification, action FROM messages WHERE ts >= ? AND ts < ?", (0, 1)),
+        ]:
+            plan = storage.fetchall("EXPLAIN QUERY PLAN " + sql, params)
+            print(f"  {plan[-1][-1]}")
+
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
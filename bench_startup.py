@@ -0,0 +1,92 @@
+"""
+Startup benchmark for the command-line entry points.
+
+The bot spawns process_feedback.py for every admin reaction and
+get_daily_stats.py for the daily report, so their startup time is paid
+every time. Each case runs in a fresh interpreter: first the import time
+of the module (and which LLM packages it dragged in), then the wall time
+of running the CLI end to end against a scratch database.
+
+Usage:
+    python bench_startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+HEAVY_PACKAGES = ("langchain_core", "langchain_groq", "langgraph", "groq", "pydantic", "httpx")
+
+IMPORT_CASES = [
+    ("interpreter", "pass"),
+    ("moderation_storage", "import moderation_storage"),
+    ("moderation_feedback", "import moderation_feedback"),
+    ("get_daily_stats", "import get_daily_stats"),
+    ("process_feedback", "import process_feedback"),
+    ("llm_moderation_agent", "import llm_moderation_agent"),
+    ("ModerationAgent()", "from llm_moderation_agent import ModerationAgent\n"
+                          "ModerationAgent('stub', db_path='agent.db')"),
+]
+
+CLI_CASES = [
+    ("get_daily_stats.py", ["get_daily_stats.py"]),
+    ("process_feedback.py", ["process_feedback.py", "bench_message", "✅"]),
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+loaded = sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{'seconds': elapsed, 'loaded': loaded}}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def time_import(code: str, workdir: str) -> dict:
+    """Import time of code in a fresh interpreter"""
+    probe = PROBE.format(code=code, heavy=HEAVY_PACKAGES)
+    output = subprocess.run([sys.executable, "-c", probe], cwd=workdir, env=_env(),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def time_cli(args, workdir: str) -> float:
+    """Wall time of one CLI run, interpreter startup included"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(REPO, args[0])] + args[1:], cwd=workdir,
+                   env=_env(), capture_output=True, check=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entry point startup benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'import':<22}{'median ms':>10}  LLM packages loaded")
+        for name, code in IMPORT_CASES:
+            runs = [time_import(code, workdir) for _ in range(args.repeat)]
+            median = statistics.median(run['seconds'] for run in runs) * 1000
+            print(f"{name:<22}{median:>10.1f}  {', '.join(runs[0]['loaded']) or '-'}")
+
+        print(f"\n{'CLI (wall time)':<22}{'median ms':>10}")
+        for name, cli_args in CLI_CASES:
+            runs = [time_cli(cli_args, workdir) for _ in range(args.repeat)]
+            print(f"{name:<22}{statistics.median(runs) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Circuit breaker around the Groq calls.
+
+Every LLM call reports its outcome: an exception, or a success with its
+latency. Calls slower than slow_call_s count as failures too, so a
+provider that answers in twenty seconds trips the breaker just like one
+that refuses connections. When the failure rate over the rolling window
+crosses failure_rate the breaker opens and the agent stops calling the
+LLM altogether - messages take the degraded path in milliseconds instead
+of each waiting out the client timeout. After a cooldown the breaker goes
+half-open and lets single probe calls through; enough consecutive
+successes close it, a failure reopens it with a doubled cooldown.
+Rate-limit responses are not failures - the scheduler handles those.
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from llm_scheduler import is_rate_limited
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_WINDOW_S = 60.0
+DEFAULT_MIN_CALLS = 5
+DEFAULT_FAILURE_RATE = 0.5
+DEFAULT_SLOW_CALL_S = 8.0
+DEFAULT_OPEN_S = 15.0
+MAX_OPEN_S = 300.0
+DEFAULT_PROBE_SUCCESSES = 2
+
+
+class CircuitOpen(Exception):
+    """The LLM was not called because the breaker is open"""
+
+
+class CircuitBreaker:
+    """Rolling-window error/latency breaker with half-open probing"""
+
+    def __init__(self, window_s: float = DEFAULT_WINDOW_S, min_calls: int = DEFAULT_MIN_CALLS,
+                 failure_rate: float = DEFAULT_FAILURE_RATE,
+                 slow_call_s: float = DEFAULT_SLOW_CALL_S, open_s: float = DEFAULT_OPEN_S,
+                 max_open_s: float = MAX_OPEN_S,
+                 probe_successes: int = DEFAULT_PROBE_SUCCESSES, metrics=None):
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.base_open_s = open_s
+        self.max_open_s = max_open_s
+        self.probe_successes = probe_successes
+        self.metrics = metrics
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()  # (time, failed, slow)
+        self.open_s = open_s
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._probe_run = 0
+
+        self.rejected = 0
+        self.trips = 0
+        self.last_error: Optional[str] = None
+        self._set_metrics_state()
+
+    # State machine (called under the lock)
+
+    def _set_metrics_state(self) -> None:
+        if self.metrics is not None:
+            self.metrics.set_circuit_state(self.state)
+
+    def _transition(self, state: str, now: float) -> None:
+        self.state = state
+        if state == OPEN:
+            self._opened_at = now
+            self.trips += 1
+        elif state == HALF_OPEN:
+            self._probe_started = None
+            self._probe_run = 0
+        else:
+            self._outcomes.clear()
+            self.open_s = self.base_open_s
+        self._set_metrics_state()
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_s:
+            self._outcomes.popleft()
+
+    def _should_trip(self) -> bool:
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return False
+        failed = sum(1 for _, failure, slow in self._outcomes if failure or slow)
+        return failed / calls >= self.failure_rate
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_started = None
+                if failed or slow:
+                    # Still down - back off further before the next probe
+                    self.open_s = min(self.max_open_s, self.open_s * 2)
+                    self._transition(OPEN, now)
+                    return
+                self._probe_run += 1
+                if self._probe_run >= self.probe_successes:
+                    self._transition(CLOSED, now)
+                return
+            if self.state == OPEN:
+                return  # A call that started before the breaker opened
+            self._outcomes.append((now, failed, slow))
+            self._prune(now)
+            if (failed or slow) and self._should_trip():
+                self._transition(OPEN, now)
+
+    # Public API
+
+    def allow(self) -> bool:
+        """Whether a new LLM call may start; False means take the degraded path"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self._opened_at >= self.open_s:
+                self._transition(HALF_OPEN, now)
+            if self.state == CLOSED:
+                return True
+            # One probe at a time; a probe that never reports back expires
+            if self.state == HALF_OPEN and (
+                    self._probe_started is None or now - self._probe_started > self.slow_call_s):
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == OPEN
+
+    def record_success(self, seconds: float) -> None:
+        self._record(False, seconds >= self.slow_call_s)
+
+    def record_failure(self, error: BaseException) -> None:
+        if is_rate_limited(error):
+            return
+        self.last_error = f"{type(error).__name__}: {error}"
+        self._record(True, False)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, failure, _ in self._outcomes if failure)
+            slow = sum(1 for _, _, slow in self._outcomes if slow)
+            return {
+                'state': self.state,
+                'window_calls': calls,
+                'failure_rate': failures / calls if calls else 0.0,
+                'slow_call_rate': slow / calls if calls else 0.0,
+                'open_for_s': round(self.open_s, 1),
+                'retry_in_s': round(max(0.0, self._opened_at + self.open_s - now), 1)
+                if self.state == OPEN else 0.0,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+            }
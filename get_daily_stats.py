@@ -2,84 +2,42 @@
 Generate daily statistics for WhatsApp reporting
 """
 import json
-import os
-from datetime import datetime, timedelta
-from llm_moderation_agent import ModerationAgent
+import sys
+from group_config import find_group, groups_or_default
+from moderation_storage import ModerationStorage
 
-def get_daily_statistics():
-    """Get comprehensive daily statistics"""
+def get_daily_statistics(group_id=None):
+    """Get comprehensive daily statistics (of one group when groups.json lists several)"""
     
     try:
-        groq_api_key = os.getenv('GROQ_API_KEY', 'dummy')
-        agent = ModerationAgent(
-            groq_api_key=groq_api_key,
-            db_path="whatsapp_moderation.db"
-        )
+        # Straight from SQLite - the LLM stack is never imported here
+        storage = ModerationStorage(find_group(groups_or_default(), group_id).db_path)
+        storage.setup_schema()
         
         # Get basic stats
-        stats = agent.get_stats()
+        stats = storage.summary_stats()
         
-        # Calculate daily specific metrics
-        today = datetime.now().date()
-        
-        # Get today's messages from database
-        import sqlite3
-        conn = sqlite3.connect("whatsapp_moderation.db")
-        cursor = conn.cursor()
-        
-        # Today's messages
-        cursor.execute("""
-            SELECT classification, action 
-            FROM messages 
-            WHERE date(timestamp) = date('now')
-        """)
-        
-        today_results = cursor.fetchall()
-        
-        # Count by category
-        approved = sum(1 for r in today_results if r[0] == 'APPROVED')
-        flagged = sum(1 for r in today_results if r[0] == 'CONTEXT_DEPENDENT')
-        deleted = sum(1 for r in today_results if r[1] == 'DELETE_MESSAGE')
+        # Today's counts come from the daily rollup table
+        today = storage.daily_summary(days_ago=0)
         
         # Calculate improvement (week over week accuracy)
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_feedback,
-                SUM(CASE WHEN feedback = 'CORRECT' THEN 1 ELSE 0 END) as correct
-            FROM messages 
-            WHERE date(timestamp) = date('now') 
-            AND feedback IS NOT NULL
-        """)
-        
-        today_feedback = cursor.fetchone()
         today_accuracy = 0
-        if today_feedback and today_feedback[0] > 0:
-            today_accuracy = (today_feedback[1] / today_feedback[0]) * 100
+        if today['feedback_total'] > 0:
+            today_accuracy = (today['feedback_correct'] / today['feedback_total']) * 100
         
         # Week ago accuracy
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_feedback,
-                SUM(CASE WHEN feedback = 'CORRECT' THEN 1 ELSE 0 END) as correct
-            FROM messages 
-            WHERE date(timestamp) = date('now', '-7 days')
-            AND feedback IS NOT NULL
-        """)
-        
-        week_ago_feedback = cursor.fetchone()
+        week_total, week_correct = storage.daily_feedback_totals(days_ago=7)
         week_ago_accuracy = 0
-        if week_ago_feedback and week_ago_feedback[0] > 0:
-            week_ago_accuracy = (week_ago_feedback[1] / week_ago_feedback[0]) * 100
+        if week_total > 0:
+            week_ago_accuracy = (week_correct / week_total) * 100
         
         improvement = today_accuracy - week_ago_accuracy
         
-        conn.close()
-        
         daily_stats = {
-            "daily_messages": len(today_results),
-            "approved": approved,
-            "flagged": flagged,
-            "deleted": deleted,
+            "daily_messages": today['messages'],
+            "approved": today['approved'],
+            "flagged": today['flagged'],
+            "deleted": today['deleted'],
             "accuracy": round(stats.get('accuracy', 0), 1),
             "improvement": round(improvement, 1),
             "total_messages_processed": stats.get('total_messages', 0)
@@ -101,7 +59,7 @@ def get_daily_statistics():
 def main():
     """Main function for command line usage"""
     try:
-        stats = get_daily_statistics()
+        stats = get_daily_statistics(sys.argv[1] if len(sys.argv) > 1 else None)
         print(json.dumps(stats, ensure_ascii=False))
     except Exception as e:
         error_stats = {
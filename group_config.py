@@ -0,0 +1,143 @@
+"""
+Per-group moderation settings.
+
+One process can moderate several WhatsApp groups. Each group is described
+in a JSON file (groups.json, read by the bot and the Python side alike):
+
+    {"groups": [
+        {"id": "orot-barzel", "name": "אורות ברזל התנדבויות ועזרה",
+         "db": "whatsapp_moderation.db"},
+        {"id": "north", "name": "מתנדבים צפון", "prompt_version": "v1",
+         "group_rules": "...", "delete_confidence": 0.9,
+         "volunteer_names": ["דנה"], "weight": 2}
+    ]}
+
+"name" is matched against the WhatsApp group name by the bot. Every group
+gets its own database file (moderation_<id>.db unless "db" is given), so
+history, feedback, the local classifier and retention stay per group.
+Rules text, prompt variant, golden-rule keywords, the auto-delete
+threshold and the group's share of the LLM quota ("weight") are optional.
+Without a groups file there is a single group, "default".
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from moderation_prompts import DEFAULT_PROMPT_VERSION, load_prompt_config
+from rule_engine import DEFAULT_KEYWORDS, RuleEngine
+
+DEFAULT_GROUPS_FILE = "groups.json"
+DEFAULT_GROUP_ID = "default"
+DEFAULT_DB_PATH = "whatsapp_moderation.db"
+
+_GROUP_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class GroupConfig:
+    """Rules, thresholds, prompt variant and database of one group"""
+
+    def __init__(self, group_id: str, name: str = "", db_path: Optional[str] = None,
+                 prompt_version: str = DEFAULT_PROMPT_VERSION, prompt_file: Optional[str] = None,
+                 group_rules: Optional[str] = None, delete_confidence: Optional[float] = None,
+                 use_rules: bool = True, keywords: Optional[Dict[str, List[str]]] = None,
+                 volunteer_names: Optional[List[str]] = None, weight: float = 1.0):
+        if not _GROUP_ID_RE.match(group_id or ""):
+            raise ValueError(f"Invalid group id: {group_id!r} (letters, digits, - and _)")
+        if weight <= 0:
+            raise ValueError(f"Group {group_id}: weight must be positive")
+        if delete_confidence is not None and not 0 <= delete_confidence <= 1:
+            raise ValueError(f"Group {group_id}: delete_confidence must be between 0 and 1")
+
+        self.group_id = group_id
+        self.name = name
+        self.db_path = db_path or f"moderation_{group_id}.db"
+        self.prompt_version = prompt_version
+        self.prompt_file = prompt_file
+        self.group_rules = group_rules
+        # None keeps the agent's default
+        self.delete_confidence = delete_confidence
+        self.use_rules = use_rules
+        # Extra keywords per rule-engine category, added to the defaults
+        self.keywords = keywords or {}
+        self.volunteer_names = volunteer_names
+        self.weight = float(weight)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GroupConfig":
+        """Group from its groups.json entry"""
+        if not isinstance(data, dict) or "id" not in data:
+            raise ValueError("Each group needs an \"id\"")
+        return cls(
+            str(data["id"]), name=data.get("name", ""), db_path=data.get("db"),
+            prompt_version=data.get("prompt_version", DEFAULT_PROMPT_VERSION),
+            prompt_file=data.get("prompt_file"), group_rules=data.get("group_rules"),
+            delete_confidence=data.get("delete_confidence"),
+            use_rules=bool(data.get("use_rules", True)), keywords=data.get("keywords"),
+            volunteer_names=data.get("volunteer_names"), weight=float(data.get("weight", 1.0)),
+        )
+
+    def prompt_config(self) -> Dict:
+        """Prompt artifacts with the group's rules text"""
+        config = load_prompt_config(self.prompt_version, self.prompt_file)
+        if self.group_rules:
+            config["group_rules"] = self.group_rules
+            config["include_group_rules"] = True
+        return config
+
+    def policy_key(self) -> str:
+        """Groups with the same key get the same LLM verdict for the same text"""
+        data = json.dumps(self.prompt_config(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+    def rule_engine(self) -> RuleEngine:
+        keywords = {category: list(words) for category, words in DEFAULT_KEYWORDS.items()}
+        for category, words in self.keywords.items():
+            keywords.setdefault(category, []).extend(words)
+        return RuleEngine(keywords, self.volunteer_names)
+
+
+def load_groups(path: str) -> List[GroupConfig]:
+    """Groups from a groups.json file; raises ValueError on bad content"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("groups") if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: expected a non-empty \"groups\" list")
+
+    groups = [GroupConfig.from_dict(entry) for entry in entries]
+    seen_ids, seen_dbs = set(), set()
+    for group in groups:
+        db = os.path.abspath(group.db_path)
+        if group.group_id in seen_ids:
+            raise ValueError(f"{path}: duplicate group id {group.group_id}")
+        if db in seen_dbs:
+            raise ValueError(f"{path}: groups must not share a database ({group.db_path})")
+        seen_ids.add(group.group_id)
+        seen_dbs.add(db)
+    return groups
+
+
+def groups_or_default(path: Optional[str] = DEFAULT_GROUPS_FILE,
+                      db_path: str = DEFAULT_DB_PATH) -> List[GroupConfig]:
+    """Groups from path if it exists, else the single default group on db_path"""
+    if path and os.path.exists(path):
+        return load_groups(path)
+    return [GroupConfig(DEFAULT_GROUP_ID, db_path=db_path)]
+
+
+def verdict_cache_db(groups: List[GroupConfig], group: GroupConfig) -> str:
+    """Database of the verdict cache a group shares with groups using the same prompt"""
+    key = group.policy_key()
+    return next(g.db_path for g in groups if g.policy_key() == key)
+
+
+def find_group(groups: List[GroupConfig], group_id: Optional[str]) -> GroupConfig:
+    """Group by id; the first group when group_id is empty"""
+    if not group_id:
+        return groups[0]
+    for group in groups:
+        if group.group_id == group_id:
+            return group
+    raise ValueError(f"Unknown group: {group_id}")
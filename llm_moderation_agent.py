@@ -1,17 +1,47 @@
 import os
 import json
-import sqlite3
+import asyncio
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Dict, List, Optional, TypedDict
+from typing import Dict, List, Optional, Tuple, TypedDict
 
-# LangGraph imports
-from langgraph.graph import StateGraph, END
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+# LangGraph/LangChain are imported where they are used, so importing this
+# module (or the storage, stats and feedback modules) stays cheap
+
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from llm_scheduler import (
+    DEFAULT_DEADLINE_S, DEFAULT_REQUESTS_PER_MINUTE, PRIORITY_LOW, DeadlineExceeded, LLMScheduler,
+    message_priority
+)
+from local_classifier import LocalClassifier
+from message_envelope import (
+    describe_envelope, describe_quoted, is_media, media_verdict, message_text, parse_envelope
+)
+from micro_batcher import DEFAULT_WINDOW_MS, MicroBatcher
+from moderation_feedback import FeedbackProcessor
+from moderation_metrics import ModerationMetrics
+from moderation_prompts import (
+    DEFAULT_PROMPT_VERSION, CompiledPrompt, TokenUsageTracker, estimate_tokens, extract_usage,
+    load_prompt_config
+)
+from moderation_storage import ModerationStorage, get_storage
+from near_duplicate import RISK_SIGNALS, NearDuplicateIndex
+from reanalysis_worker import ReanalysisFailed
+from rule_engine import RuleEngine
+from stream_parser import IncrementalJsonParser, parse_json_fields
+from user_history import UserHistoryCache
+from verdict_cache import VerdictCache
+from write_behind import WriteBehindWriter
 
 from typing import TypedDict
 
+DEFAULT_LLM_TIMEOUT_S = 10.0
+DEGRADED_PREFIX = "מצב מוגבל (LLM לא זמין)"
+CLASSIFICATIONS = ('APPROVED', 'CLEAR_VIOLATION', 'CONTEXT_DEPENDENT')
+# A CLEAR_VIOLATION above this confidence is deleted automatically
+DELETE_CONFIDENCE = 0.8
+
 class ModerationState(TypedDict):
     """State for LangGraph workflow"""
     message_id: str
@@ -28,192 +58,725 @@ class ModerationState(TypedDict):
     # Context
     user_history: List[Dict] 
     group_rules: str
+    
+    # Wait for the database commit before returning (write-behind mode)
+    durable: bool
+    
+    # time.monotonic() by which the verdict is needed (0 = no deadline)
+    deadline: float
+    
+    # Prompt/completion size of the LLM call, if one was made
+    usage: Dict
+    
+    # Which tier produced the verdict
+    # ("rules", "media", "cache", "near_duplicate", "local", "llm", "llm_error" or "degraded")
+    verdict_source: str
+    
+    # Second look at a stored message (🔄 or bulk re-moderation), admin's hint for the LLM
+    reanalysis: bool
+    admin_hint: str
+    
+    # Message type, media metadata, forwarded flag, quoted message (see message_envelope)
+    envelope: Dict
+    # Prompt lines describing the envelope and the quoted message
+    message_context: str
 
 class ModerationAgent:
     """LLM-based moderation agent"""
     
-    def __init__(self, groq_api_key: str, db_path: str = "moderation.db"):
-        self.llm = ChatGroq(
-            groq_api_key=groq_api_key,
-            model_name="llama3-8b-8192",
-            temperature=0.1
-        )
+    def __init__(self, groq_api_key: str, db_path: str = "moderation.db",
+                 rule_engine: Optional[RuleEngine] = None, use_rules: bool = True,
+                 verdict_cache: Optional[VerdictCache] = None, use_cache: bool = True,
+                 write_behind: bool = False, write_batch_size: int = 100,
+                 write_flush_interval_ms: float = 200,
+                 prompt_version: str = DEFAULT_PROMPT_VERSION, prompt_path: Optional[str] = None,
+                 storage: Optional[ModerationStorage] = None,
+                 metrics: Optional[ModerationMetrics] = None,
+                 local_classifier: Optional[LocalClassifier] = None,
+                 use_local_classifier: bool = True, persist_local_classifier: bool = True,
+                 near_duplicates: Optional[NearDuplicateIndex] = None,
+                 use_near_duplicates: bool = True,
+                 llm_scheduler: Optional[LLMScheduler] = None, use_scheduler: bool = True,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: Optional[float] = None,
+                 deadline_s: Optional[float] = DEFAULT_DEADLINE_S,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 use_circuit_breaker: bool = True,
+                 llm_timeout_s: Optional[float] = DEFAULT_LLM_TIMEOUT_S,
+                 micro_batch_size: int = 1,
+                 micro_batch_window_ms: float = DEFAULT_WINDOW_MS,
+                 streaming: bool = False, llm=None, prompt: Optional[CompiledPrompt] = None,
+                 delete_confidence: float = DELETE_CONFIDENCE, group_id: Optional[str] = None):
+        from langchain_core.output_parsers import JsonOutputParser
+        
+        # Groups moderated by one process share a single client
+        if llm is None:
+            from langchain_groq import ChatGroq
+            llm = ChatGroq(
+                groq_api_key=groq_api_key,
+                model_name="llama3-8b-8192",
+                temperature=0.1,
+                request_timeout=llm_timeout_s,
+                # The scheduler and breaker own retries (Retry-After, deadline, failure counts)
+                max_retries=0
+            )
+        self.llm = llm
+        self.group_id = group_id
         self.db_path = db_path
+        self.storage: ModerationStorage = storage or get_storage(db_path)
         self.parser = JsonOutputParser()
+        self.prompt = prompt or CompiledPrompt(load_prompt_config(prompt_version, prompt_path))
+        self.delete_confidence = delete_confidence
+        self.token_usage = TokenUsageTracker(self.prompt)
+        self.metrics = metrics or ModerationMetrics()
+        # Signals are also used for LLM priority and near-duplicate checks
+        self.signal_engine = rule_engine or RuleEngine()
+        self.rule_engine = self.signal_engine if use_rules else None
         self.setup_database()
+        self.verdict_cache = (verdict_cache or VerdictCache(self.storage)) if use_cache else None
+        self.near_duplicates = (near_duplicates or NearDuplicateIndex(
+            self.storage, rule_engine=self.signal_engine)) if use_near_duplicates else None
+        self.local_classifier = (
+            local_classifier or LocalClassifier(self.storage, persist=persist_local_classifier)
+        ) if use_local_classifier else None
+        self.user_history = UserHistoryCache(self.storage)
+        self.scheduler = (llm_scheduler or LLMScheduler(
+            requests_per_minute, tokens_per_minute, metrics=self.metrics)) if use_scheduler else None
+        # A scheduler passed in is shared with other agents and closed by its owner
+        self._owns_scheduler = llm_scheduler is None
+        self.deadline_s = deadline_s
+        self.breaker = (circuit_breaker or CircuitBreaker(
+            metrics=self.metrics)) if use_circuit_breaker else None
+        # Parse the completion while it streams and stop once a deletion is certain
+        self.streaming = streaming
+        # Messages reaching the LLM together share one call (off with size 1)
+        self.batcher = MicroBatcher(
+            self._analyze_batch, micro_batch_size, micro_batch_window_ms
+        ) if micro_batch_size > 1 else None
+        self.writer = WriteBehindWriter(
+            self.storage, batch_size=write_batch_size,
+            flush_interval_ms=write_flush_interval_ms
+        ) if write_behind else None
+        self.feedback = FeedbackProcessor(
+            self.storage, verdict_cache=self.verdict_cache, near_duplicates=self.near_duplicates,
+            local_classifier=self.local_classifier, user_history=self.user_history,
+            writer=self.writer
+        )
         self.workflow = self._build_workflow()
+        self.reanalysis_workflow = self._build_reanalysis_workflow()
+        self.rescore_workflow = self._build_rescore_workflow()
     
     def setup_database(self):
         """Setup database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id TEXT PRIMARY KEY,
-                user_id TEXT,
-                content TEXT,
-                timestamp TEXT,
-                classification TEXT,
-                confidence REAL,
-                reasoning TEXT,
-                action TEXT,
-                feedback TEXT
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
+        self.storage.setup_schema()
     
-    def _build_workflow(self) -> StateGraph:
+    def _build_workflow(self) -> "StateGraph":
         """Build LangGraph workflow"""
+        from langgraph.graph import StateGraph, END
         
         workflow = StateGraph(ModerationState)
         
-        # 3-node workflow
-        workflow.add_node("get_context", self._get_context_node)
-        workflow.add_node("llm_analyze", self._llm_analyze_node)
-        workflow.add_node("make_decision", self._make_decision_node)
+        # Each node has a sync and an async implementation,
+        # invoke() runs the former and ainvoke() the latter
+        workflow.add_node("rule_check", self._timed_node(
+            "rule_check", self._rule_check_node, self._arule_check_node))
+        workflow.add_node("cache_lookup", self._timed_node(
+            "cache_lookup", self._cache_lookup_node, self._acache_lookup_node))
+        workflow.add_node("near_duplicate", self._timed_node(
+            "near_duplicate", self._near_duplicate_node, self._anear_duplicate_node))
+        workflow.add_node("local_classify", self._timed_node(
+            "local_classify", self._local_classify_node, self._alocal_classify_node))
+        workflow.add_node("get_context", self._timed_node(
+            "get_context", self._get_context_node, self._aget_context_node))
+        workflow.add_node("llm_analyze", self._timed_node(
+            "llm_analyze", self._llm_analyze_node, self._allm_analyze_node))
+        workflow.add_node("make_decision", self._timed_node(
+            "make_decision", self._make_decision_node, self._amake_decision_node))
         
-        # Linear flow
-        workflow.set_entry_point("get_context")
+        # Rules, exact and near-duplicate verdict reuse, then the local classifier -
+        # any of them skips context and LLM
+        workflow.set_entry_point("rule_check")
+        workflow.add_conditional_edges("rule_check", self._route_after_rules, {
+            "make_decision": "make_decision",
+            "cache_lookup": "cache_lookup",
+        })
+        workflow.add_conditional_edges("cache_lookup", self._route_after_cache, {
+            "make_decision": "make_decision",
+            "near_duplicate": "near_duplicate",
+        })
+        workflow.add_conditional_edges("near_duplicate", self._route_after_near_duplicate, {
+            "make_decision": "make_decision",
+            "local_classify": "local_classify",
+        })
+        workflow.add_conditional_edges("local_classify", self._route_after_local, {
+            "make_decision": "make_decision",
+            "get_context": "get_context",
+        })
         workflow.add_edge("get_context", "llm_analyze")
         workflow.add_edge("llm_analyze", "make_decision")
         workflow.add_edge("make_decision", END)
         
         return workflow.compile()
     
-    def _get_context_node(self, state: ModerationState) -> ModerationState:
-        """Get user context and group rules"""
+    def _build_reanalysis_workflow(self) -> "StateGraph":
+        """Straight to the LLM - the earlier tiers would repeat the disputed verdict"""
+        from langgraph.graph import StateGraph, END
+        
+        workflow = StateGraph(ModerationState)
+        workflow.add_node("get_context", self._timed_node(
+            "get_context", self._get_context_node, self._aget_context_node))
+        workflow.add_node("llm_analyze", self._timed_node(
+            "llm_analyze", self._llm_analyze_node, self._allm_analyze_node))
+        workflow.add_node("make_decision", self._timed_node(
+            "make_decision", self._make_decision_node, self._amake_decision_node))
+        
+        # Only a real LLM verdict replaces the stored one; anything else is retried
+        workflow.set_entry_point("get_context")
+        workflow.add_edge("get_context", "llm_analyze")
+        workflow.add_conditional_edges("llm_analyze", self._route_after_reanalysis, {
+            "make_decision": "make_decision",
+            "end": END,
+        })
+        workflow.add_edge("make_decision", END)
+        
+        return workflow.compile()
+    
+    def _build_rescore_workflow(self) -> "StateGraph":
+        """Rules, then the LLM; decides without saving or touching the tiers"""
+        from langgraph.graph import StateGraph, END
+        
+        workflow = StateGraph(ModerationState)
+        workflow.add_node("rule_check", self._timed_node(
+            "rule_check", self._rule_check_node, self._arule_check_node))
+        workflow.add_node("get_context", self._timed_node(
+            "get_context", self._get_context_node, self._aget_context_node))
+        workflow.add_node("llm_analyze", self._timed_node(
+            "llm_analyze", self._llm_analyze_node, self._allm_analyze_node))
+        workflow.add_node("decide", self._timed_node(
+            "decide", self._decide_node, self._adecide_node))
+        
+        # Cache, near-duplicate and local verdicts would only repeat the old prompt's answers
+        workflow.set_entry_point("rule_check")
+        workflow.add_conditional_edges("rule_check", self._route_after_rules, {
+            "make_decision": "decide",
+            "cache_lookup": "get_context",
+        })
+        workflow.add_edge("get_context", "llm_analyze")
+        workflow.add_edge("llm_analyze", "decide")
+        workflow.add_edge("decide", END)
+        
+        return workflow.compile()
+    
+    def _route_after_reanalysis(self, state: ModerationState) -> str:
+        """Keep the stored verdict when the LLM gave no answer"""
+        return "make_decision" if state["verdict_source"] == 'llm' else "end"
+    
+    def _timed_node(self, name: str, func, afunc) -> "RunnableLambda":
+        """Node runnable that records its wall-clock time in the metrics"""
+        from langchain_core.runnables import RunnableLambda
+        
+        def run(state: ModerationState) -> ModerationState:
+            start = time.perf_counter()
+            try:
+                return func(state)
+            finally:
+                self.metrics.observe_node(name, time.perf_counter() - start)
+        
+        async def arun(state: ModerationState) -> ModerationState:
+            start = time.perf_counter()
+            try:
+                return await afunc(state)
+            finally:
+                self.metrics.observe_node(name, time.perf_counter() - start)
+        
+        return RunnableLambda(run, afunc=arun, name=name)
+    
+    def _rule_check_node(self, state: ModerationState) -> ModerationState:
+        """Deterministic golden rules - final verdict when certain"""
         
-        # Get user history
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Media without a caption has no text for any tier to read
+        verdict = media_verdict(state["envelope"]) if state["envelope"] else None
+        if verdict:
+            state["classification"] = verdict['classification']
+            state["confidence"] = verdict['confidence']
+            state["reasoning"] = verdict['reasoning']
+            state["verdict_source"] = 'media'
+            return state
         
-        cursor.execute("""
-            SELECT classification, reasoning, feedback
-            FROM messages 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 5
-        """, (state["user_id"],))
+        if self.rule_engine is None:
+            return state
         
-        history = []
-        for row in cursor.fetchall():
-            history.append({
-                'classification': row[0],
-                'reasoning': row[1],
-                'feedback': row[2]
-            })
+        verdict = self.rule_engine.evaluate(state["content"])
+        self.metrics.count_rule_check(bool(verdict))
+        if verdict:
+            state["classification"] = verdict['classification']
+            state["confidence"] = verdict['confidence']
+            state["reasoning"] = verdict['reasoning']
+            state["verdict_source"] = 'rules'
+        
+        return state
+    
+    async def _arule_check_node(self, state: ModerationState) -> ModerationState:
+        """Async rule_check - CPU only, runs inline"""
+        return self._rule_check_node(state)
+    
+    def _route_after_rules(self, state: ModerationState) -> str:
+        """Skip the LLM when a rule already decided"""
+        return "make_decision" if state["verdict_source"] in ('rules', 'media') else "cache_lookup"
+    
+    def _cache_lookup_node(self, state: ModerationState) -> ModerationState:
+        """Reuse the verdict of an identical earlier message"""
+        
+        if self.verdict_cache is None:
+            return state
+        
+        cached = self.verdict_cache.get(state["content"])
+        self.metrics.count_cache_lookup(bool(cached))
+        if cached:
+            state["classification"] = cached['classification']
+            state["confidence"] = cached['confidence']
+            state["reasoning"] = cached['reasoning']
+            state["verdict_source"] = 'cache'
+        
+        return state
+    
+    async def _acache_lookup_node(self, state: ModerationState) -> ModerationState:
+        """Async cache_lookup - database read runs off the event loop"""
+        return await asyncio.to_thread(self._cache_lookup_node, state)
+    
+    def _route_after_cache(self, state: ModerationState) -> str:
+        """Skip the LLM on a cache hit"""
+        return "make_decision" if state["verdict_source"] == 'cache' else "near_duplicate"
+    
+    def _near_duplicate_node(self, state: ModerationState) -> ModerationState:
+        """Reuse the confirmed verdict of a lightly edited repost"""
         
-        conn.close()
+        if self.near_duplicates is None:
+            return state
+        
+        match = self.near_duplicates.lookup(state["content"])
+        self.metrics.count_near_duplicate(bool(match))
+        if match:
+            state["classification"] = match['classification']
+            state["confidence"] = match['confidence']
+            state["reasoning"] = (f"{match['reasoning']} "
+                                  f"(דומה להודעה {match['message_id']}, {match['similarity']:.2f})")
+            state["verdict_source"] = 'near_duplicate'
+        
+        return state
+    
+    async def _anear_duplicate_node(self, state: ModerationState) -> ModerationState:
+        """Async near_duplicate - in-memory index, runs inline"""
+        return self._near_duplicate_node(state)
+    
+    def _route_after_near_duplicate(self, state: ModerationState) -> str:
+        """Skip the LLM when a near-duplicate was reused"""
+        return "make_decision" if state["verdict_source"] == 'near_duplicate' else "local_classify"
+    
+    def _local_classify_node(self, state: ModerationState) -> ModerationState:
+        """Feedback-trained local classifier - approves, or escalates"""
+        
+        if self.local_classifier is None:
+            return state
+        
+        verdict = self.local_classifier.classify(state["content"])
+        # Only approvals are final here - flagging or deleting needs the LLM
+        if verdict and verdict['classification'] != 'APPROVED':
+            verdict = None
+        self.metrics.count_local_check(bool(verdict))
+        if verdict:
+            state["classification"] = verdict['classification']
+            state["confidence"] = verdict['confidence']
+            state["reasoning"] = verdict['reasoning']
+            state["verdict_source"] = 'local'
+        
+        return state
+    
+    async def _alocal_classify_node(self, state: ModerationState) -> ModerationState:
+        """Async local_classify - CPU only, runs inline"""
+        return self._local_classify_node(state)
+    
+    def _route_after_local(self, state: ModerationState) -> str:
+        """Skip the LLM on a confident local verdict"""
+        return "make_decision" if state["verdict_source"] == 'local' else "get_context"
+    
+    def _get_context_node(self, state: ModerationState) -> ModerationState:
+        """Get user context and group rules"""
+        
+        # Get user history (memory ring buffer, loaded from the database once per user)
+        history = self.user_history.get(state["user_id"])
         
         state["user_history"] = history
-        state["group_rules"] = """
-תקנון קבוצת אורות ברזל:
-1. אין לפרסם מספרי טלפון של חיילים בשטח
-2. אין לפרסם מיקומים מדויקים או קואורדינטות
-3. אין לפרסם מספרי יחידות עם פרטים מבצעיים
-4. שימוש בשפה נאותה
-5. בדיקת בקשות תרומה לפני מתן כסף
-6. זהירות עם תוכן מדיה מהשטח
-"""
+        state["group_rules"] = self.prompt.group_rules
+        
+        # Message form and the message it replies to
+        if state["envelope"]:
+            quoted_id = state["envelope"]['quoted_message_id']
+            quoted = self.storage.get_message(quoted_id) if quoted_id else None
+            state["message_context"] = "\n".join(line for line in (
+                describe_envelope(state["envelope"]), describe_quoted(quoted)) if line)
         
         return state
     
-    def _llm_analyze_node(self, state: ModerationState) -> ModerationState:
-        """Main LLM analysis"""
+    async def _aget_context_node(self, state: ModerationState) -> ModerationState:
+        """Async get_context - database read runs off the event loop"""
+        return await asyncio.to_thread(self._get_context_node, state)
+    
+    def _build_prompt_messages(self, state: ModerationState) -> List:
+        """Build LLM input messages from the precompiled prompt"""
         
-        # Create dynamic prompt
-        prompt = ChatPromptTemplate.from_template("""
-אתה סוכן חמ"ל לקבוצת התנדבות "אורות ברזל".
-
-כללי הזהב:
-
-1. מספר טלפון + שם אישי (לימור, עומרי, יפה) = מתנדב = APPROVED
-2. "כפר עזה" = יישוב בישראל = APPROVED  
-3. "עזה" בלבד = מעורפל = CONTEXT_DEPENDENT
-4. קואורדינטות GPS = CLEAR_VIOLATION
-5. בקשת עזרה לגיטימית = APPROVED
-
-דוגמאות:
-
-✅ APPROVED:
-"מחפשת 100 כריכים - לימור 052-1234567" → טלפון מתנדב לימור
-"15 לוחמים בכפר עזה צריכים ציוד - עומרי 058-1234567" → כפר עזה בטוח + עומרי מתנדב
-"תודה לכל המתנדבים!"
-
-⚠️ CONTEXT_DEPENDENT:  
-"חיילים בעזה צריכים עזרה" → איזה עזה? רצועה או כפר?
-
-🚫 CLEAR_VIOLATION - מחק מיד:
-"גדוד 202 בקואורדינטות 31.5°N - טלפון מפקד 050-1234567" → קואורדינטות GPS + מספר גדוד = מסוכן מאוד!
-"חיילי יחידה 8200 במשימה בשעה 06:00" → פרטי משימה
-
-חשוב: קואורדינטות GPS (°N, °E) + מספר גדוד = תמיד CLEAR_VIOLATION!
-
-חשוב: 
-- שם אישי + טלפון = מתנדב = בסדר!
-- כפר עזה = מקום בישראל = בסדר!
-
-הודעה לבדיקה: "{message_content}"
-
-JSON בלבד:
-{{
-  "classification": "APPROVED או CONTEXT_DEPENDENT או CLEAR_VIOLATION", 
-  "confidence": 0.0-1.0,
-  "reasoning": "הסבר קצר"
-}}""")
+        history_text = ""
+        if self.prompt.include_history and state["user_history"]:
+            history_items = [h['classification'] for h in state["user_history"][-2:] if h['classification']]
+            if history_items:
+                history_text = "היסטוריה: " + ", ".join(history_items)
         
-        try:
-            # Format user history
-            history_text = ""
-            if state["user_history"]:
-                history_items = []
-                for h in state["user_history"][-2:]:  
-                    if h['classification']:
-                        history_items.append(f"{h['classification']}")
-                if history_items:
-                    history_text = "היסטוריה: " + ", ".join(history_items)
-                else:
-                    history_text = ""
-            else:
-                history_text = ""
-            
-            # Get response
-            response = self.llm.invoke(prompt.format_messages(
-                group_rules=state["group_rules"],
-                message_content=state["content"],
-                user_history=history_text
-            ))
-            
-            # Extract JSON from response
-            response_text = response.content
-            
-            # Find JSON in response
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
+        context = [state.get("message_context", "")]
+        if state.get("admin_hint"):
+            context.append(f'הערת מנהל לבדיקה חוזרת: "{state["admin_hint"]}"')
+        return self.prompt.format_messages(state["content"], history_text,
+                                           "\n".join(line for line in context if line))
+    
+    def _record_usage(self, state: ModerationState, messages: List, response) -> None:
+        """Measure prompt and completion size of one LLM call"""
+        prompt_text = "".join(str(m.content) for m in messages)
+        prompt_tokens, completion_tokens, estimated = extract_usage(response, prompt_text)
+        self.token_usage.record(prompt_tokens, completion_tokens, estimated)
+        state["usage"] = {
+            'prompt_version': self.prompt.version,
+            'prompt_chars': len(prompt_text),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated': estimated,
+        }
+    
+    def _apply_llm_response(self, state: ModerationState, response_text: str,
+                            fields: Optional[Dict] = None,
+                            stopped_early: bool = False) -> ModerationState:
+        """Parse LLM response text (or fields parsed while streaming) into the state"""
+        
+        with self.metrics.time_stage("parse"):
+            # First JSON object in the response, even if it is cut short
+            if fields is None:
+                fields = parse_json_fields(response_text)
             
-            if json_start != -1 and json_end > json_start:
-                json_text = response_text[json_start:json_end]
-                result = json.loads(json_text)
+            if fields.get('classification') in CLASSIFICATIONS:
+                result = fields
+                self.metrics.count_llm_response('early_stop' if stopped_early else 'json')
             else:
                 # Fallback parsing
                 result = self._fallback_parse(response_text)
-            
-            # Parse result
-            state["classification"] = result.get('classification', 'CONTEXT_DEPENDENT')
-            state["confidence"] = float(result.get('confidence', 0.5))
-            state["reasoning"] = result.get('reasoning', 'LLM analysis completed')
-            
-        except Exception as e:
-            # Fallback
+                self.metrics.count_llm_response('fallback')
+        
+        # Parse result
+        state["classification"] = result.get('classification', 'CONTEXT_DEPENDENT')
+        state["confidence"] = float(result.get('confidence', 0.5))
+        state["reasoning"] = result.get('reasoning') or (
+            f"הפרה ודאית - הניתוח הופסק מוקדם ({state['confidence']:.2f})" if stopped_early
+            else 'LLM analysis completed')
+        state["verdict_source"] = 'llm'
+        
+        return state
+    
+    def _apply_llm_error(self, state: ModerationState, error: Exception) -> ModerationState:
+        """Fallback verdict when the LLM call or parsing fails"""
+        self.metrics.count_llm_error(error)
+        state["classification"] = 'CONTEXT_DEPENDENT'
+        state["confidence"] = 0.3
+        state["reasoning"] = f"Error in analysis: {str(error)}"
+        state["verdict_source"] = 'llm_error'
+        return state
+    
+    def _llm_call_options(self, state: ModerationState, messages: List) -> Dict:
+        """Scheduler priority, deadline and token cost of one LLM call"""
+        # Re-analysis runs in the background - live messages go first
+        priority = PRIORITY_LOW if state.get("reanalysis") else \
+            message_priority(self.signal_engine.signals(state["content"]))
+        return {
+            'priority': priority,
+            'deadline': state.get("deadline") or None,
+            'cost': estimate_tokens("".join(str(m.content) for m in messages)),
+            'tenant': self.group_id,
+        }
+    
+    def _check_breaker(self) -> None:
+        """Stop retrying once the breaker has opened"""
+        if self.breaker is not None and self.breaker.is_open():
+            raise CircuitOpen("LLM circuit breaker is open")
+    
+    def _record_outcome(self, seconds: float, error: Optional[Exception]) -> None:
+        """Report one LLM call to the metrics and the circuit breaker"""
+        self.metrics.observe_llm(seconds)
+        if self.breaker is not None:
+            if error is None:
+                self.breaker.record_success(seconds)
+            else:
+                self.breaker.record_failure(error)
+    
+    def _batch_call_options(self, states: List[ModerationState], messages: List) -> Dict:
+        """A batch runs at its most urgent member's priority and deadline"""
+        deadlines = [s["deadline"] for s in states if s.get("deadline")]
+        return {
+            'priority': min(message_priority(self.signal_engine.signals(s["content"]))
+                            for s in states),
+            'deadline': min(deadlines) if deadlines else None,
+            'cost': estimate_tokens("".join(str(m.content) for m in messages)),
+            'tenant': self.group_id,
+        }
+    
+    def _certain_violation(self, fields: Dict) -> bool:
+        """The verdict already means deletion - the rest of the output cannot change it"""
+        confidence = fields.get('confidence')
+        return fields.get('classification') == 'CLEAR_VIOLATION' \
+            and isinstance(confidence, (int, float)) and confidence > self.delete_confidence
+    
+    def _feed_stream(self, parser: IncrementalJsonParser, chunk, start: float) -> bool:
+        """Parse one streamed chunk; True when generation can stop"""
+        had_verdict = 'confidence' in parser.fields
+        parser.feed(chunk.content if isinstance(chunk.content, str) else "")
+        if not had_verdict and 'confidence' in parser.fields:
+            self.metrics.observe_stage("llm_first_verdict", time.perf_counter() - start)
+        return self._certain_violation(parser.fields)
+    
+    def _stream_llm(self, messages: List) -> Tuple:
+        """(response, parser, stopped early) from a streamed completion"""
+        from langchain_core.messages import AIMessageChunk
+        
+        parser = IncrementalJsonParser()
+        response = AIMessageChunk(content="")
+        start = time.perf_counter()
+        stream = self.llm.stream(messages)
+        try:
+            for chunk in stream:
+                response = response + chunk
+                if self._feed_stream(parser, chunk, start):
+                    return response, parser, True
+        finally:
+            stream.close()  # Closing the stream ends generation
+        parser.finish()
+        return response, parser, False
+    
+    async def _astream_llm(self, messages: List) -> Tuple:
+        """Async _stream_llm"""
+        from langchain_core.messages import AIMessageChunk
+        
+        parser = IncrementalJsonParser()
+        response = AIMessageChunk(content="")
+        start = time.perf_counter()
+        stream = self.llm.astream(messages)
+        try:
+            async for chunk in stream:
+                response = response + chunk
+                if self._feed_stream(parser, chunk, start):
+                    return response, parser, True
+        finally:
+            await stream.aclose()
+        parser.finish()
+        return response, parser, False
+    
+    def _invoke_llm(self, messages: List, stream: bool = False, **options):
+        """Timed LLM call, through the rate-limit scheduler when enabled.
+        
+        With stream=True returns (response, parser, stopped early).
+        """
+        
+        def call():
+            self._check_breaker()
+            start = time.perf_counter()
+            try:
+                response = self._stream_llm(messages) if stream else self.llm.invoke(messages)
+            except Exception as e:
+                self._record_outcome(time.perf_counter() - start, e)
+                raise
+            self._record_outcome(time.perf_counter() - start, None)
+            return response
+        
+        if self.scheduler is None:
+            return call()
+        return self.scheduler.call(call, **options)
+    
+    async def _ainvoke_llm(self, messages: List, stream: bool = False, **options):
+        """Async _invoke_llm"""
+        
+        async def call():
+            self._check_breaker()
+            start = time.perf_counter()
+            try:
+                response = await (self._astream_llm(messages) if stream
+                                  else self.llm.ainvoke(messages))
+            except Exception as e:
+                self._record_outcome(time.perf_counter() - start, e)
+                raise
+            self._record_outcome(time.perf_counter() - start, None)
+            return response
+        
+        if self.scheduler is None:
+            return await call()
+        return await self.scheduler.acall(call, **options)
+    
+    def _parse_batch_response(self, response_text: str, size: int) -> List[Optional[Dict]]:
+        """Per-message verdicts from a batch reply; None where an answer is missing"""
+        results: List[Optional[Dict]] = [None] * size
+        json_start = response_text.find('[')
+        json_end = response_text.rfind(']') + 1
+        if json_start == -1 or json_end <= json_start:
+            return results
+        try:
+            items = json.loads(response_text[json_start:json_end])
+        except ValueError:
+            return results
+        
+        for item in items if isinstance(items, list) else []:
+            try:
+                index = int(item['message_id']) - 1
+                result = {
+                    'classification': item['classification'],
+                    'confidence': float(item.get('confidence', 0.5)),
+                    'reasoning': item.get('reasoning', 'LLM analysis completed'),
+                }
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < size and result['classification'] in CLASSIFICATIONS:
+                results[index] = result
+        return results
+    
+    def _analyze_batch(self, states: List[ModerationState]) -> List[Optional[Dict]]:
+        """One LLM call for a micro-batch (runs on the batcher's threads)"""
+        messages = self.prompt.format_batch_messages([s["content"] for s in states])
+        response = self._invoke_llm(messages, **self._batch_call_options(states, messages))
+        self.metrics.count_llm_batch(len(states))
+        
+        with self.metrics.time_stage("parse"):
+            results = self._parse_batch_response(response.content, len(states))
+        
+        # Token cost is shared evenly between the messages of the batch
+        prompt_text = "".join(str(m.content) for m in messages)
+        prompt_tokens, completion_tokens, estimated = extract_usage(response, prompt_text)
+        self.token_usage.record(prompt_tokens, completion_tokens, estimated, messages=len(states))
+        usage = {
+            'prompt_version': self.prompt.version,
+            'prompt_chars': len(prompt_text) // len(states),
+            'prompt_tokens': prompt_tokens // len(states),
+            'completion_tokens': completion_tokens // len(states),
+            'estimated': estimated,
+            'batch_size': len(states),
+        }
+        for result in results:
+            self.metrics.count_llm_response('batch' if result else 'batch_missing')
+            if result:
+                result['usage'] = usage
+        return results
+    
+    def _batch_timeout(self, state: ModerationState) -> Optional[float]:
+        return max(0.0, state["deadline"] - time.monotonic()) if state.get("deadline") else None
+    
+    def _apply_batch_result(self, state: ModerationState, result: Dict) -> ModerationState:
+        state["classification"] = result['classification']
+        state["confidence"] = result['confidence']
+        state["reasoning"] = result['reasoning']
+        state["usage"] = dict(result['usage'])
+        state["verdict_source"] = 'llm'
+        return state
+    
+    def _apply_degraded(self, state: ModerationState, reason: str) -> ModerationState:
+        """Verdict without the LLM: rules signals and the local model's best guess.
+        
+        Only messages with risky signals go to admin review, the rest are
+        approved provisionally so an outage does not flood the admins.
+        """
+        self.metrics.count_degraded(reason)
+        content = state["content"]
+        risky = sorted(self.signal_engine.signals(content) & RISK_SIGNALS)
+        
+        guess, probability = None, 0.0
+        if self.local_classifier is not None \
+                and self.local_classifier.samples() >= self.local_classifier.min_samples:
+            guess, probability = self.local_classifier.predict(content)
+        
+        if risky:
             state["classification"] = 'CONTEXT_DEPENDENT'
             state["confidence"] = 0.3
-            state["reasoning"] = f"Error in analysis: {str(e)}"
-        
+            state["reasoning"] = (f"{DEGRADED_PREFIX}: סימנים רגישים ({', '.join(risky)}) - "
+                                  "נדרשת בדיקה ידנית")
+        elif guess in ('CLEAR_VIOLATION', 'CONTEXT_DEPENDENT') and probability >= 0.5:
+            state["classification"] = 'CONTEXT_DEPENDENT'
+            state["confidence"] = 0.3
+            state["reasoning"] = (f"{DEGRADED_PREFIX}: המסווג המקומי חושד ({probability:.2f}) - "
+                                  "נדרשת בדיקה ידנית")
+        else:
+            state["classification"] = 'APPROVED'
+            state["confidence"] = round(probability, 4) if guess == 'APPROVED' else 0.5
+            state["reasoning"] = f"{DEGRADED_PREFIX}: לא זוהו סימנים רגישים - אושר זמנית"
+        state["verdict_source"] = 'degraded'
         return state
     
+    def _llm_analyze_node(self, state: ModerationState) -> ModerationState:
+        """Main LLM analysis - degraded verdict while the breaker is open"""
+        
+        if self.breaker is not None and not self.breaker.allow():
+            return self._apply_degraded(state, 'circuit_open')
+        try:
+            # The batch prompt has no room for a hint or envelope context
+            if self.batcher is not None and not state.get("reanalysis") \
+                    and not state.get("message_context"):
+                future = self.batcher.submit(state)
+                try:
+                    result = future.result(self._batch_timeout(state))
+                except FutureTimeoutError:
+                    future.cancel()  # Dropped if its batch has not been sent yet
+                    raise DeadlineExceeded("Micro-batch did not finish before the deadline")
+                if result is not None:
+                    return self._apply_batch_result(state, result)
+                # Unanswered in the batch (or alone in it) - ask about this message by itself
+            
+            messages = self._build_prompt_messages(state)
+            options = self._llm_call_options(state, messages)
+            if self.streaming:
+                response, parser, stopped = self._invoke_llm(messages, stream=True, **options)
+                self._record_usage(state, messages, response)
+                return self._apply_llm_response(state, response.content, parser.fields, stopped)
+            response = self._invoke_llm(messages, **options)
+            self._record_usage(state, messages, response)
+            return self._apply_llm_response(state, response.content)
+        except CircuitOpen:
+            return self._apply_degraded(state, 'circuit_open')
+        except DeadlineExceeded:
+            return self._apply_degraded(state, 'deadline')
+        except Exception as e:
+            return self._apply_llm_error(state, e)
+    
+    async def _allm_analyze_node(self, state: ModerationState) -> ModerationState:
+        """Async LLM analysis - several calls can be in flight at once"""
+        
+        if self.breaker is not None and not self.breaker.allow():
+            return self._apply_degraded(state, 'circuit_open')
+        try:
+            if self.batcher is not None and not state.get("reanalysis") \
+                    and not state.get("message_context"):
+                try:
+                    result = await asyncio.wait_for(
+                        asyncio.wrap_future(self.batcher.submit(state)), self._batch_timeout(state))
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded("Micro-batch did not finish before the deadline")
+                if result is not None:
+                    return self._apply_batch_result(state, result)
+            
+            messages = self._build_prompt_messages(state)
+            options = self._llm_call_options(state, messages)
+            if self.streaming:
+                response, parser, stopped = await self._ainvoke_llm(messages, stream=True, **options)
+                self._record_usage(state, messages, response)
+                return self._apply_llm_response(state, response.content, parser.fields, stopped)
+            response = await self._ainvoke_llm(messages, **options)
+            self._record_usage(state, messages, response)
+            return self._apply_llm_response(state, response.content)
+        except CircuitOpen:
+            return self._apply_degraded(state, 'circuit_open')
+        except DeadlineExceeded:
+            return self._apply_degraded(state, 'deadline')
+        except Exception as e:
+            return self._apply_llm_error(state, e)
+    
     def _fallback_parse(self, text: str) -> Dict:
         """Fallback parsing when JSON extraction fails"""
         
@@ -244,142 +807,273 @@ JSON בלבד:
             'reasoning': reasoning
         }
     
-    def _make_decision_node(self, state: ModerationState) -> ModerationState:
-        """Make final decision"""
-        
-        if state["classification"] == 'CLEAR_VIOLATION' and state["confidence"] > 0.8:
+    def _decide_action(self, state: ModerationState) -> None:
+        """Action for the verdict (thresholds only, no side effects)"""
+        if state["verdict_source"] == 'degraded':
+            # Never delete without the LLM; approvals are marked as provisional
+            state["action"] = 'APPROVE_DEGRADED' if state["classification"] == 'APPROVED' \
+                else 'FLAG_FOR_REVIEW'
+        elif state["classification"] == 'CLEAR_VIOLATION' and state["confidence"] > self.delete_confidence:
             state["action"] = 'DELETE_MESSAGE'
         elif state["classification"] in ['CLEAR_VIOLATION', 'CONTEXT_DEPENDENT']:
             state["action"] = 'FLAG_FOR_REVIEW'
         else:
             state["action"] = 'APPROVE'
+    
+    def _decide_node(self, state: ModerationState) -> ModerationState:
+        """Final action of a bulk re-moderation - nothing is saved"""
+        self._decide_action(state)
+        return state
+    
+    async def _adecide_node(self, state: ModerationState) -> ModerationState:
+        """Async decide - CPU only, runs inline"""
+        return self._decide_node(state)
+    
+    def _make_decision_node(self, state: ModerationState) -> ModerationState:
+        """Make final decision"""
+        
+        self._decide_action(state)
         
         # Save to database
-        self._save_message(state)
+        with self.metrics.time_stage("save"):
+            self._save_message(state)
+        if not state.get("reanalysis"):
+            self.metrics.count_message(state["verdict_source"])
+        self.user_history.record(state["user_id"], state["message_id"],
+                                 state["classification"], state["reasoning"])
+        
+        # Only fresh, successful LLM verdicts are worth caching
+        if self.verdict_cache is not None and state["verdict_source"] == 'llm':
+            self.verdict_cache.put(
+                state["content"], state["classification"],
+                state["confidence"], state["reasoning"]
+            )
+        
+        # ...and learning from (confident ones become weak training labels)
+        if self.local_classifier is not None and state["verdict_source"] == 'llm':
+            self.local_classifier.learn_verdict(
+                state["content"], state["classification"],
+                state["confidence"], state["verdict_source"]
+            )
         
         return state
     
+    async def _amake_decision_node(self, state: ModerationState) -> ModerationState:
+        """Async make_decision - database write runs off the event loop"""
+        return await asyncio.to_thread(self._make_decision_node, state)
+    
     def _save_message(self, state: ModerationState):
-        """Save message to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO messages 
-            (id, user_id, content, timestamp, classification, confidence, reasoning, action)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            state["message_id"],
-            state["user_id"],
-            state["content"],
-            state["timestamp"],
-            state["classification"],
-            state["confidence"],
-            state["reasoning"],
-            state["action"]
-        ))
-        
-        conn.commit()
-        conn.close()
-    
-    def process_message(self, message_id: str, user_id: str, content: str) -> Dict:
-        """Process a single message"""
-        
-        # Create initial state
-        initial_state: ModerationState = {
+        """Save message to database (queued in write-behind mode)"""
+        if self.writer is not None:
+            self.writer.submit(state, durable=state.get("durable", False))
+        else:
+            self.storage.save_message(state)
+    
+    def _initial_state(self, message_id: str, user_id: str, content: str,
+                       durable: bool = False, deadline: Optional[float] = None,
+                       envelope: Optional[Dict] = None) -> ModerationState:
+        """Create initial workflow state"""
+        if deadline is None and self.deadline_s:
+            deadline = time.monotonic() + self.deadline_s
+        envelope = parse_envelope(envelope)
+        if is_media(envelope) and not envelope['caption']:
+            envelope['caption'] = content or ""
+        return {
             "message_id": message_id,
             "user_id": user_id,
-            "content": content,
+            "content": message_text(content, envelope),
             "timestamp": datetime.now().isoformat(),
             "classification": "",
             "confidence": 0.0,
             "reasoning": "",
             "action": "",
             "user_history": [],
-            "group_rules": ""
+            "group_rules": "",
+            "durable": durable,
+            "deadline": deadline or 0.0,
+            "usage": {},
+            "verdict_source": "",
+            "reanalysis": False,
+            "admin_hint": "",
+            "envelope": envelope,
+            "message_context": ""
         }
-        
-        # Run workflow
-        final_state = self.workflow.invoke(initial_state)
-        
+    
+    def _result_from_state(self, final_state: ModerationState) -> Dict:
+        """Public result dict from final workflow state"""
         return {
             'message_id': final_state["message_id"],
             'classification': final_state["classification"],
             'confidence': final_state["confidence"],
             'action': final_state["action"],
-            'reasoning': final_state["reasoning"]
+            'reasoning': final_state["reasoning"],
+            'usage': final_state["usage"],
+            'degraded': final_state["verdict_source"] == 'degraded',
+            'verdict_source': final_state["verdict_source"],
+            # Whether the LLM is available, whichever tier decided this message
+            'llm_breaker': self.breaker.state if self.breaker is not None else None
         }
     
-    def process_feedback(self, message_id: str, feedback: str) -> bool:
-        """Process admin feedback for learning"""
+    def process_message(self, message_id: str, user_id: str, content: str,
+                        durable: bool = False, deadline: Optional[float] = None,
+                        envelope: Optional[Dict] = None) -> Dict:
+        """Process a single message.
         
-        feedback_mapping = {
-            '✅': 'CORRECT',
-            '❌': 'INCORRECT', 
-            '⚠️': 'COMPLEX',
-            '🔄': 'REANALYZE'
-        }
+        deadline is a time.monotonic() value; by default deadline_s from now.
+        envelope optionally describes the message (see message_envelope).
+        """
         
-        feedback_type = feedback_mapping.get(feedback, 'UNKNOWN')
+        # Run workflow
+        final_state = self.workflow.invoke(
+            self._initial_state(message_id, user_id, content, durable, deadline, envelope))
+        
+        return self._result_from_state(final_state)
+    
+    async def aprocess_message(self, message_id: str, user_id: str, content: str,
+                               durable: bool = False, deadline: Optional[float] = None,
+                               envelope: Optional[Dict] = None) -> Dict:
+        """Process a single message without blocking the event loop"""
+        
+        final_state = await self.workflow.ainvoke(
+            self._initial_state(message_id, user_id, content, durable, deadline, envelope))
+        
+        return self._result_from_state(final_state)
+    
+    async def aprocess_batch(self, messages: List[Dict], max_concurrency: int = 10) -> List[Dict]:
+        """Process many messages concurrently, results in input order.
         
-        # Update database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        Each message is a dict with message_id, user_id, content and optionally envelope.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
         
-        cursor.execute("""
-            UPDATE messages SET feedback = ? WHERE id = ?
-        """, (feedback_type, message_id))
+        async def run_one(message: Dict) -> Dict:
+            async with semaphore:
+                try:
+                    return await self.aprocess_message(
+                        message['message_id'], message['user_id'], message['content'],
+                        envelope=message.get('envelope')
+                    )
+                except Exception as e:
+                    # One failed message must not fail the whole batch
+                    return {
+                        'message_id': message.get('message_id', ''),
+                        'classification': 'CONTEXT_DEPENDENT',
+                        'confidence': 0.0,
+                        'action': 'FLAG_FOR_REVIEW',
+                        'reasoning': f"Python processing error: {str(e)}",
+                        'error': str(e)
+                    }
         
-        conn.commit()
-        conn.close()
+        return await asyncio.gather(*(run_one(m) for m in messages))
+    
+    def process_batch(self, messages: List[Dict], max_concurrency: int = 10) -> List[Dict]:
+        """Synchronous wrapper around aprocess_batch (not for use inside a running loop)"""
+        return asyncio.run(self.aprocess_batch(messages, max_concurrency=max_concurrency))
+    
+    def reanalyze_message(self, message_id: str, hint: Optional[str] = None) -> Dict:
+        """Re-run a stored message through the LLM, optionally with an admin's hint.
+        
+        The new verdict replaces the stored one (same timestamp). Raises
+        ReanalysisFailed when the LLM gave no verdict; the stored one is kept.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+        message = self.storage.get_message(message_id)
+        if message is None:
+            raise ValueError(f"Unknown message: {message_id}")
+        if message['content'] is None:
+            raise ValueError(f"Content of {message_id} was redacted by retention")
         
-        # Here we could implement learning logic
-        # For now, just store the feedback
+        # No deadline - nobody is waiting on the reply
+        state = self._initial_state(message_id, message['user_id'], message['content'],
+                                    durable=True, deadline=0.0)
+        if message['timestamp']:
+            state["timestamp"] = message['timestamp']
+        state["reanalysis"] = True
+        state["admin_hint"] = (hint or "").strip()
+        
+        final_state = self.reanalysis_workflow.invoke(state)
+        if final_state["verdict_source"] != 'llm':
+            raise ReanalysisFailed(final_state["reasoning"] or final_state["verdict_source"])
+        
+        return self._result_from_state(final_state)
+    
+    def _rescore_state(self, message: Dict) -> ModerationState:
+        # No deadline - nobody is waiting on the reply
+        state = self._initial_state(message['message_id'], message['user_id'] or "",
+                                    message['content'], deadline=0.0)
+        if message.get('timestamp'):
+            state["timestamp"] = message['timestamp']
+        state["reanalysis"] = True
+        return state
+    
+    def rescore_message(self, message: Dict) -> Dict:
+        """Verdict a stored message (message_id, user_id, content) would get now.
         
-        return True
+        Runs the rules and the LLM with the current prompt and thresholds at
+        low priority. Nothing is saved and no tier learns from the result.
+        """
+        return self._result_from_state(self.rescore_workflow.invoke(self._rescore_state(message)))
+    
+    async def arescore_message(self, message: Dict) -> Dict:
+        """Async rescore_message"""
+        final_state = await self.rescore_workflow.ainvoke(self._rescore_state(message))
+        return self._result_from_state(final_state)
+    
+    def learn_verdict(self, content: str, result: Dict, envelope: Optional[Dict] = None) -> None:
+        """Teach the local classifier a verdict made in another process (fleet workers)"""
+        if self.local_classifier is not None and result.get('verdict_source') == 'llm':
+            self.local_classifier.learn_verdict(
+                message_text(content, parse_envelope(envelope)), result['classification'],
+                result['confidence'], result['verdict_source']
+            )
+    
+    def process_feedback(self, message_id: str, feedback: str, hint: Optional[str] = None) -> bool:
+        """Process admin feedback for learning"""
+        return self.feedback.process(message_id, feedback, hint)
+    
+    def process_feedback_batch(self, items: List[Dict]) -> Dict:
+        """Process many admin reactions ({message_id, reaction, hint}) at once"""
+        return self.feedback.process_batch(items)
     
     def get_stats(self) -> Dict:
         """Get statistics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                classification,
-                COUNT(*) as count,
-                AVG(confidence) as avg_confidence
-            FROM messages
-            GROUP BY classification
-        """)
-        
-        stats = {}
-        for row in cursor.fetchall():
-            stats[row[0]] = {
-                'count': row[1],
-                'avg_confidence': row[2]
-            }
-        
-        # Accuracy calculation
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_feedback,
-                SUM(CASE WHEN feedback = 'CORRECT' THEN 1 ELSE 0 END) as correct
-            FROM messages
-            WHERE feedback IS NOT NULL
-        """)
-        
-        feedback_stats = cursor.fetchone()
-        accuracy = 0
-        if feedback_stats and feedback_stats[0] > 0:
-            accuracy = (feedback_stats[1] / feedback_stats[0]) * 100
-        
-        conn.close()
+        if self.writer is not None:
+            self.writer.flush()
         
-        return {
-            'classification_stats': stats,
-            'accuracy': accuracy,
-            'total_messages': sum(s['count'] for s in stats.values()),
-        }
+        result = self.storage.summary_stats()
+        if self.verdict_cache is not None:
+            result['cache'] = self.verdict_cache.stats()
+        result['user_history'] = self.user_history.stats()
+        result['tokens'] = self.token_usage.stats()
+        result['tier_accuracy'] = self.storage.tier_accuracy()
+        result['reanalysis_jobs'] = self.storage.reanalysis_counts()
+        if self.near_duplicates is not None:
+            result['near_duplicates'] = self.near_duplicates.stats()
+        if self.local_classifier is not None:
+            result['local_classifier'] = self.local_classifier.stats()
+        result['metrics'] = self.metrics.snapshot()
+        if self.scheduler is not None:
+            result['llm_scheduler'] = self.scheduler.stats()
+        if self.breaker is not None:
+            result['circuit_breaker'] = self.breaker.stats()
+        if self.batcher is not None:
+            result['micro_batches'] = self.batcher.stats()
+        if self.writer is not None:
+            result['write_behind'] = self.writer.stats()
+        
+        return result
+    
+    def close(self):
+        """Flush pending writes - call on shutdown"""
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.scheduler is not None and self._owns_scheduler:
+            self.scheduler.close()
+        if self.writer is not None:
+            self.writer.close()
+        if self.local_classifier is not None:
+            self.local_classifier.save()
 
 # Test the agent
 def test_llm_agent():
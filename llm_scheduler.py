@@ -0,0 +1,414 @@
+"""
+Rate-limit aware scheduler in front of the Groq calls.
+
+Every LLM call first takes a permit from a token bucket sized to our Groq
+quota (requests per minute, optionally tokens per minute). Waiting calls
+are served in priority order - messages with risky signals (digits,
+coordinates, unit names) before plain thank-you messages - and each one
+carries a deadline: a call that can no longer finish before the bot's
+timeout is shed instead of queued. 429s and transient errors are retried
+with jittered exponential backoff; a Retry-After from the provider pauses
+the whole bucket, so one rate-limit response slows every caller down.
+
+When several groups share the scheduler, each call names its group
+(tenant) and permits go round-robin between the groups with calls waiting,
+in proportion to their weights, so a burst in one group only delays that
+group. Priority orders the calls within a group; low-priority calls wait
+until no group has anything more urgent.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_DEADLINE_S = 15.0
+DEFAULT_MAX_RETRIES = 3
+BASE_BACKOFF_S = 0.5
+MAX_BACKOFF_S = 8.0
+INITIAL_LATENCY_ESTIMATE_S = 1.0
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+HIGH_PRIORITY_SIGNALS = {
+    "gps_degrees", "gps_decimal", "unit_number", "phone", "digits", "time",
+    "operational", "military", "gaza",
+}
+
+
+def message_priority(signals: Set[str]) -> int:
+    """Risky messages first, plain greetings last"""
+    if signals & HIGH_PRIORITY_SIGNALS:
+        return PRIORITY_HIGH
+    if signals and signals <= {"gratitude"}:
+        return PRIORITY_LOW
+    return PRIORITY_NORMAL
+
+
+class DeadlineExceeded(Exception):
+    """The call could not be made before its deadline"""
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of a provider error, if it carries one"""
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header (or attribute), if present"""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if headers is not None:
+            value = headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    # Not "429" in the text - message ids and token counts can contain it
+    return status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_transient(error: BaseException) -> bool:
+    code = status_code(error)
+    if code is not None:
+        return code >= 500 or code == 408
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "TimeoutError",
+                                    "ConnectionError")
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe, used under the scheduler lock"""
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate = rate_per_s
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until cost tokens are available"""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        wait = (cost - self.tokens) / self.rate if self.tokens < cost else 0.0
+        return max(wait, self.paused_until - now)
+
+    def consume(self, cost: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= min(cost, self.capacity)
+
+    def pause(self, until: float) -> None:
+        self.paused_until = max(self.paused_until, until)
+
+
+class _Waiter:
+    __slots__ = ("priority", "deadline", "cost", "tenant", "granted", "cancelled", "notify")
+
+    def __init__(self, priority: int, deadline: Optional[float], cost: float,
+                 notify: Callable[[bool], None], tenant: Optional[str] = None):
+        self.priority = priority
+        self.deadline = deadline
+        self.cost = cost
+        self.tenant = tenant
+        self.granted: Optional[bool] = None
+        self.cancelled = False
+        self.notify = notify
+
+
+class LLMScheduler:
+    """Priority queue + token bucket + retry policy for LLM calls"""
+
+    def __init__(self, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: Optional[float] = None, burst: Optional[float] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, metrics=None,
+                 weights: Optional[Dict[str, float]] = None):
+        # Quotas are per minute and refill continuously, so a full minute may burst
+        self.requests = TokenBucket(requests_per_minute / 60, burst or requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) \
+            if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self._rng = random.Random()
+
+        # One priority heap per tenant; None is the tenant of untagged calls
+        self._queues: Dict[Optional[str], List] = {}
+        self.weights = dict(weights or {})
+        # Weighted permits granted per tenant, and the level at the last grant
+        self._served: Dict[Optional[str], float] = {}
+        self._virtual_time = 0.0
+        self._tenant_granted: Dict[Optional[str], int] = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.latency_estimate = INITIAL_LATENCY_ESTIMATE_S
+
+        self.granted = 0
+        self.shed = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+        self._thread = threading.Thread(target=self._run, name="llm-scheduler", daemon=True)
+        self._thread.start()
+
+    # Dispatcher
+
+    def _wait_time(self, waiter: _Waiter, now: float) -> float:
+        wait = self.requests.wait_time(1, now)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(waiter.cost, now))
+        return wait
+
+    def _too_late(self, waiter: _Waiter, start: float) -> bool:
+        return waiter.deadline is not None and start + self.latency_estimate > waiter.deadline
+
+    def _resolve(self, waiter: _Waiter, granted: bool) -> None:
+        waiter.granted = granted
+        if granted:
+            self.granted += 1
+            self._tenant_granted[waiter.tenant] = self._tenant_granted.get(waiter.tenant, 0) + 1
+            # Tenants are served in order of weighted permits received
+            self._virtual_time = self._served[waiter.tenant]
+            self._served[waiter.tenant] += 1 / self.weights.get(waiter.tenant, 1.0)
+        else:
+            self.shed += 1
+        waiter.notify(granted)
+
+    def _head(self) -> Optional[_Waiter]:
+        """Next waiter: least-served tenant first, low priority after everyone else"""
+        best = None
+        for tenant in list(self._queues):
+            queue = self._queues[tenant]
+            while queue and queue[0][2].cancelled:
+                heapq.heappop(queue)
+            if not queue:
+                del self._queues[tenant]
+                continue
+            priority, sequence, waiter = queue[0]
+            key = (priority >= PRIORITY_LOW, self._served[tenant], priority, sequence)
+            if best is None or key < best[0]:
+                best = (key, waiter)
+        return best[1] if best else None
+
+    def _pop(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.tenant]
+        heapq.heappop(queue)
+        if not queue:
+            del self._queues[waiter.tenant]
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self._closed:
+                waiter = self._head()
+                if waiter is None:
+                    self._cond.wait()
+                    continue
+
+                now = time.monotonic()
+                wait = self._wait_time(waiter, now)
+                if self._too_late(waiter, now + wait):
+                    self._pop(waiter)
+                    self._resolve(waiter, False)
+                    continue
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                self._pop(waiter)
+                self.requests.consume(1, now)
+                if self.tokens is not None:
+                    self.tokens.consume(waiter.cost, now)
+                self._resolve(waiter, True)
+
+            for queue in self._queues.values():
+                for _, _, waiter in queue:
+                    self._resolve(waiter, False)
+            self._queues.clear()
+
+    def _calls_ahead(self, waiter: _Waiter) -> int:
+        """Calls granted before this one: its own tenant's, plus one per round from the rest"""
+        own = sum(1 for p, _, w in self._queues.get(waiter.tenant, ())
+                  if p <= waiter.priority and not w.cancelled)
+        others = sum(min(own + 1, sum(1 for _, _, w in queue if not w.cancelled))
+                     for tenant, queue in self._queues.items() if tenant != waiter.tenant)
+        return own + others
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        with self._cond:
+            # Shed right away when the calls ahead already use up the time budget
+            ahead = self._calls_ahead(waiter)
+            now = time.monotonic()
+            queue_wait = max(0.0, ahead + 1 - self.requests.tokens) / self.requests.rate
+            if self._closed or self._too_late(waiter, now + max(queue_wait, self._wait_time(waiter, now))):
+                self._resolve(waiter, False)
+                return
+            if waiter.tenant not in self._queues:
+                # An idle tenant rejoins at the current level - no credit saved up while idle
+                self._served[waiter.tenant] = max(self._served.get(waiter.tenant, 0.0),
+                                                  self._virtual_time)
+                self._queues[waiter.tenant] = []
+            heapq.heappush(self._queues[waiter.tenant],
+                           (waiter.priority, next(self._sequence), waiter))
+            self._cond.notify()
+
+    def _cancel(self, waiter: _Waiter) -> None:
+        with self._cond:
+            if waiter.granted is None:
+                waiter.cancelled = True
+                self.shed += 1
+            self._cond.notify()
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, deadline: Optional[float] = None,
+                cost: float = 0.0, tenant: Optional[str] = None) -> None:
+        """Block until a call may be made; DeadlineExceeded if it is shed"""
+        done = threading.Event()
+        waiter = _Waiter(priority, deadline, cost, lambda granted: done.set(), tenant)
+        start = time.monotonic()
+        self._enqueue(waiter)
+        timeout = deadline - time.monotonic() if deadline is not None else None
+        if not done.wait(timeout if timeout is None else max(0.0, timeout)):
+            self._cancel(waiter)
+        self._observe_queue(time.monotonic() - start)
+        if not waiter.granted:
+            raise DeadlineExceeded("LLM call shed: deadline cannot be met")
+
+    async def aacquire(self, priority: int = PRIORITY_NORMAL, deadline: Optional[float] = None,
+                       cost: float = 0.0, tenant: Optional[str] = None) -> None:
+        """Async acquire - waits on the event loop, not in a thread"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def notify(granted: bool) -> None:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(granted))
+
+        waiter = _Waiter(priority, deadline, cost, notify, tenant)
+        start = time.monotonic()
+        self._enqueue(waiter)
+        timeout = deadline - time.monotonic() if deadline is not None else None
+        try:
+            await asyncio.wait_for(asyncio.shield(future),
+                                   timeout if timeout is None else max(0.0, timeout))
+        except asyncio.TimeoutError:
+            self._cancel(waiter)
+        self._observe_queue(time.monotonic() - start)
+        if not waiter.granted:
+            raise DeadlineExceeded("LLM call shed: deadline cannot be met")
+
+    # Retry policy
+
+    def _retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None to give up"""
+        if attempt >= self.max_retries:
+            return None
+        backoff = self._rng.uniform(0, min(MAX_BACKOFF_S, BASE_BACKOFF_S * 2 ** attempt))
+        if is_rate_limited(error):
+            self.rate_limited += 1
+            delay = retry_after(error)
+            delay = delay * (1 + self._rng.uniform(0, 0.1)) if delay is not None else backoff
+            with self._cond:
+                # Everyone waits, not just this caller
+                self.requests.pause(time.monotonic() + delay)
+                self._cond.notify()
+            return delay
+        if is_transient(error):
+            return backoff
+        return None
+
+    def _check_retry(self, error: BaseException, attempt: int, deadline: Optional[float]) -> float:
+        delay = self._retry_delay(error, attempt)
+        if delay is None:
+            raise error
+        if deadline is not None and time.monotonic() + delay + self.latency_estimate > deadline:
+            raise DeadlineExceeded(f"No time left to retry after: {error}") from error
+        self.retries += 1
+        if self.metrics is not None:
+            self.metrics.count_llm_retry('rate_limit' if is_rate_limited(error) else 'transient')
+        return delay
+
+    def _observe_latency(self, seconds: float) -> None:
+        self.latency_estimate = 0.8 * self.latency_estimate + 0.2 * seconds
+
+    def _observe_queue(self, seconds: float) -> None:
+        if self.metrics is not None:
+            self.metrics.observe_stage("llm_queue", seconds)
+
+    def call(self, fn: Callable, priority: int = PRIORITY_NORMAL,
+             deadline: Optional[float] = None, cost: float = 0.0,
+             tenant: Optional[str] = None):
+        """Run fn() under the rate limit, retrying 429s and transient errors"""
+        attempt = 0
+        while True:
+            self.acquire(priority, deadline, cost, tenant)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._check_retry(e, attempt, deadline)
+                attempt += 1
+                if not is_rate_limited(e):
+                    time.sleep(delay)  # A 429 already paused the bucket
+                continue
+            self._observe_latency(time.monotonic() - start)
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable], priority: int = PRIORITY_NORMAL,
+                    deadline: Optional[float] = None, cost: float = 0.0,
+                    tenant: Optional[str] = None):
+        """Async call() - fn returns an awaitable"""
+        attempt = 0
+        while True:
+            await self.aacquire(priority, deadline, cost, tenant)
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._check_retry(e, attempt, deadline)
+                attempt += 1
+                if not is_rate_limited(e):
+                    await asyncio.sleep(delay)
+                continue
+            self._observe_latency(time.monotonic() - start)
+            return result
+
+    def close(self) -> None:
+        """Stop the dispatcher; queued calls are shed"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            queued = {tenant: sum(1 for _, _, w in queue if not w.cancelled)
+                      for tenant, queue in self._queues.items()}
+            result = {
+                'queued': sum(queued.values()),
+                'granted': self.granted,
+                'shed': self.shed,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'latency_estimate_s': round(self.latency_estimate, 3),
+            }
+            tenants = [t for t in set(queued) | set(self._tenant_granted) if t is not None]
+            if tenants:
+                result['groups'] = {
+                    tenant: {'queued': queued.get(tenant, 0),
+                             'granted': self._tenant_granted.get(tenant, 0)}
+                    for tenant in sorted(tenants)
+                }
+            return result
@@ -0,0 +1,347 @@
+"""
+Local first-tier classifier trained from admin feedback.
+
+A multinomial logistic regression over character n-grams, which copes
+with Hebrew prefixes and spelling variants without a tokenizer. It is trained
+from the messages table: what an admin's reaction says a message is (✅
+approve, ❌ delete, ⚠️ complex) is a strong label, confident unreviewed
+rule/LLM verdicts are weak ones.
+The model takes online SGD steps on new LLM verdicts and feedback, and is fully
+retrained and calibrated by train_local_classifier.py, which picks the
+confidence threshold above which local approvals reach the target
+precision on held-out messages. A process never saves its online copy
+over a model retrained after it was loaded; it loads the newer one. Below that threshold the message goes on
+to the LLM. Until a calibrated threshold exists the tier never decides, and
+the agent only takes its APPROVED verdicts as final (the labels are partly
+the LLM's own, so a violation still goes to the LLM).
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from moderation_feedback import FEEDBACK_CLASSIFICATION
+from moderation_storage import ModerationStorage
+
+CLASSES = ('APPROVED', 'CLEAR_VIOLATION', 'CONTEXT_DEPENDENT')
+NGRAM_SIZES = (2, 3, 4)
+
+STRONG_WEIGHT = 1.0
+WEAK_WEIGHT = 0.3
+WEAK_MIN_CONFIDENCE = 0.6
+
+LEARNING_RATE = 0.5
+ONLINE_LEARNING_RATE = 0.1
+EPOCHS = 8
+L2 = 1e-6
+
+DEFAULT_TARGET_PRECISION = 0.97
+DEFAULT_MIN_SAMPLES = 200
+MIN_CALIBRATION_SAMPLES = 30
+HOLDOUT_PERCENT = 20
+SAVE_EVERY_UPDATES = 200
+MODEL_NAME = "logreg_ngram_v1"
+
+_NIQQUD_RE = re.compile(r"[\u0591-\u05C7]")
+_DIGITS_RE = re.compile(r"\d")
+_SPACE_RE = re.compile(r"\s+")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+
+def normalize_text(content: str) -> str:
+    """Lowercase, drop niqqud, unify final letters and digits"""
+    content = _NIQQUD_RE.sub("", content.lower()).translate(_FINAL_LETTERS)
+    content = _DIGITS_RE.sub("0", content)
+    return _SPACE_RE.sub(" ", content).strip()
+
+
+def char_ngrams(content: str) -> List[str]:
+    """Distinct character n-grams, word boundaries marked by spaces"""
+    text = f" {normalize_text(content)} "
+    features = set()
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            features.add(text[i:i + n])
+    return list(features)
+
+
+def training_label(classification: Optional[str], confidence: Optional[float],
+                   verdict_source: Optional[str],
+                   feedback: Optional[str]) -> Optional[Tuple[str, float]]:
+    """(label, weight) a stored message contributes to training, or None"""
+    if feedback in FEEDBACK_CLASSIFICATION:
+        # The admin's verdict, whatever the stored one was
+        label, weight = FEEDBACK_CLASSIFICATION[feedback], STRONG_WEIGHT
+    elif feedback is not None:
+        return None  # Sent for re-analysis - the right label is unknown
+    elif verdict_source in ('local', 'media', 'llm_error', 'degraded') \
+            or (confidence or 0) < WEAK_MIN_CONFIDENCE:
+        return None  # Never train on our own guesses or on failures
+    else:
+        label, weight = classification, WEAK_WEIGHT
+    return (label, weight) if label in CLASSES else None
+
+
+def is_holdout(message_id: str) -> bool:
+    """Deterministic split used for calibration"""
+    return zlib.crc32(message_id.encode("utf-8")) % 100 < HOLDOUT_PERCENT
+
+
+class LocalClassifier:
+    """Character n-gram logistic regression with a calibrated confidence threshold"""
+
+    def __init__(self, storage: ModerationStorage, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 persist: bool = True):
+        self.storage = storage
+        self.min_samples = min_samples
+        # False keeps online updates in memory - another process owns the stored model
+        self.persist = persist
+        self._lock = threading.Lock()
+
+        # feature -> per-class weights, in CLASSES order
+        self.weights: Dict[str, List[float]] = {}
+        self.bias = [0.0] * len(CLASSES)
+        self.trained_samples = 0.0
+
+        self.threshold: Optional[float] = None
+        self.calibration: Dict = {}
+        self.trained_at: Optional[float] = None
+        self._unsaved_updates = 0
+
+        self.setup_table()
+        self.load()
+
+    def setup_table(self):
+        """Create the persisted model table"""
+        with self.storage.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS local_classifier (
+                    name TEXT PRIMARY KEY,
+                    trained_at REAL,
+                    threshold REAL,
+                    calibration TEXT,
+                    model TEXT
+                )
+            """)
+
+    # Model
+
+    def _probabilities(self, features: List[str]) -> List[float]:
+        """Softmax over classes; features are binary, L2-normalized"""
+        scale = 1.0 / math.sqrt(len(features)) if features else 0.0
+        scores = list(self.bias)
+        for feature in features:
+            weights = self.weights.get(feature)
+            if weights is not None:
+                for index, weight in enumerate(weights):
+                    scores[index] += weight * scale
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def _step(self, features: List[str], label: str, weight: float, learning_rate: float) -> None:
+        """One SGD step on the cross-entropy loss"""
+        target = CLASSES.index(label)
+        probabilities = self._probabilities(features)
+        gradient = [p - (1.0 if index == target else 0.0) for index, p in enumerate(probabilities)]
+        rate = learning_rate * weight
+        scale = 1.0 / math.sqrt(len(features)) if features else 0.0
+        for index, g in enumerate(gradient):
+            self.bias[index] -= rate * g
+        for feature in features:
+            weights = self.weights.get(feature)
+            if weights is None:
+                weights = self.weights[feature] = [0.0] * len(CLASSES)
+            for index, g in enumerate(gradient):
+                weights[index] -= rate * (g * scale + L2 * weights[index])
+
+    # Training
+
+    def learn(self, content: str, label: str, weight: float) -> None:
+        """Online update from one labelled message"""
+        if label not in CLASSES or weight <= 0:
+            return
+        features = char_ngrams(content)
+        with self._lock:
+            self._step(features, label, weight, ONLINE_LEARNING_RATE)
+            self.trained_samples += weight
+            self._unsaved_updates += 1
+            save = self.persist and self._unsaved_updates >= SAVE_EVERY_UPDATES
+        if save:
+            self.save()
+
+    def learn_verdict(self, content: str, classification: str, confidence: float,
+                      verdict_source: str) -> None:
+        """Online update from a fresh verdict (weak label)"""
+        label = training_label(classification, confidence, verdict_source, None)
+        if label:
+            self.learn(content, *label)
+
+    def apply_feedback(self, message: Dict, feedback: str) -> None:
+        """Online update when admin feedback changes a message's label"""
+        old = training_label(message['classification'], message['confidence'],
+                             message['verdict_source'], message['feedback'])
+        new = training_label(message['classification'], message['confidence'],
+                             message['verdict_source'], feedback)
+        # Retraining drops labels that feedback revoked; online we can only add
+        if new and new != old:
+            self.learn(message['content'], *new)
+
+    def fit(self, rows: Iterable[Tuple], epochs: int = EPOCHS, seed: int = 0) -> int:
+        """Train from scratch on (content, label, weight) rows"""
+        samples = [(char_ngrams(content), label, weight) for content, label, weight in rows]
+        rng = random.Random(seed)
+        with self._lock:
+            self.weights = {}
+            self.bias = [0.0] * len(CLASSES)
+            for epoch in range(epochs):
+                rng.shuffle(samples)
+                learning_rate = LEARNING_RATE / (1 + epoch)
+                for features, label, weight in samples:
+                    self._step(features, label, weight, learning_rate)
+            self.trained_samples = sum(weight for _, _, weight in samples)
+        return len(samples)
+
+    # Prediction
+
+    def samples(self) -> float:
+        return self.trained_samples
+
+    def predict(self, content: str) -> Tuple[str, float]:
+        """(classification, probability)"""
+        features = char_ngrams(content)
+        with self._lock:
+            probabilities = self._probabilities(features)
+        best = max(range(len(CLASSES)), key=probabilities.__getitem__)
+        return CLASSES[best], probabilities[best]
+
+    def classify(self, content: str) -> Optional[Dict]:
+        """Confident local verdict, or None to escalate to the LLM"""
+        if self.threshold is None or self.samples() < self.min_samples:
+            return None
+        classification, confidence = self.predict(content)
+        if confidence < self.threshold:
+            return None
+        return {
+            'classification': classification,
+            'confidence': round(confidence, 4),
+            'reasoning': f"מסווג מקומי ({confidence:.2f})",
+        }
+
+    # Persistence
+
+    def load(self) -> bool:
+        row = self.storage.fetchone("""
+            SELECT trained_at, threshold, calibration, model
+            FROM local_classifier WHERE name = ?
+        """, (MODEL_NAME,))
+        if not row:
+            return False
+        model = json.loads(row[3])
+        with self._lock:
+            self.weights = model['weights']
+            self.bias = model['bias']
+            self.trained_samples = model['samples']
+            self.trained_at = row[0]
+            self.threshold = row[1]
+            self.calibration = json.loads(row[2]) if row[2] else {}
+        return True
+
+    def save(self) -> bool:
+        """Store the model; False if a newer retrain was stored, which is loaded instead"""
+        if not self.persist:
+            return False
+        with self._lock:
+            model = json.dumps({
+                'weights': {
+                    feature: [round(w, 6) for w in weights]
+                    for feature, weights in self.weights.items()
+                    if any(abs(w) > 1e-6 for w in weights)
+                },
+                'bias': self.bias,
+                'samples': self.trained_samples,
+            }, ensure_ascii=False)
+            self._unsaved_updates = 0
+            trained_at = self.trained_at
+        with self.storage.transaction() as conn:
+            row = conn.execute("SELECT trained_at FROM local_classifier WHERE name = ?",
+                               (MODEL_NAME,)).fetchone()
+            newer = row is not None and row[0] is not None \
+                and (trained_at is None or row[0] > trained_at)
+            if not newer:
+                conn.execute("""
+                    INSERT OR REPLACE INTO local_classifier
+                    (name, trained_at, threshold, calibration, model)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (MODEL_NAME, trained_at, self.threshold,
+                      json.dumps(self.calibration), model))
+        if newer:
+            # Retrained meanwhile (train_local_classifier.py) - it already has our labels
+            self.load()
+        return not newer
+
+    # Full retraining
+
+    def _labelled_rows(self, holdout: Optional[bool]) -> Iterable[Tuple]:
+        for message_id, content, classification, confidence, source, feedback \
+                in self.storage.iter_training_rows():
+            label = training_label(classification, confidence, source, feedback)
+            if not label or not content:
+                continue
+            if holdout is not None and is_holdout(message_id) != holdout:
+                continue
+            yield content, label[0], label[1], feedback is not None
+
+    def retrain(self, target_precision: float = DEFAULT_TARGET_PRECISION) -> Dict:
+        """Calibrate on a held-out split, then train on everything and save"""
+        self.fit((c, l, w) for c, l, w, _ in self._labelled_rows(holdout=False))
+
+        scored = []
+        for content, label, _, strong in self._labelled_rows(holdout=True):
+            prediction, confidence = self.predict(content)
+            scored.append((confidence, prediction, label, strong))
+
+        # Only local approvals are final, so the threshold is set on their precision:
+        # the lowest one whose accepted approvals still meet the target
+        approvals = sorted(((confidence, label == 'APPROVED')
+                            for confidence, prediction, label, _ in scored
+                            if prediction == 'APPROVED'), key=lambda s: -s[0])
+        threshold = None
+        coverage = 0.0
+        correct = 0
+        for index, (confidence, hit) in enumerate(approvals, start=1):
+            correct += hit
+            if index >= MIN_CALIBRATION_SAMPLES and correct / index >= target_precision:
+                threshold = confidence
+                coverage = index / len(scored)
+
+        strong = [s for s in scored if s[3]]
+        self.calibration = {
+            'target_precision': target_precision,
+            'holdout_samples': len(scored),
+            'holdout_approvals': len(approvals),
+            'holdout_accuracy': sum(s[1] == s[2] for s in scored) / len(scored) if scored else None,
+            'holdout_feedback_accuracy':
+                sum(s[1] == s[2] for s in strong) / len(strong) if strong else None,
+            'coverage': coverage,
+        }
+
+        samples = self.fit((c, l, w) for c, l, w, _ in self._labelled_rows(holdout=None))
+        self.threshold = threshold
+        self.trained_at = time.time()
+        self.save()
+        return dict(self.calibration, samples=samples, threshold=threshold)
+
+    def stats(self) -> Dict:
+        return {
+            'samples': round(self.samples(), 1),
+            'features': len(self.weights),
+            'threshold': self.threshold,
+            'active': self.threshold is not None and self.samples() >= self.min_samples,
+            'calibration': self.calibration,
+        }
@@ -0,0 +1,119 @@
+"""
+Structured description of an incoming WhatsApp message.
+
+The bot used to flatten every message into one string, downloading whole
+media files just to read their mimetype, and lost the message type, the
+forwarded flag and the quoted message on the way. It now sends an
+envelope built from metadata whatsapp-web.js already has:
+
+    {"type": "image", "mimetype": "image/jpeg", "size": 183422,
+     "forwarded": true, "caption": "...", "quoted_message_id": "..."}
+
+All fields are optional. The agent uses the envelope to route caption-less
+media without an LLM call (the model never sees the file, so there is
+nothing for it to read), and to tell the LLM the message's type, whether
+it was forwarded and what it replies to.
+"""
+from typing import Dict, Optional
+
+from rule_engine import RULE_PREFIX
+
+MEDIA_TYPES = {'image', 'video', 'audio', 'ptt', 'document', 'sticker'}
+# Caption-less media that may be footage from the field (group rule 6)
+FIELD_MEDIA_TYPES = {'image', 'video', 'document'}
+
+TYPE_NAMES = {
+    'image': 'תמונה', 'video': 'וידאו', 'audio': 'קובץ קול', 'ptt': 'הודעה קולית',
+    'document': 'מסמך', 'sticker': 'סטיקר',
+}
+
+QUOTED_PREVIEW_CHARS = 200
+
+
+def parse_envelope(data: Optional[Dict]) -> Dict:
+    """Normalized envelope ({} when absent); raises ValueError on bad input"""
+    if not data:
+        return {}
+    if not isinstance(data, dict):
+        raise ValueError("envelope must be a JSON object")
+
+    size = data.get('size')
+    if size is not None:
+        size = int(size)
+        if size < 0:
+            raise ValueError("envelope size must not be negative")
+
+    return {
+        'type': str(data.get('type') or 'chat'),
+        'mimetype': str(data.get('mimetype') or ''),
+        'size': size,
+        'forwarded': bool(data.get('forwarded', False)),
+        'caption': str(data.get('caption') or ''),
+        'quoted_message_id': str(data.get('quoted_message_id') or ''),
+    }
+
+
+def is_media(envelope: Dict) -> bool:
+    return envelope.get('type') in MEDIA_TYPES
+
+
+def message_text(content: str, envelope: Dict) -> str:
+    """Text the tiers and the LLM see (the stored content).
+
+    Media keeps the "[mimetype] caption" form earlier bot versions sent.
+    """
+    if not is_media(envelope):
+        return content or envelope.get('caption', '')
+    text = envelope['caption'] or content
+    return f"[{envelope['mimetype'] or envelope['type']}] {text}".strip()
+
+
+def _format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f}MB"
+    return f"{max(1, size // 1024)}KB"
+
+
+def media_verdict(envelope: Dict) -> Optional[Dict]:
+    """Final verdict for media without a caption, else None"""
+    if not is_media(envelope) or envelope['caption'].strip():
+        return None
+
+    kind = TYPE_NAMES.get(envelope['type'], envelope['type'])
+    if envelope['type'] in FIELD_MEDIA_TYPES and envelope['forwarded']:
+        return {
+            'rule': 'forwarded_media',
+            'classification': 'CONTEXT_DEPENDENT',
+            'confidence': 0.5,
+            'reasoning': f"{RULE_PREFIX} (forwarded_media): {kind} מועבר ללא טקסט - "
+                         f"לבדיקה ידנית (זהירות עם מדיה מהשטח)",
+        }
+    return {
+        'rule': 'media_no_text',
+        'classification': 'APPROVED',
+        'confidence': 0.6,
+        'reasoning': f"{RULE_PREFIX} (media_no_text): {kind} ללא טקסט - אין תוכן לבדיקה",
+    }
+
+
+def describe_envelope(envelope: Dict) -> str:
+    """One prompt line about the message's form ('' for a plain text message)"""
+    parts = []
+    if is_media(envelope):
+        details = ", ".join(part for part in (
+            envelope['mimetype'],
+            _format_size(envelope['size']) if envelope['size'] is not None else '',
+        ) if part)
+        kind = TYPE_NAMES.get(envelope['type'], envelope['type'])
+        parts.append(f"{kind} ({details})" if details else kind)
+    if envelope.get('forwarded'):
+        parts.append("הודעה מועברת")
+    return ("סוג ההודעה: " + ", ".join(parts)) if parts else ""
+
+
+def describe_quoted(quoted: Optional[Dict]) -> str:
+    """Prompt line about the message being replied to ('' if unknown)"""
+    if not quoted or not quoted.get('content'):
+        return ""
+    preview = quoted['content'][:QUOTED_PREVIEW_CHARS]
+    return f'בתגובה להודעה: "{preview}" (סווגה {quoted.get("classification") or "-"})'
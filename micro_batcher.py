@@ -0,0 +1,139 @@
+"""
+Micro-batching of LLM analysis requests.
+
+Messages that reach the LLM within a short window are collected and sent
+in one call, so the long static prompt prefix is paid once per batch
+instead of once per message. A batch closes when it reaches
+max_batch_size or when its oldest message has waited window_ms. While
+max_in_flight batches are already waiting on the provider, new messages
+keep accumulating, so batches grow exactly when the LLM is the bottleneck.
+
+The send function receives the batched items and returns one result per
+item; None means "no usable answer for this one" and the caller falls
+back to a single-message call. An exception fails every item in the batch.
+A batch of one is not sent at all - it resolves to None right away, as
+the single-message call is the cheaper way to handle it.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_WINDOW_MS = 50.0
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+class MicroBatcher:
+    """Collects items into batches and sends them from a small thread pool"""
+
+    def __init__(self, send_batch: Callable[[List[Any]], List[Optional[Dict]]],
+                 max_batch_size: int = DEFAULT_BATCH_SIZE, window_ms: float = DEFAULT_WINDOW_MS,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.send_batch = send_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window_s = window_ms / 1000
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._pending: List[Tuple[Any, Future, float]] = []
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(self.max_in_flight)
+        self._closed = False
+        self._executor = ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="llm-batch")
+
+        self.batches = 0
+        self.items = 0
+        self.unanswered = 0
+        self.failed_batches = 0
+        self.singles = 0
+
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the future resolves to its result (or None)"""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                future.set_exception(RuntimeError("Micro-batcher is closed"))
+                return future
+            self._pending.append((item, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def _next_batch(self) -> List[Tuple[Any, Future, float]]:
+        """Wait for the window (or a full batch) and take it off the queue"""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            while self._pending and len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = self._pending[0][2] + self.window_s - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            # Wait for a free slot first - the queue grows while the provider is busy
+            self._slots.acquire()
+            batch = self._next_batch()
+            if not batch:
+                self._slots.release()
+                return  # Closed and drained
+            # Callers that gave up (deadline) are dropped; the rest can no longer cancel
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                self._slots.release()
+                continue
+            if len(batch) == 1:
+                with self._cond:
+                    self.singles += 1
+                self._slots.release()
+                batch[0][1].set_result(None)
+                continue
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[Any, Future, float]]) -> None:
+        try:
+            results = self.send_batch([item for item, _, _ in batch])
+        except Exception as e:
+            with self._cond:
+                self.batches += 1
+                self.items += len(batch)
+                self.failed_batches += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+        else:
+            results = list(results)[:len(batch)]
+            results += [None] * (len(batch) - len(results))
+            with self._cond:
+                self.batches += 1
+                self.items += len(batch)
+                self.unanswered += sum(1 for result in results if result is None)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """Send what is queued, then stop"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'queued': len(self._pending),
+                'batches': self.batches,
+                'messages': self.items,
+                'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+                'unanswered': self.unanswered,
+                'failed_batches': self.failed_batches,
+                'singles': self.singles,
+            }
@@ -1,6 +1,10 @@
 # moderation_api.py
 """
 API Bridge between JavaScript and Python moderation agent
+
+Usage:
+    python moderation_api.py <message_id> <user_id> <content>
+    python moderation_api.py -    # JSON {message_id, user_id, content, envelope, group_id} on stdin
 """
 import sys
 import json
@@ -8,14 +12,24 @@ import os
 from datetime import datetime
 
 # Import our moderation agent
-from llm_moderation_agent import ModerationAgent
+from group_config import find_group, groups_or_default
+from moderation_groups import ModerationGroups
+
+def read_request(args):
+    """Request from argv, or a JSON object (with optional envelope and group_id) on stdin"""
+    if args == ['-']:
+        request = json.load(sys.stdin)
+        return (str(request["message_id"]), str(request["user_id"]),
+                str(request.get("content") or ""), request.get("envelope"),
+                request.get("group_id"))
+    return args[0], args[1], args[2], None, None
 
 def main():
     """Main API endpoint called by JavaScript"""
     
-    if len(sys.argv) != 4:
+    if len(sys.argv) != 4 and sys.argv[1:] != ['-']:
         error_response = {
-            "error": "Invalid arguments. Expected: message_id user_id content",
+            "error": "Invalid arguments. Expected: message_id user_id content, or - for JSON on stdin",
             "classification": "CONTEXT_DEPENDENT",
             "confidence": 0.0,
             "action": "FLAG_FOR_REVIEW",
@@ -24,23 +38,23 @@ def main():
         print(json.dumps(error_response, ensure_ascii=False))
         sys.exit(1)
     
-    message_id = sys.argv[1]
-    user_id = sys.argv[2]
-    content = sys.argv[3]
+    message_id = None
     
     try:
+        message_id, user_id, content, envelope, group_id = read_request(sys.argv[1:])
+        
         # Initialize moderation agent
         groq_api_key = os.getenv('GROQ_API_KEY')
         if not groq_api_key:
             raise Exception("GROQ_API_KEY not found in environment variables")
         
-        agent = ModerationAgent(
-            groq_api_key=groq_api_key,
-            db_path="whatsapp_moderation.db"
-        )
+        # Only the message's group - its rules and database
+        group = find_group(groups_or_default(), group_id)
+        agent = ModerationGroups(groq_api_key, [group])
         
         # Process the message
-        result = agent.process_message(message_id, user_id, content)
+        result = agent.process_message(group.group_id, message_id, user_id, content,
+                                       envelope=envelope)
         
         # Return JSON result
         print(json.dumps(result, ensure_ascii=False))
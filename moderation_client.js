@@ -0,0 +1,205 @@
+const { spawn } = require('child_process');
+const readline = require('readline');
+
+/**
+ * Client for the long-lived moderation_server.py daemon.
+ *
+ * Keeps one Python process alive, writes JSON-line requests to its stdin and
+ * correlates the JSON-line replies back to callers by message_id. If the
+ * server exits it is restarted automatically with a growing backoff.
+ */
+class ModerationClient {
+    constructor(options = {}) {
+        this.pythonPath = options.pythonPath || 'python';
+        this.scriptPath = options.scriptPath || 'moderation_server.py';
+        this.args = options.args || [];
+        this.timeoutMs = options.timeoutMs || 15000;
+        this.maxRestartDelayMs = options.maxRestartDelayMs || 30000;
+
+        this.process = null;
+        this.pending = new Map();
+        // Ids of non-message requests; Date.now() repeats within a millisecond
+        this.seq = 0;
+        this.restartDelayMs = 1000;
+        this.restartTimer = null;
+        this.stopped = false;
+    }
+
+    start() {
+        if (this.process || this.stopped) {
+            return;
+        }
+
+        console.log('Starting moderation server...');
+
+        const child = spawn(this.pythonPath, [this.scriptPath, ...this.args], {
+            cwd: process.cwd(),
+            stdio: ['pipe', 'pipe', 'pipe']
+        });
+        this.process = child;
+
+        const lines = readline.createInterface({ input: child.stdout });
+        lines.on('line', (line) => this.handleLine(line));
+
+        child.stderr.on('data', (data) => {
+            const text = data.toString().trim();
+            if (!text) {
+                return;
+            }
+            if (text.includes('Moderation server ready')) {
+                this.restartDelayMs = 1000;
+            }
+            console.error(`[moderation_server] ${text}`);
+        });
+
+        child.stdin.on('error', (error) => {
+            console.error('Moderation server stdin error:', error.message);
+        });
+
+        child.on('error', (error) => {
+            console.error('Failed to start moderation server:', error.message);
+        });
+
+        child.on('close', (code) => {
+            console.error(`Moderation server exited with code ${code}`);
+            if (this.process === child) {
+                this.process = null;
+            }
+            this.failPending();
+            this.scheduleRestart();
+        });
+    }
+
+    scheduleRestart() {
+        if (this.stopped || this.restartTimer) {
+            return;
+        }
+
+        const delay = this.restartDelayMs;
+        this.restartDelayMs = Math.min(this.restartDelayMs * 2, this.maxRestartDelayMs);
+
+        console.log(`Restarting moderation server in ${delay}ms`);
+        this.restartTimer = setTimeout(() => {
+            this.restartTimer = null;
+            this.start();
+        }, delay);
+    }
+
+    handleLine(line) {
+        let response;
+        try {
+            response = JSON.parse(line);
+        } catch (e) {
+            console.error('Invalid moderation server reply:', line);
+            return;
+        }
+
+        const entry = this.pending.get(response.message_id);
+        if (!entry) {
+            return;
+        }
+
+        clearTimeout(entry.timer);
+        this.pending.delete(response.message_id);
+        entry.resolve(response.error ? null : response);
+    }
+
+    failPending() {
+        for (const [messageId, entry] of this.pending) {
+            clearTimeout(entry.timer);
+            entry.resolve(null);
+        }
+        this.pending.clear();
+    }
+
+    /**
+     * Send one request and resolve with the reply, or null on timeout/failure.
+     */
+    request(payload) {
+        this.start();
+
+        return new Promise((resolve) => {
+            if (!this.process) {
+                resolve(null);
+                return;
+            }
+
+            const messageId = payload.message_id;
+            if (this.pending.has(messageId)) {
+                // Duplicate in-flight request - drop the older waiter
+                const previous = this.pending.get(messageId);
+                clearTimeout(previous.timer);
+                previous.resolve(null);
+            }
+
+            const timer = setTimeout(() => {
+                this.pending.delete(messageId);
+                console.log(`Moderation request timeout: ${messageId}`);
+                resolve(null);
+            }, this.timeoutMs);
+
+            this.pending.set(messageId, { resolve, timer });
+
+            try {
+                this.process.stdin.write(JSON.stringify(payload) + '\n');
+            } catch (error) {
+                clearTimeout(timer);
+                this.pending.delete(messageId);
+                console.error('Failed to send moderation request:', error.message);
+                resolve(null);
+            }
+        });
+    }
+
+    moderate(messageData) {
+        return this.request({
+            op: 'moderate',
+            message_id: messageData.id,
+            // The group's rules and database (the server's first group when absent)
+            group_id: messageData.groupId,
+            user_id: messageData.userId,
+            content: messageData.body ?? messageData.content,
+            // Type, media metadata, forwarded flag and quoted message
+            envelope: messageData.envelope,
+            // The server sheds LLM work that cannot finish before we give up
+            timeout_ms: this.timeoutMs
+        });
+    }
+
+    /**
+     * Metrics snapshot ({ metrics, prometheus }) from the server, or null.
+     */
+    metrics() {
+        return this.request({ op: 'metrics', message_id: `metrics_${++this.seq}` });
+    }
+
+    /**
+     * Apply a batch of admin reactions ({ message_id, group_id, reaction, hint }) in one request.
+     * Resolves with { processed, unknown_messages, reanalysis_jobs }, or null.
+     */
+    feedback(items) {
+        return this.request({ op: 'feedback', message_id: `feedback_${++this.seq}`, items });
+    }
+
+    /**
+     * Finished re-analysis jobs of all groups not yet reported ({ results }), or null.
+     */
+    reanalysisResults() {
+        return this.request({ op: 'reanalysis_results', message_id: `reanalysis_${++this.seq}` });
+    }
+
+    stop() {
+        this.stopped = true;
+        if (this.restartTimer) {
+            clearTimeout(this.restartTimer);
+            this.restartTimer = null;
+        }
+        this.failPending();
+        if (this.process) {
+            this.process.stdin.end();
+            this.process = null;
+        }
+    }
+}
+
+module.exports = ModerationClient;
@@ -0,0 +1,159 @@
+"""
+Admin feedback handling, independent of the LLM stack.
+
+Applies an admin's reaction to a stored verdict: records it in SQLite and
+updates whichever verdict tiers are loaded in this process - the exact
+verdict cache, the near-duplicate index, the local classifier and the
+per-user history ring buffer. A 🔄 reaction also puts the message on the
+persistent re-analysis queue, served by the server's ReanalysisWorkers.
+When other processes hold their own tiers (the server's worker fleet),
+on_applied forwards each applied reaction and refresh() replays it there.
+ModerationAgent uses it with all of its tiers; process_feedback.py uses it
+with just the storage-backed ones, so it starts without importing langchain.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+from moderation_storage import ModerationStorage
+
+FEEDBACK_MAPPING = {
+    '✅': 'CORRECT',
+    '❌': 'INCORRECT',
+    '⚠️': 'COMPLEX',
+    '🔄': 'REANALYZE'
+}
+
+# What the admin says the message is. Admins react to flagged reviews, and
+# the labels keep the bot's original names: ✅ CORRECT is "approve the
+# message (the agent was wrong)", ❌ INCORRECT is "delete it (the agent was
+# right)". They judge the message, not the stored verdict.
+FEEDBACK_CLASSIFICATION = {
+    'CORRECT': 'APPROVED',
+    'INCORRECT': 'CLEAR_VIOLATION',
+    'COMPLEX': 'CONTEXT_DEPENDENT',
+}
+FEEDBACK_REASONING = {
+    'CORRECT': "אושר על ידי מנהל",
+    'INCORRECT': "נמחק לפי החלטת מנהל",
+    'COMPLEX': "מקרה מורכב לפי מנהל",
+}
+# Admin verdicts are certain
+FEEDBACK_CONFIDENCE = 1.0
+
+
+def feedback_type(reaction: str) -> str:
+    """Feedback label for an admin reaction emoji"""
+    return FEEDBACK_MAPPING.get(reaction, 'UNKNOWN')
+
+
+class FeedbackProcessor:
+    """Applies admin feedback to storage and the loaded verdict tiers"""
+
+    def __init__(self, storage: ModerationStorage, verdict_cache=None, near_duplicates=None,
+                 local_classifier=None, user_history=None, writer=None,
+                 on_reanalysis: Optional[Callable[[int], None]] = None,
+                 on_applied: Optional[Callable[[str, Dict, str], None]] = None):
+        self.storage = storage
+        self.verdict_cache = verdict_cache
+        self.near_duplicates = near_duplicates
+        self.local_classifier = local_classifier
+        self.user_history = user_history
+        self.writer = writer
+        # Called with the job id of every queued re-analysis (wakes the workers)
+        self.on_reanalysis = on_reanalysis
+        # Called with (message_id, stored verdict before the update, label)
+        self.on_applied = on_applied
+
+    def process(self, message_id: str, reaction: str, hint: Optional[str] = None) -> bool:
+        """Record one admin reaction"""
+        # The message may still be waiting in the write-behind queue
+        if self.writer is not None:
+            self.writer.flush()
+
+        self._apply(message_id, feedback_type(reaction), hint)
+        return True
+
+    def process_batch(self, items: List[Dict]) -> Dict:
+        """Record many reactions ({message_id, reaction, hint}) in one transaction"""
+        if self.writer is not None:
+            self.writer.flush()
+
+        summary = {'processed': 0, 'unknown_messages': [], 'reanalysis_jobs': []}
+        applied = []
+        with self.storage.transaction():
+            for item in items:
+                message_id = str(item['message_id'])
+                label = feedback_type(item['reaction'])
+                message, job_id = self._apply(message_id, label, item.get('hint'), notify=False)
+                summary['processed'] += 1
+                if message is None:
+                    summary['unknown_messages'].append(message_id)
+                else:
+                    applied.append((message_id, message, label))
+                if job_id is not None:
+                    summary['reanalysis_jobs'].append(job_id)
+
+        # Only after the commit - workers in this process claim from the table
+        if self.on_reanalysis is not None:
+            for job_id in summary['reanalysis_jobs']:
+                self.on_reanalysis(job_id)
+        if self.on_applied is not None:
+            for message_id, message, label in applied:
+                self.on_applied(message_id, message, label)
+        return summary
+
+    def refresh(self, message_id: str, message: Dict, label: str) -> None:
+        """Update this process's tiers for a reaction another process applied.
+
+        message is the stored verdict before that update. The database
+        writes repeat the other process's and change nothing.
+        """
+        if self.user_history is not None:
+            self.user_history.record_feedback(message_id, label)
+        self._update_tiers(message_id, message, label)
+
+    def _apply(self, message_id: str, label: str, hint: Optional[str],
+               notify: bool = True) -> Tuple[Optional[Dict], Optional[int]]:
+        """(stored verdict before the update or None, re-analysis job id or None)"""
+        # Stored verdict before the update - its training contribution changes
+        message = self.storage.get_message(message_id)
+
+        self.storage.update_feedback(message_id, label)
+        if self.user_history is not None:
+            self.user_history.record_feedback(message_id, label)
+        if message is None:
+            return None, None
+
+        self._update_tiers(message_id, message, label)
+        if notify and self.on_applied is not None:
+            self.on_applied(message_id, message, label)
+
+        job_id = None
+        if label == 'REANALYZE':
+            job_id = self.storage.enqueue_reanalysis(message_id, hint)
+            if notify and self.on_reanalysis is not None:
+                self.on_reanalysis(job_id)
+        return message, job_id
+
+    def _update_tiers(self, message_id: str, message: Dict, label: str) -> None:
+        classification = FEEDBACK_CLASSIFICATION.get(label)
+        # A rejected or disputed verdict must not be served again
+        if label == 'REANALYZE' or (classification is not None
+                                    and classification != message['classification']):
+            # Content is gone once retention has redacted the message
+            if self.verdict_cache is not None and message['content'] is not None:
+                self.verdict_cache.invalidate(message['content'])
+            if self.near_duplicates is not None:
+                self.near_duplicates.invalidate(message_id, message['content'])
+
+        # The admin's verdict is safe to reuse for exact and near reposts
+        if classification is not None and message['content'] is not None:
+            if self.verdict_cache is not None:
+                self.verdict_cache.put(message['content'], classification,
+                                       FEEDBACK_CONFIDENCE, FEEDBACK_REASONING[label])
+            if self.near_duplicates is not None:
+                self.near_duplicates.add(message_id, message['content'], classification,
+                                         FEEDBACK_CONFIDENCE, FEEDBACK_REASONING[label])
+
+        # Learn from the admin's label
+        if self.local_classifier is not None and message['content'] is not None:
+            self.local_classifier.apply_feedback(message, label)
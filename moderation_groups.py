@@ -0,0 +1,141 @@
+"""
+Several WhatsApp groups moderated by one process.
+
+Each group gets its own ModerationAgent: its prompt variant and rules
+text, golden-rule keywords, auto-delete threshold and database shard.
+What costs money or warm-up is shared: the Groq client, the rate-limit
+scheduler (fair between groups, see llm_scheduler), the circuit breaker
+and the metrics. Groups whose prompts are identical also share a verdict
+cache, since the LLM gives them the same answer for the same text; the
+cache lives in the first such group's database.
+"""
+from typing import Dict, List, Optional
+
+from circuit_breaker import CircuitBreaker
+from group_config import GroupConfig, verdict_cache_db
+from llm_moderation_agent import DEFAULT_LLM_TIMEOUT_S, ModerationAgent
+from llm_scheduler import DEFAULT_REQUESTS_PER_MINUTE, LLMScheduler
+from moderation_metrics import ModerationMetrics
+from moderation_prompts import CompiledPrompt
+from moderation_storage import get_storage
+from verdict_cache import VerdictCache
+
+
+class ModerationGroups:
+    """One agent per group over a shared LLM client, scheduler and breaker"""
+
+    def __init__(self, groq_api_key: str, groups: List[GroupConfig], llm=None,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: Optional[float] = None, burst: Optional[float] = None,
+                 use_scheduler: bool = True,
+                 use_circuit_breaker: bool = True,
+                 llm_timeout_s: Optional[float] = DEFAULT_LLM_TIMEOUT_S,
+                 use_cache: bool = True, **agent_options):
+        if not groups:
+            raise ValueError("At least one group is required")
+
+        self.configs: Dict[str, GroupConfig] = {g.group_id: g for g in groups}
+        self.default_group_id = groups[0].group_id
+        self.metrics = ModerationMetrics()
+        self.scheduler = LLMScheduler(
+            requests_per_minute, tokens_per_minute, burst, metrics=self.metrics,
+            weights={g.group_id: g.weight for g in groups}) if use_scheduler else None
+        self.breaker = CircuitBreaker(metrics=self.metrics) if use_circuit_breaker else None
+
+        caches: Dict[str, VerdictCache] = {}
+        self.agents: Dict[str, ModerationAgent] = {}
+        for config in groups:
+            storage = get_storage(config.db_path)
+            storage.setup_schema()
+            cache = None
+            if use_cache:
+                cache_db = verdict_cache_db(groups, config)
+                if cache_db not in caches:
+                    caches[cache_db] = VerdictCache(get_storage(cache_db))
+                cache = caches[cache_db]
+
+            options = dict(agent_options)
+            if config.delete_confidence is not None:
+                options['delete_confidence'] = config.delete_confidence
+            agent = ModerationAgent(
+                groq_api_key, db_path=config.db_path, storage=storage, llm=llm,
+                prompt=CompiledPrompt(config.prompt_config()),
+                rule_engine=config.rule_engine(), use_rules=config.use_rules,
+                verdict_cache=cache, use_cache=use_cache, metrics=self.metrics,
+                llm_scheduler=self.scheduler, use_scheduler=use_scheduler,
+                circuit_breaker=self.breaker, use_circuit_breaker=use_circuit_breaker,
+                llm_timeout_s=llm_timeout_s, group_id=config.group_id, **options)
+            # The first group's client serves every group
+            llm = agent.llm
+            self.agents[config.group_id] = agent
+
+    @property
+    def llm(self):
+        return self.agents[self.default_group_id].llm
+
+    @llm.setter
+    def llm(self, llm) -> None:
+        for agent in self.agents.values():
+            agent.llm = llm
+
+    def agent(self, group_id: Optional[str] = None) -> ModerationAgent:
+        """Agent of a group; the default (first) group when group_id is empty"""
+        agent = self.agents.get(group_id or self.default_group_id)
+        if agent is None:
+            raise ValueError(f"Unknown group: {group_id}")
+        return agent
+
+    def process_message(self, group_id: Optional[str], message_id: str, user_id: str,
+                        content: str, **kwargs) -> Dict:
+        """Moderate a message with its group's rules"""
+        return self.agent(group_id).process_message(message_id, user_id, content, **kwargs)
+
+    def process_feedback_batch(self, items: List[Dict]) -> Dict:
+        """Admin reactions ({group_id, message_id, reaction, hint}), one transaction per group"""
+        by_group: Dict[str, List[Dict]] = {}
+        for item in items:
+            group_id = item.get('group_id') or self.default_group_id
+            self.agent(group_id)  # Unknown group - reject the batch before applying any of it
+            by_group.setdefault(group_id, []).append(item)
+
+        summary = {'processed': 0, 'unknown_messages': [], 'reanalysis_jobs': []}
+        for group_id, group_items in by_group.items():
+            result = self.agent(group_id).process_feedback_batch(group_items)
+            summary['processed'] += result['processed']
+            summary['unknown_messages'].extend(result['unknown_messages'])
+            summary['reanalysis_jobs'].extend(result['reanalysis_jobs'])
+        return summary
+
+    def take_reanalysis_results(self, limit: int = 100) -> List[Dict]:
+        """Finished 🔄 jobs of every group, each tagged with its group_id"""
+        results = []
+        for group_id, agent in self.agents.items():
+            if len(results) >= limit:
+                break
+            for job in agent.storage.take_reanalysis_results(limit - len(results)):
+                job['group_id'] = group_id
+                results.append(job)
+        return results
+
+    def get_stats(self) -> Dict:
+        """Per-group statistics plus the shared LLM components"""
+        result = {'groups': {}}
+        for group_id, agent in self.agents.items():
+            stats = agent.get_stats()
+            # Shared - reported once below
+            for key in ('metrics', 'llm_scheduler', 'circuit_breaker'):
+                stats.pop(key, None)
+            result['groups'][group_id] = stats
+        result['metrics'] = self.metrics.snapshot()
+        if self.scheduler is not None:
+            result['llm_scheduler'] = self.scheduler.stats()
+        if self.breaker is not None:
+            result['circuit_breaker'] = self.breaker.stats()
+        return result
+
+    def close(self) -> None:
+        """Flush every group's pending writes, then stop the shared scheduler"""
+        for agent in self.agents.values():
+            agent.close()
+        if self.scheduler is not None:
+            self.scheduler.close()
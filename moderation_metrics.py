@@ -0,0 +1,307 @@
+"""
+In-process metrics for the moderation workflow.
+
+Per-node and per-stage latency histograms (LLM request, response parsing,
+database save) plus counters for verdict sources, LLM errors, fallback
+parsing, the hit rates of each tier in front of the LLM and the state of
+the LLM circuit breaker. Exposed as a
+Prometheus text snapshot and as a JSON document, which JsonMetricsExporter
+writes to disk periodically so the bot's hot path can be watched without
+attaching a profiler.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Seconds - covers in-memory nodes (sub-millisecond) through slow Groq calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_EXPORT_INTERVAL_S = 15.0
+CIRCUIT_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+# Parse paths of single-message responses; batch replies are parsed elsewhere
+SINGLE_PARSE_PATHS = ('json', 'early_stop', 'fallback')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum_s': round(self.sum, 6),
+            'avg_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1000,
+            'p95_ms': self.quantile(0.95) * 1000,
+            'p99_ms': self.quantile(0.99) * 1000,
+        }
+
+
+def _hit_rate(counts: Dict[str, int]) -> Optional[float]:
+    total = counts.get('hit', 0) + counts.get('miss', 0)
+    return counts.get('hit', 0) / total if total else None
+
+
+class ModerationMetrics:
+    """Thread-safe registry of the workflow's histograms and counters"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+        self.node_seconds: Dict[str, Histogram] = {}
+        self.stage_seconds: Dict[str, Histogram] = {}
+        self.llm_seconds = Histogram(buckets)
+
+        self.messages: Dict[str, int] = {}       # by verdict source
+        self.llm_errors: Dict[str, int] = {}     # by exception type
+        self.llm_responses: Dict[str, int] = {}  # parse path ('json', 'early_stop', 'fallback', 'batch'...)
+        self.llm_retries: Dict[str, int] = {}    # 'rate_limit' or 'transient'
+        self.llm_batches: Dict[str, int] = {}    # micro-batch calls by size
+        self.rule_checks: Dict[str, int] = {}    # 'hit' or 'miss'
+        self.cache_lookups: Dict[str, int] = {}  # 'hit' or 'miss'
+        self.near_duplicates: Dict[str, int] = {}  # 'hit' or 'miss'
+        self.local_checks: Dict[str, int] = {}   # 'hit' or 'miss'
+        self.degraded: Dict[str, int] = {}       # by reason the LLM was skipped
+        self.circuit_transitions: Dict[str, int] = {}  # by new breaker state
+        self.circuit_state = 'closed'
+
+    def _observe(self, family: Dict[str, Histogram], name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = family.get(name)
+            if histogram is None:
+                histogram = family[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def _inc(self, family: Dict[str, int], label: str) -> None:
+        with self._lock:
+            family[label] = family.get(label, 0) + 1
+
+    def observe_node(self, node: str, seconds: float) -> None:
+        self._observe(self.node_seconds, node, seconds)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        self._observe(self.stage_seconds, stage, seconds)
+
+    def observe_llm(self, seconds: float) -> None:
+        with self._lock:
+            self.llm_seconds.observe(seconds)
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+
+    def count_message(self, source: str) -> None:
+        self._inc(self.messages, source or 'unknown')
+
+    def count_llm_error(self, error: BaseException) -> None:
+        self._inc(self.llm_errors, type(error).__name__)
+
+    def count_llm_retry(self, reason: str) -> None:
+        self._inc(self.llm_retries, reason)
+
+    def count_llm_response(self, parse: str) -> None:
+        self._inc(self.llm_responses, parse)
+
+    def count_llm_batch(self, size: int) -> None:
+        self._inc(self.llm_batches, str(size))
+
+    def count_rule_check(self, hit: bool) -> None:
+        self._inc(self.rule_checks, 'hit' if hit else 'miss')
+
+    def count_cache_lookup(self, hit: bool) -> None:
+        self._inc(self.cache_lookups, 'hit' if hit else 'miss')
+
+    def count_near_duplicate(self, hit: bool) -> None:
+        self._inc(self.near_duplicates, 'hit' if hit else 'miss')
+
+    def count_local_check(self, hit: bool) -> None:
+        self._inc(self.local_checks, 'hit' if hit else 'miss')
+
+    def count_degraded(self, reason: str) -> None:
+        self._inc(self.degraded, reason)
+
+    def set_circuit_state(self, state: str) -> None:
+        with self._lock:
+            if state != self.circuit_state:
+                self.circuit_transitions[state] = self.circuit_transitions.get(state, 0) + 1
+            self.circuit_state = state
+
+    def snapshot(self) -> Dict:
+        """JSON-friendly view of all metrics"""
+        with self._lock:
+            # Errors and timeouts return no response to parse
+            parsed = sum(self.llm_responses.get(path, 0) for path in SINGLE_PARSE_PATHS)
+            fallback = self.llm_responses.get('fallback', 0)
+            return {
+                'timestamp': time.time(),
+                'uptime_s': round(time.time() - self.started, 1),
+                'nodes': {name: h.summary() for name, h in self.node_seconds.items()},
+                'stages': {name: h.summary() for name, h in self.stage_seconds.items()},
+                'llm_request': self.llm_seconds.summary(),
+                'messages': dict(self.messages),
+                'llm_errors': dict(self.llm_errors),
+                'llm_responses': dict(self.llm_responses),
+                'llm_retries': dict(self.llm_retries),
+                'llm_batches': dict(self.llm_batches),
+                'fallback_parse_rate': fallback / parsed if parsed else None,
+                'rule_checks': dict(self.rule_checks),
+                'rule_hit_rate': _hit_rate(self.rule_checks),
+                'cache_lookups': dict(self.cache_lookups),
+                'cache_hit_rate': _hit_rate(self.cache_lookups),
+                'near_duplicates': dict(self.near_duplicates),
+                'near_duplicate_hit_rate': _hit_rate(self.near_duplicates),
+                'local_checks': dict(self.local_checks),
+                'local_hit_rate': _hit_rate(self.local_checks),
+                'degraded': dict(self.degraded),
+                'circuit_state': self.circuit_state,
+                'circuit_transitions': dict(self.circuit_transitions),
+            }
+
+    def _histogram_lines(self, name: str, label: Optional[str], value: Optional[str],
+                         histogram: Histogram) -> List[str]:
+        prefix = f'{label}="{value}",' if label else ''
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, histogram.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+        suffix = f'{{{label}="{value}"}}' if label else ''
+        lines.append(f'{name}_sum{suffix} {histogram.sum}')
+        lines.append(f'{name}_count{suffix} {histogram.count}')
+        return lines
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+
+        def histogram_family(name: str, help_text: str, label: str,
+                             family: Dict[str, Histogram]) -> None:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for value, histogram in sorted(family.items()):
+                lines.extend(self._histogram_lines(name, label, value, histogram))
+
+        def counter_family(name: str, help_text: str, label: str, family: Dict[str, int]) -> None:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for value, count in sorted(family.items()):
+                lines.append(f'{name}{{{label}="{value}"}} {count}')
+
+        with self._lock:
+            histogram_family('moderation_node_duration_seconds',
+                             'Time spent in each workflow node', 'node', self.node_seconds)
+            histogram_family('moderation_stage_duration_seconds',
+                             'Time spent in sub-steps (llm_queue, parse, save)', 'stage',
+                             self.stage_seconds)
+            lines.append('# HELP moderation_llm_request_duration_seconds LLM call latency')
+            lines.append('# TYPE moderation_llm_request_duration_seconds histogram')
+            lines.extend(self._histogram_lines('moderation_llm_request_duration_seconds',
+                                               None, None, self.llm_seconds))
+            counter_family('moderation_messages_total',
+                           'Moderated messages by verdict source', 'source', self.messages)
+            counter_family('moderation_llm_errors_total',
+                           'LLM call or parse failures by exception type', 'error', self.llm_errors)
+            counter_family('moderation_llm_retries_total',
+                           'LLM call retries by reason', 'reason', self.llm_retries)
+            counter_family('moderation_llm_batches_total',
+                           'Micro-batched LLM calls by batch size', 'size', self.llm_batches)
+            counter_family('moderation_llm_responses_total',
+                           'LLM responses by parse path', 'parse', self.llm_responses)
+            counter_family('moderation_rule_checks_total',
+                           'Rule engine lookups', 'result', self.rule_checks)
+            counter_family('moderation_cache_lookups_total',
+                           'Verdict cache lookups', 'result', self.cache_lookups)
+            counter_family('moderation_near_duplicate_lookups_total',
+                           'Near-duplicate index lookups', 'result', self.near_duplicates)
+            counter_family('moderation_local_checks_total',
+                           'Local classifier verdicts (hit) and escalations (miss)',
+                           'result', self.local_checks)
+            counter_family('moderation_degraded_total',
+                           'Messages decided without the LLM, by reason', 'reason', self.degraded)
+            counter_family('moderation_circuit_transitions_total',
+                           'LLM circuit breaker state changes', 'state',
+                           self.circuit_transitions)
+            lines.append('# HELP moderation_circuit_state LLM circuit breaker state '
+                         '(0 closed, 1 half-open, 2 open)')
+            lines.append('# TYPE moderation_circuit_state gauge')
+            lines.append('moderation_circuit_state '
+                         f'{CIRCUIT_STATE_VALUES.get(self.circuit_state, 0)}')
+
+        return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path: str, data: str) -> None:
+    """Readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class JsonMetricsExporter:
+    """Background thread writing metrics snapshots to disk"""
+
+    def __init__(self, metrics: ModerationMetrics, json_path: Optional[str] = None,
+                 prom_path: Optional[str] = None,
+                 interval_s: float = DEFAULT_EXPORT_INTERVAL_S):
+        self.metrics = metrics
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+        self._thread.start()
+
+    def export(self) -> None:
+        """Write one snapshot now"""
+        try:
+            if self.json_path:
+                _write_atomic(self.json_path, json.dumps(self.metrics.snapshot(), indent=2))
+            if self.prom_path:
+                _write_atomic(self.prom_path, self.metrics.prometheus_text())
+        except OSError as e:
+            print(f"Metrics export failed: {e}", file=sys.stderr)
+
+    def close(self) -> None:
+        """Stop the thread after a final snapshot"""
+        self._stop.set()
+        self._thread.join()
+        self.export()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.export()
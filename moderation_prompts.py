@@ -0,0 +1,208 @@
+"""
+Versioned prompt artifacts and token accounting for the LLM node.
+
+The analysis prompt is assembled from a versioned artifact (group rules,
+golden rules, examples, notes, output format) and compiled once per agent.
+Artifacts can be overridden with a JSON file holding the same keys, so the
+static prefix can be trimmed or A/B tested without touching code.
+The same prefix also serves micro-batches: several messages in one prompt,
+answered with a JSON array. Extra context (message type, forwarded flag,
+quoted message, an admin's re-analysis hint) goes just before the message.
+"""
+import json
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_PROMPT_VERSION = "v1"
+
+# Rough Hebrew-heavy text ratio, used only when the provider reports no usage
+CHARS_PER_TOKEN = 3.0
+
+PROMPTS: Dict[str, Dict] = {
+    "v1": {
+        "version": "v1",
+        "group_rules": """
+תקנון קבוצת אורות ברזל:
+1. אין לפרסם מספרי טלפון של חיילים בשטח
+2. אין לפרסם מיקומים מדויקים או קואורדינטות
+3. אין לפרסם מספרי יחידות עם פרטים מבצעיים
+4. שימוש בשפה נאותה
+5. בדיקת בקשות תרומה לפני מתן כסף
+6. זהירות עם תוכן מדיה מהשטח
+""",
+        "preamble": """
+אתה סוכן חמ"ל לקבוצת התנדבות "אורות ברזל".""",
+        "golden_rules": """1. מספר טלפון + שם אישי (לימור, עומרי, יפה) = מתנדב = APPROVED
+2. "כפר עזה" = יישוב בישראל = APPROVED  
+3. "עזה" בלבד = מעורפל = CONTEXT_DEPENDENT
+4. קואורדינטות GPS = CLEAR_VIOLATION
+5. בקשת עזרה לגיטימית = APPROVED""",
+        "examples": """✅ APPROVED:
+"מחפשת 100 כריכים - לימור 052-1234567" → טלפון מתנדב לימור
+"15 לוחמים בכפר עזה צריכים ציוד - עומרי 058-1234567" → כפר עזה בטוח + עומרי מתנדב
+"תודה לכל המתנדבים!"
+
+⚠️ CONTEXT_DEPENDENT:  
+"חיילים בעזה צריכים עזרה" → איזה עזה? רצועה או כפר?
+
+🚫 CLEAR_VIOLATION - מחק מיד:
+"גדוד 202 בקואורדינטות 31.5°N - טלפון מפקד 050-1234567" → קואורדינטות GPS + מספר גדוד = מסוכן מאוד!
+"חיילי יחידה 8200 במשימה בשעה 06:00" → פרטי משימה""",
+        "notes": """חשוב: קואורדינטות GPS (°N, °E) + מספר גדוד = תמיד CLEAR_VIOLATION!
+
+חשוב: 
+- שם אישי + טלפון = מתנדב = בסדר!
+- כפר עזה = מקום בישראל = בסדר!""",
+        "output_format": """JSON בלבד:
+{
+  "classification": "APPROVED או CONTEXT_DEPENDENT או CLEAR_VIOLATION", 
+  "confidence": 0.0-1.0,
+  "reasoning": "הסבר קצר"
+}""",
+        "batch_output_format": """JSON בלבד - מערך עם פריט אחד לכל הודעה, לפי המספר שלה:
+[
+  {"message_id": "מספר ההודעה", "classification": "APPROVED או CONTEXT_DEPENDENT או CLEAR_VIOLATION", "confidence": 0.0-1.0, "reasoning": "הסבר קצר"}
+]""",
+        # v1 never showed the user's history to the model
+        "include_history": False,
+        # ...nor the group's rules text (the golden rules cover it)
+        "include_group_rules": False,
+    },
+}
+
+ARTIFACT_KEYS = ("group_rules", "preamble", "golden_rules", "examples", "notes", "output_format",
+                 "batch_output_format")
+
+
+def load_prompt_config(version: str = DEFAULT_PROMPT_VERSION, path: Optional[str] = None) -> Dict:
+    """Prompt artifact by version, optionally overridden by a JSON file"""
+    if version not in PROMPTS:
+        raise ValueError(f"Unknown prompt version: {version}")
+    config = dict(PROMPTS[version])
+
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(ARTIFACT_KEYS) - {
+            "version", "include_history", "include_group_rules"}
+        if unknown:
+            raise ValueError(f"Unknown prompt keys: {', '.join(sorted(unknown))}")
+        config.update(overrides)
+        config.setdefault("version", f"{version}+{path}")
+
+    return config
+
+
+def _escape(text: str) -> str:
+    """Escape literal braces for ChatPromptTemplate"""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def estimate_tokens(text: str) -> int:
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+class CompiledPrompt:
+    """Analysis prompt compiled once from an artifact"""
+
+    def __init__(self, config: Dict):
+        from langchain_core.prompts import ChatPromptTemplate
+
+        self.version = config["version"]
+        self.group_rules = config["group_rules"]
+        self.include_history = bool(config.get("include_history", False))
+
+        # Groups with their own rules text show it right after the preamble
+        group_rules = ("\n\n" + self.group_rules.strip()) \
+            if config.get("include_group_rules") else ""
+        self.static_prefix = (
+            config["preamble"] + group_rules
+            + "\n\nכללי הזהב:\n\n" + config["golden_rules"]
+            + "\n\nדוגמאות:\n\n" + config["examples"]
+            + "\n\n" + config["notes"]
+            + "\n\n"
+        )
+        template = _escape(self.static_prefix)
+        if self.include_history:
+            template += "{user_history}\n\n"
+        # Message form, quoted message and admin hint - empty for plain text
+        template += "{context}"
+        template += 'הודעה לבדיקה: "{message_content}"\n\n' + _escape(config["output_format"])
+
+        self.template = ChatPromptTemplate.from_template(template)
+        self.batch_output_format = config["batch_output_format"]
+        self.static_chars = len(self.static_prefix) + len(config["output_format"])
+        self.static_tokens_estimate = estimate_tokens(self.static_prefix + config["output_format"])
+
+    def format_messages(self, message_content: str, user_history: str = "",
+                        context: str = "") -> List:
+        context_text = context + "\n\n" if context else ""
+        if self.include_history:
+            return self.template.format_messages(message_content=message_content,
+                                                 user_history=user_history,
+                                                 context=context_text)
+        return self.template.format_messages(message_content=message_content,
+                                             context=context_text)
+
+    def format_batch_messages(self, message_contents: List[str]) -> List:
+        """One prompt for several messages, numbered from 1 (the static prefix is paid once)"""
+        from langchain_core.messages import HumanMessage
+
+        lines = [f"{index}. {json.dumps(content, ensure_ascii=False)}"
+                 for index, content in enumerate(message_contents, start=1)]
+        return [HumanMessage(content=self.static_prefix + "הודעות לבדיקה:\n" + "\n".join(lines)
+                             + "\n\n" + self.batch_output_format)]
+
+
+def extract_usage(response, prompt_text: str) -> Tuple[int, int, bool]:
+    """(prompt tokens, completion tokens, estimated?) for one LLM response"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.get("input_tokens") is not None:
+        return usage["input_tokens"], usage.get("output_tokens", 0), False
+
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage")
+    if token_usage and token_usage.get("prompt_tokens") is not None:
+        return token_usage["prompt_tokens"], token_usage.get("completion_tokens", 0), False
+
+    content = getattr(response, "content", "") or ""
+    return estimate_tokens(prompt_text), estimate_tokens(content), True
+
+
+class TokenUsageTracker:
+    """Running totals of prompt/completion tokens per LLM call"""
+
+    def __init__(self, prompt: CompiledPrompt):
+        self.prompt = prompt
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.messages = 0
+        self.estimated_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, prompt_tokens: int, completion_tokens: int, estimated: bool,
+               messages: int = 1) -> None:
+        with self._lock:
+            self.calls += 1
+            self.messages += messages
+            self.estimated_calls += int(estimated)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls = self.calls or 1
+            return {
+                'prompt_version': self.prompt.version,
+                'calls': self.calls,
+                'messages': self.messages,
+                'estimated_calls': self.estimated_calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'avg_prompt_tokens': self.prompt_tokens / calls,
+                'avg_completion_tokens': self.completion_tokens / calls,
+                'avg_prompt_tokens_per_message': self.prompt_tokens / (self.messages or 1),
+                'static_prefix_chars': self.prompt.static_chars,
+                'static_prefix_tokens_estimate': self.prompt.static_tokens_estimate,
+            }
@@ -0,0 +1,347 @@
+# moderation_server.py
+"""
+Long-lived moderation daemon.
+
+Keeps warm ModerationAgents (LLM client, compiled workflow, database) -
+one per moderated group, see group_config - and serves requests as JSON
+lines, either over stdin/stdout or over a Unix socket. A request's
+group_id picks the group; without one the first group answers. Requests
+are handled in parallel by a thread pool and every reply carries the
+request's message_id so the caller can correlate them. With --processes,
+messages are moderated by a fleet of worker processes (see worker_fleet)
+and this process keeps feedback, re-analysis and retention.
+Admin reactions arrive in batches (op "feedback"); 🔄 re-analysis jobs are
+served in the background and collected with op "reanalysis_results".
+Old messages are redacted and archived by a periodic retention pass.
+
+Usage:
+    python moderation_server.py                      # JSON lines on stdin/stdout
+    python moderation_server.py --socket /tmp/mod.sock
+    python moderation_server.py --groups groups.json  # several groups, one process
+    python moderation_server.py --write-behind       # batched background saves
+    python moderation_server.py --metrics-file metrics.json --metrics-prom metrics.prom
+    python moderation_server.py --reanalysis-workers 4  # 🔄 re-analysis threads
+    python moderation_server.py --redact-after-days 14  # shorter retention window
+    python moderation_server.py --processes 4        # moderate on 4 worker processes
+"""
+import argparse
+import functools
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from group_config import DEFAULT_GROUP_ID, GroupConfig, load_groups
+from llm_moderation_agent import DEFAULT_LLM_TIMEOUT_S
+from llm_scheduler import DEFAULT_REQUESTS_PER_MINUTE
+from micro_batcher import DEFAULT_WINDOW_MS
+from moderation_metrics import DEFAULT_EXPORT_INTERVAL_S, JsonMetricsExporter
+from moderation_groups import ModerationGroups
+from moderation_prompts import DEFAULT_PROMPT_VERSION
+from reanalysis_worker import DEFAULT_WORKERS as DEFAULT_REANALYSIS_WORKERS, ReanalysisWorkers
+from retention import (
+    DEFAULT_ARCHIVE_AFTER_DAYS, DEFAULT_INTERVAL_S as DEFAULT_RETENTION_INTERVAL_S,
+    DEFAULT_REDACT_AFTER_DAYS, RetentionManager
+)
+from worker_fleet import DEFAULT_STARTUP_TIMEOUT_S, WorkerFleet
+
+DEFAULT_WORKERS = 8
+
+# Reply this long before the caller's timeout so the answer still arrives
+DEADLINE_MARGIN_S = 0.5
+
+
+def error_response(message_id: str, error: str) -> Dict:
+    """Safe fallback reply, same shape as moderation_api.py errors"""
+    return {
+        "error": error,
+        "message_id": message_id,
+        "classification": "CONTEXT_DEPENDENT",
+        "confidence": 0.0,
+        "action": "FLAG_FOR_REVIEW",
+        "reasoning": f"Python processing error: {error}"
+    }
+
+
+class ModerationServer:
+    """Dispatches JSON requests to the agent of the request's group"""
+
+    def __init__(self, groups: ModerationGroups, max_workers: int = DEFAULT_WORKERS,
+                 exporter: Optional[JsonMetricsExporter] = None,
+                 reanalysis: Optional[ReanalysisWorkers] = None,
+                 retention: Optional[List[RetentionManager]] = None,
+                 fleet: Optional[WorkerFleet] = None):
+        self.groups = groups
+        self.exporter = exporter
+        self.reanalysis = reanalysis
+        self.retention = retention or []
+        self.fleet = fleet
+        if reanalysis is not None:
+            for agent in groups.agents.values():
+                agent.feedback.on_reanalysis = reanalysis.wake
+        if fleet is not None:
+            # Feedback is applied here; the workers' tiers replay it
+            for group_id, agent in groups.agents.items():
+                agent.feedback.on_applied = functools.partial(fleet.forward_feedback, group_id)
+            # ...and the local classifier stored here learns the workers' verdicts
+            fleet.on_result = self._learn_from_worker
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="moderation")
+
+    def _learn_from_worker(self, request: Dict, result: Dict) -> None:
+        self.groups.agent(request.get('group_id')).learn_verdict(
+            request['content'], result, request.get('envelope'))
+
+    def handle_request(self, request: Dict, received: Optional[float] = None) -> Dict:
+        """Handle one decoded request and return the reply.
+
+        received is the time.monotonic() the request line arrived; with the
+        request's timeout_ms it sets the deadline for the LLM call.
+        """
+        op = request.get("op", "moderate")
+        message_id = str(request.get("message_id", ""))
+
+        try:
+            if op == "ping":
+                return {"op": "pong", "message_id": message_id}
+
+            if op == "metrics":
+                response = {"op": op, "message_id": message_id,
+                            "metrics": self.groups.metrics.snapshot(),
+                            "prometheus": self.groups.metrics.prometheus_text()}
+                if self.fleet is not None:
+                    response["fleet"] = self.fleet.stats()
+                return response
+
+            if op == "feedback":
+                items = request.get("items")
+                if not isinstance(items, list) or \
+                        not all(isinstance(i, dict) and "message_id" in i and "reaction" in i
+                                for i in items):
+                    raise ValueError("Expected: items [{message_id reaction hint group_id}]")
+                result = self.groups.process_feedback_batch(items)
+                result.update({"op": op, "message_id": message_id})
+                return result
+
+            if op == "reanalysis_results":
+                return {"op": op, "message_id": message_id,
+                        "results": self.groups.take_reanalysis_results(
+                            int(request.get("limit", 100)))}
+
+            if op == "moderate":
+                if not message_id or "user_id" not in request or "content" not in request:
+                    raise ValueError("Expected: message_id user_id content [envelope]")
+                deadline = None
+                if request.get("timeout_ms"):
+                    deadline = ((received or time.monotonic())
+                                + float(request["timeout_ms"]) / 1000 - DEADLINE_MARGIN_S)
+                moderator = self.fleet or self.groups
+                result = moderator.process_message(
+                    request.get("group_id"), message_id,
+                    str(request["user_id"]), str(request["content"]),
+                    durable=bool(request.get("durable", False)), deadline=deadline,
+                    envelope=request.get("envelope")
+                )
+                result["op"] = op
+                return result
+
+            raise ValueError(f"Unknown op: {op}")
+
+        except Exception as e:
+            response = error_response(message_id, str(e))
+            response["op"] = op
+            return response
+
+    def handle_line(self, line: str, reply) -> None:
+        """Decode a request line and reply asynchronously from the pool"""
+        line = line.strip()
+        if not line:
+            return
+
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+        except ValueError as e:
+            reply(error_response("", f"Invalid request: {e}"))
+            return
+
+        future = self.executor.submit(self.handle_request, request, time.monotonic())
+        future.add_done_callback(lambda f: reply(f.result()))
+
+    def serve_stdio(self, stdin=sys.stdin, stdout=sys.stdout) -> None:
+        """Serve JSON lines on stdin/stdout until stdin closes"""
+        write_lock = threading.Lock()
+
+        def reply(response: Dict) -> None:
+            data = json.dumps(response, ensure_ascii=False)
+            with write_lock:
+                stdout.write(data + "\n")
+                stdout.flush()
+
+        for line in stdin:
+            self.handle_line(line, reply)
+
+        self.shutdown()
+
+    def serve_socket(self, socket_path: str) -> None:
+        """Serve JSON lines on a Unix socket, one thread per connection"""
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                write_lock = threading.Lock()
+
+                def reply(response: Dict) -> None:
+                    data = (json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8")
+                    with write_lock:
+                        try:
+                            self.wfile.write(data)
+                            self.wfile.flush()
+                        except OSError:
+                            pass  # Client went away
+
+                for raw in self.rfile:
+                    server.handle_line(raw.decode("utf-8", errors="replace"), reply)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as unix_server:
+            unix_server.daemon_threads = True
+            try:
+                unix_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self.shutdown()
+                if os.path.exists(socket_path):
+                    os.unlink(socket_path)
+
+    def shutdown(self) -> None:
+        """Wait for in-flight requests to finish, then flush pending writes"""
+        self.executor.shutdown(wait=True)
+        if self.fleet is not None:
+            self.fleet.close()
+        for retention in self.retention:
+            retention.close()
+        if self.reanalysis is not None:
+            self.reanalysis.close()
+        self.groups.close()
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+def main():
+    """Start the moderation daemon"""
+    parser = argparse.ArgumentParser(description="Persistent moderation server")
+    parser.add_argument("--socket", help="Serve on this Unix socket instead of stdin/stdout")
+    parser.add_argument("--db", default="whatsapp_moderation.db", help="Database path")
+    parser.add_argument("--groups", help="groups.json with per-group rules and databases "
+                                         "(overrides --db, --prompt-version and --prompt-file)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of requests handled in parallel (per process)")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Moderate on this many worker processes (0 = in this process)")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="Save results from a background batch writer")
+    parser.add_argument("--prompt-version", default=DEFAULT_PROMPT_VERSION,
+                        help="Prompt artifact version")
+    parser.add_argument("--prompt-file", help="JSON file overriding prompt artifact fields")
+    parser.add_argument("--groq-rpm", type=float, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help="Groq requests-per-minute quota")
+    parser.add_argument("--groq-tpm", type=float, help="Groq tokens-per-minute quota")
+    parser.add_argument("--llm-timeout", type=float, default=DEFAULT_LLM_TIMEOUT_S,
+                        help="Seconds before a single Groq call is abandoned")
+    parser.add_argument("--no-circuit-breaker", action="store_true",
+                        help="Always call the LLM, even while it keeps failing")
+    parser.add_argument("--micro-batch", type=int, default=1,
+                        help="Up to this many messages per LLM call (1 = one call per message)")
+    parser.add_argument("--micro-batch-window-ms", type=float, default=DEFAULT_WINDOW_MS,
+                        help="How long the first message of a batch waits for company")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream LLM output and stop as soon as a deletion is certain")
+    parser.add_argument("--reanalysis-workers", type=int, default=DEFAULT_REANALYSIS_WORKERS,
+                        help="Background threads re-analysing 🔄 messages (0 = off)")
+    parser.add_argument("--redact-after-days", type=float, default=DEFAULT_REDACT_AFTER_DAYS,
+                        help="Drop message content after this many days (0 = keep)")
+    parser.add_argument("--archive-after-days", type=float, default=DEFAULT_ARCHIVE_AFTER_DAYS,
+                        help="Move messages to the archive after this many days (0 = never)")
+    parser.add_argument("--retention-interval", type=float, default=DEFAULT_RETENTION_INTERVAL_S,
+                        help="Seconds between retention passes (0 = off)")
+    parser.add_argument("--metrics-file", help="Periodically write a JSON metrics snapshot here")
+    parser.add_argument("--metrics-prom", help="Periodically write Prometheus text metrics here")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_EXPORT_INTERVAL_S,
+                        help="Seconds between metrics snapshots")
+    args = parser.parse_args()
+
+    groq_api_key = os.getenv('GROQ_API_KEY')
+    if not groq_api_key:
+        print("GROQ_API_KEY not found in environment variables", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        configs = load_groups(args.groups) if args.groups else [
+            GroupConfig(DEFAULT_GROUP_ID, db_path=args.db, prompt_version=args.prompt_version,
+                        prompt_file=args.prompt_file)]
+    except (OSError, ValueError) as e:
+        print(f"Invalid groups file: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Every process has its own scheduler, so each gets an equal share of the quota
+    processes = max(0, args.processes)
+    options = dict(write_behind=args.write_behind,
+                   requests_per_minute=args.groq_rpm / (processes + 1),
+                   tokens_per_minute=args.groq_tpm / (processes + 1) if args.groq_tpm else None,
+                   llm_timeout_s=args.llm_timeout,
+                   use_circuit_breaker=not args.no_circuit_breaker,
+                   micro_batch_size=args.micro_batch,
+                   micro_batch_window_ms=args.micro_batch_window_ms,
+                   streaming=args.stream)
+    groups = ModerationGroups(groq_api_key, configs, **options)
+    fleet = None
+    if processes:
+        fleet = WorkerFleet(groq_api_key, configs, processes=processes, threads=args.workers,
+                            **options)
+        if not fleet.wait_ready(DEFAULT_STARTUP_TIMEOUT_S):
+            print("Worker processes did not start in time", file=sys.stderr)
+    exporter = None
+    if args.metrics_file or args.metrics_prom:
+        exporter = JsonMetricsExporter(groups.metrics, json_path=args.metrics_file,
+                                       prom_path=args.metrics_prom,
+                                       interval_s=args.metrics_interval)
+    # One pool for all groups, taking their queues in turn
+    reanalysis = None
+    if args.reanalysis_workers > 0:
+        reanalysis = ReanalysisWorkers(list(groups.agents.values()),
+                                       workers=args.reanalysis_workers)
+        reanalysis.start()
+    retention = []
+    if args.retention_interval > 0:
+        for agent in groups.agents.values():
+            manager = RetentionManager(agent.storage, redact_after_days=args.redact_after_days,
+                                       archive_after_days=args.archive_after_days,
+                                       verdict_cache=agent.verdict_cache,
+                                       near_duplicates=agent.near_duplicates)
+            manager.start(args.retention_interval)
+            retention.append(manager)
+    # Request threads wait on the workers, so there are enough for every worker's threads
+    server = ModerationServer(groups, max_workers=args.workers * max(1, processes),
+                              exporter=exporter, reanalysis=reanalysis, retention=retention,
+                              fleet=fleet)
+
+    print(f"Moderation server ready ({len(groups.agents)} groups"
+          f"{f', {processes} processes' if processes else ''})", file=sys.stderr, flush=True)
+
+    if args.socket:
+        server.serve_socket(args.socket)
+    else:
+        server.serve_stdio()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1055 @@
+"""
+Shared SQLite storage layer for the moderation bot.
+
+All database access from the agent, the verdict cache, feedback and
+statistics goes through ModerationStorage. Connections are kept open per
+thread (and reopened after fork), so repeated queries reuse sqlite3's
+prepared-statement cache instead of paying for connect + parse each time.
+Every connection runs in WAL mode with a busy timeout, so the bot,
+feedback and stats processes can share the file without
+"database is locked" errors. Old messages can be redacted and moved into
+compressed monthly archive partitions (see retention.py); the rollups keep
+counting them.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUSY_TIMEOUT_MS = 10000
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = [
+    # Only takes effect on a new database (or after one full VACUUM)
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA foreign_keys=ON",
+]
+
+BACKFILL_BATCH_SIZE = 5000
+
+_registry: Dict[str, "ModerationStorage"] = {}
+_registry_lock = threading.Lock()
+
+
+def get_storage(db_path: str) -> "ModerationStorage":
+    """Shared storage instance for a database path (one per process)"""
+    key = os.path.abspath(db_path)
+    with _registry_lock:
+        storage = _registry.get(key)
+        if storage is None:
+            storage = ModerationStorage(db_path)
+            _registry[key] = storage
+        return storage
+
+
+def timestamp_to_epoch(timestamp: str) -> Optional[float]:
+    """ISO timestamp (naive = local time) to epoch seconds"""
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return None
+
+
+def day_key(ts: Optional[float]) -> str:
+    """Local calendar day of an epoch timestamp ('' when unknown)"""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d') if ts is not None else ''
+
+
+def hour_key(ts: Optional[float]) -> str:
+    """Local calendar hour of an epoch timestamp ('' when unknown)"""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H') if ts is not None else ''
+
+
+def day_range(days_ago: int = 0) -> Tuple[float, float]:
+    """Epoch bounds [start, end) of a local calendar day"""
+    start = datetime.combine(datetime.now().date() - timedelta(days=days_ago), datetime.min.time())
+    return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+
+# Schema migrations
+
+def _migration_1_messages(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            content TEXT,
+            timestamp TEXT,
+            classification TEXT,
+            confidence REAL,
+            reasoning TEXT,
+            action TEXT,
+            feedback TEXT
+        )
+    """)
+
+
+def _migration_2_indexed_timestamps(conn: sqlite3.Connection) -> None:
+    # Epoch seconds column - numeric, sortable, range-scannable
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if 'ts' not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN ts REAL")
+
+    # Backfill in Python: stored timestamps are naive local isoformat strings
+    last_rowid = 0
+    while True:
+        rows = conn.execute("""
+            SELECT rowid, timestamp FROM messages
+            WHERE rowid > ? AND ts IS NULL
+            ORDER BY rowid LIMIT ?
+        """, (last_rowid, BACKFILL_BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE messages SET ts = ? WHERE rowid = ?",
+            [(timestamp_to_epoch(row[1]), row[0]) for row in rows]
+        )
+        last_rowid = rows[-1][0]
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages(user_id, ts)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_ts "
+        "ON messages(ts, classification, action, feedback)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_classification "
+        "ON messages(classification, confidence)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_feedback "
+        "ON messages(feedback) WHERE feedback IS NOT NULL"
+    )
+
+
+ROLLUP_TABLES = {
+    # table: (bucket column, SQL expression computing it from messages.ts)
+    'stats_total': (None, None),
+    'stats_daily': ('day', "COALESCE(strftime('%Y-%m-%d', ts, 'unixepoch', 'localtime'), '')"),
+    'stats_hourly': ('hour', "COALESCE(strftime('%Y-%m-%d %H', ts, 'unixepoch', 'localtime'), '')"),
+}
+
+
+def _migration_3_rollups(conn: sqlite3.Connection) -> None:
+    for table, (bucket, _) in ROLLUP_TABLES.items():
+        bucket_column = f"{bucket} TEXT NOT NULL, " if bucket else ""
+        key = f"{bucket}, classification, action" if bucket else "classification, action"
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {bucket_column}
+                classification TEXT NOT NULL,
+                action TEXT NOT NULL,
+                messages INTEGER NOT NULL DEFAULT 0,
+                confidence_sum REAL NOT NULL DEFAULT 0,
+                feedback_total INTEGER NOT NULL DEFAULT 0,
+                feedback_correct INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY ({key})
+            )
+        """)
+    rebuild_rollups(conn)
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """Recompute every rollup table from the messages table and the archive"""
+    for table, (bucket, expression) in ROLLUP_TABLES.items():
+        conn.execute(f"DELETE FROM {table}")
+        bucket_column = f"{bucket}, " if bucket else ""
+        bucket_select = f"{expression} AS {bucket}, " if bucket else ""
+        conn.execute(f"""
+            INSERT INTO {table}
+            ({bucket_column}classification, action, messages, confidence_sum,
+             feedback_total, feedback_correct)
+            SELECT
+                {bucket_select}
+                COALESCE(classification, ''),
+                COALESCE(action, ''),
+                COUNT(*),
+                COALESCE(SUM(confidence), 0),
+                SUM(CASE WHEN feedback IS NOT NULL THEN 1 ELSE 0 END),
+                SUM(CASE WHEN feedback = 'CORRECT' THEN 1 ELSE 0 END)
+            FROM messages
+            GROUP BY {bucket_column}COALESCE(classification, ''), COALESCE(action, '')
+        """)
+
+    # Archived messages still count (the table does not exist before migration 6)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'message_archive'").fetchone():
+        for (chunk_id,) in conn.execute("SELECT id FROM message_archive").fetchall():
+            data = conn.execute("SELECT data FROM message_archive WHERE id = ?",
+                                (chunk_id,)).fetchone()[0]
+            for row in decode_archive(data):
+                total, correct = _feedback_counts(row['feedback'])
+                _apply_rollup_delta(conn, row['ts'], row['classification'], row['action'],
+                                    1, row['confidence'], total, correct)
+
+
+def _apply_rollup_delta(conn: sqlite3.Connection, ts: Optional[float],
+                        classification: Optional[str], action: Optional[str],
+                        messages: int = 0, confidence: float = 0.0,
+                        feedback_total: int = 0, feedback_correct: int = 0) -> None:
+    """Add a delta to the total, daily and hourly rollup rows"""
+    values = (classification or '', action or '', messages, confidence or 0.0,
+              feedback_total, feedback_correct)
+    update = """
+        ON CONFLICT DO UPDATE SET
+            messages = messages + excluded.messages,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            feedback_total = feedback_total + excluded.feedback_total,
+            feedback_correct = feedback_correct + excluded.feedback_correct
+    """
+    conn.execute("""
+        INSERT INTO stats_total
+        (classification, action, messages, confidence_sum, feedback_total, feedback_correct)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """ + update, values)
+    conn.execute("""
+        INSERT INTO stats_daily
+        (day, classification, action, messages, confidence_sum, feedback_total, feedback_correct)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """ + update, (day_key(ts),) + values)
+    conn.execute("""
+        INSERT INTO stats_hourly
+        (hour, classification, action, messages, confidence_sum, feedback_total, feedback_correct)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """ + update, (hour_key(ts),) + values)
+
+
+def _feedback_counts(feedback: Optional[str]) -> Tuple[int, int]:
+    """(counts toward total, counts as correct) for a feedback value"""
+    if feedback is None:
+        return 0, 0
+    return 1, 1 if feedback == 'CORRECT' else 0
+
+
+def _migration_4_verdict_source(conn: sqlite3.Connection) -> None:
+    # Which tier decided (rules, cache, local, llm, llm_error) - NULL for older rows
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if 'verdict_source' not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN verdict_source TEXT")
+
+
+def _migration_5_reanalysis_jobs(conn: sqlite3.Connection) -> None:
+    # Persistent queue of admin re-analysis requests and their outcomes
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reanalysis_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id TEXT NOT NULL,
+            hint TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_ts REAL NOT NULL,
+            available_ts REAL NOT NULL,
+            finished_ts REAL,
+            previous_classification TEXT,
+            previous_action TEXT,
+            classification TEXT,
+            confidence REAL,
+            action TEXT,
+            reasoning TEXT,
+            error TEXT,
+            notified INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reanalysis_pending "
+        "ON reanalysis_jobs(available_ts) WHERE status = 'pending'"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reanalysis_unnotified "
+        "ON reanalysis_jobs(id) WHERE notified = 0 AND status IN ('done', 'failed')"
+    )
+
+
+# Columns kept for an archived message, in archive order
+ARCHIVE_COLUMNS = ('id', 'user_id', 'content', 'timestamp', 'ts', 'classification', 'confidence',
+                   'reasoning', 'action', 'feedback', 'verdict_source')
+
+
+def month_key(ts: Optional[float]) -> str:
+    """Local calendar month of an epoch timestamp - the archive partition"""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m') if ts is not None else ''
+
+
+def encode_archive(rows: List[Dict]) -> Tuple[bytes, int]:
+    """(zlib-compressed JSON lines, uncompressed size)"""
+    text = "\n".join(json.dumps(row, ensure_ascii=False, separators=(',', ':')) for row in rows)
+    raw = text.encode("utf-8")
+    return zlib.compress(raw, 9), len(raw)
+
+
+def decode_archive(data: bytes) -> List[Dict]:
+    text = zlib.decompress(data).decode("utf-8")
+    return [json.loads(line) for line in text.split("\n") if line]
+
+
+def _migration_6_message_archive(conn: sqlite3.Connection) -> None:
+    # Old messages, compressed in chunks and partitioned by month
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            month TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            first_ts REAL,
+            last_ts REAL,
+            raw_bytes INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            created_ts REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_message_archive_month ON message_archive(month)")
+    # Finds content still to be redacted without scanning redacted rows
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_unredacted "
+        "ON messages(ts) WHERE content IS NOT NULL"
+    )
+
+
+def _migration_7_remoderation(conn: sqlite3.Connection) -> None:
+    # Bulk re-moderation runs: checkpoint per run, verdicts beside the live ones
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS remoderation_runs (
+            id TEXT PRIMARY KEY,
+            config TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            max_rowid INTEGER NOT NULL,
+            last_rowid INTEGER NOT NULL DEFAULT 0,
+            created_ts REAL NOT NULL,
+            updated_ts REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS remoderation_results (
+            run_id TEXT NOT NULL,
+            message_id TEXT NOT NULL,
+            old_classification TEXT,
+            old_action TEXT,
+            classification TEXT,
+            confidence REAL,
+            action TEXT,
+            reasoning TEXT,
+            verdict_source TEXT,
+            error TEXT,
+            created_ts REAL NOT NULL,
+            PRIMARY KEY (run_id, message_id)
+        )
+    """)
+
+
+def _migration_8_confirmed_near_duplicates(conn: sqlite3.Connection) -> None:
+    # Unreviewed LLM verdicts used to be indexed; keep the admin-approved ones
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                    "AND name = 'near_duplicate_index'").fetchone() is None:
+        return
+    conn.execute("""
+        DELETE FROM near_duplicate_index
+        WHERE message_id NOT IN (SELECT id FROM messages WHERE feedback = 'CORRECT')
+    """)
+
+
+def _migration_9_admin_near_duplicates(conn: sqlite3.Connection) -> None:
+    # Entries held the stored verdict an admin's ✅ had rejected; feedback refills the index
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                    "AND name = 'near_duplicate_index'").fetchone() is None:
+        return
+    conn.execute("DELETE FROM near_duplicate_index")
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "messages table", _migration_1_messages),
+    (2, "epoch ts column and query indexes", _migration_2_indexed_timestamps),
+    (3, "statistics rollup tables", _migration_3_rollups),
+    (4, "verdict source column", _migration_4_verdict_source),
+    (5, "re-analysis job queue", _migration_5_reanalysis_jobs),
+    (6, "message archive partitions", _migration_6_message_archive),
+    (7, "bulk re-moderation runs and results", _migration_7_remoderation),
+    (8, "near-duplicate index keeps confirmed verdicts only", _migration_8_confirmed_near_duplicates),
+    (9, "near-duplicate index holds admin verdicts", _migration_9_admin_near_duplicates),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+class ModerationStorage:
+    """Per-thread persistent SQLite connections plus the moderation queries"""
+
+    def __init__(self, db_path: str, busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+    # Connection management
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,  # Explicit transactions via transaction()
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Connection owned by the calling thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; nested calls join the outer one"""
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        # IMMEDIATE takes the write lock up front, so concurrent writers
+        # wait on busy_timeout instead of failing on lock upgrade
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        """Run one statement (autocommit unless inside transaction())"""
+        return self.connection().execute(sql, params)
+
+    def fetchone(self, sql: str, params: Tuple = ()) -> Optional[Tuple]:
+        return self.connection().execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        return self.connection().execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        """Close every connection opened by this storage"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    # Schema
+
+    def schema_version(self) -> int:
+        return self.fetchone("PRAGMA user_version")[0]
+
+    def setup_schema(self) -> List[int]:
+        """Apply pending migrations, return the versions applied"""
+        applied = []
+        if self.schema_version() >= SCHEMA_VERSION:
+            return applied
+
+        for version, description, migrate in MIGRATIONS:
+            with self.transaction() as conn:
+                # Re-check under the write lock - another process may have migrated
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version <= current:
+                    continue
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+            applied.append(version)
+        return applied
+
+    # Messages
+
+    def get_user_history(self, user_id: str, limit: int = 5) -> List[Dict]:
+        """Most recent verdicts for a user, newest first"""
+        rows = self.fetchall("""
+            SELECT id, classification, reasoning, feedback
+            FROM messages
+            WHERE user_id = ?
+            ORDER BY ts DESC
+            LIMIT ?
+        """, (user_id, limit))
+
+        return [
+            {'message_id': row[0], 'classification': row[1], 'reasoning': row[2], 'feedback': row[3]}
+            for row in rows
+        ]
+
+    def save_message(self, message: Dict) -> None:
+        """Insert or update a moderated message"""
+        self.save_messages([message])
+
+    def save_messages(self, messages: List[Dict]) -> None:
+        """Insert or update several moderated messages in one transaction.
+
+        Rollup tables are updated in the same transaction; a re-saved row
+        has its old contribution subtracted first. A re-saved row keeps its
+        rowid (bulk re-moderation pages on it) and its admin feedback.
+        """
+        with self.transaction() as conn:
+            for message in messages:
+                ts = timestamp_to_epoch(message["timestamp"])
+
+                old = conn.execute("""
+                    SELECT ts, classification, action, confidence, feedback
+                    FROM messages WHERE id = ?
+                """, (message["message_id"],)).fetchone()
+                feedback_total, feedback_correct = _feedback_counts(old[4] if old else None)
+                if old:
+                    _apply_rollup_delta(conn, old[0], old[1], old[2], -1, -(old[3] or 0.0),
+                                        -feedback_total, -feedback_correct)
+
+                conn.execute("""
+                    INSERT INTO messages
+                    (id, user_id, content, timestamp, ts, classification, confidence, reasoning,
+                     action, verdict_source)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        user_id = excluded.user_id, content = excluded.content,
+                        timestamp = excluded.timestamp, ts = excluded.ts,
+                        classification = excluded.classification,
+                        confidence = excluded.confidence, reasoning = excluded.reasoning,
+                        action = excluded.action, verdict_source = excluded.verdict_source
+                """, (
+                    message["message_id"],
+                    message["user_id"],
+                    message["content"],
+                    message["timestamp"],
+                    ts,
+                    message["classification"],
+                    message["confidence"],
+                    message["reasoning"],
+                    message["action"],
+                    message.get("verdict_source") or None
+                ))
+                _apply_rollup_delta(conn, ts, message["classification"], message["action"],
+                                    1, message["confidence"], feedback_total, feedback_correct)
+
+    def get_message_content(self, message_id: str) -> Optional[str]:
+        row = self.fetchone("SELECT content FROM messages WHERE id = ?", (message_id,))
+        return row[0] if row else None
+
+    def get_message(self, message_id: str) -> Optional[Dict]:
+        """Stored verdict of one message"""
+        row = self.fetchone("""
+            SELECT content, classification, confidence, reasoning, verdict_source, feedback,
+                   user_id, timestamp, action
+            FROM messages WHERE id = ?
+        """, (message_id,))
+        if not row:
+            return None
+        return {
+            'message_id': message_id, 'content': row[0], 'classification': row[1],
+            'confidence': row[2], 'reasoning': row[3], 'verdict_source': row[4],
+            'feedback': row[5], 'user_id': row[6], 'timestamp': row[7], 'action': row[8],
+        }
+
+    def iter_training_rows(self, batch_size: int = BACKFILL_BATCH_SIZE) -> Iterator[Tuple]:
+        """(id, content, classification, confidence, verdict_source, feedback) for all messages"""
+        last_rowid = 0
+        while True:
+            rows = self.fetchall("""
+                SELECT rowid, id, content, classification, confidence, verdict_source, feedback
+                FROM messages
+                WHERE rowid > ?
+                ORDER BY rowid LIMIT ?
+            """, (last_rowid, batch_size))
+            if not rows:
+                return
+            for row in rows:
+                yield row[1:]
+            last_rowid = rows[-1][0]
+
+    def update_feedback(self, message_id: str, feedback_type: str) -> bool:
+        """Store admin feedback; False if the message is unknown"""
+        with self.transaction() as conn:
+            old = conn.execute("""
+                SELECT ts, classification, action, feedback
+                FROM messages WHERE id = ?
+            """, (message_id,)).fetchone()
+            if not old:
+                return False
+
+            conn.execute("""
+                UPDATE messages SET feedback = ? WHERE id = ?
+            """, (feedback_type, message_id))
+
+            old_total, old_correct = _feedback_counts(old[3])
+            new_total, new_correct = _feedback_counts(feedback_type)
+            _apply_rollup_delta(conn, old[0], old[1], old[2],
+                                feedback_total=new_total - old_total,
+                                feedback_correct=new_correct - old_correct)
+            return True
+
+    # Re-analysis jobs
+
+    def enqueue_reanalysis(self, message_id: str, hint: Optional[str] = None) -> int:
+        """Queue a re-analysis; a job still pending for the message is reused"""
+        with self.transaction() as conn:
+            row = conn.execute("""
+                SELECT id, hint FROM reanalysis_jobs
+                WHERE message_id = ? AND status = 'pending'
+            """, (message_id,)).fetchone()
+            if row:
+                if hint and hint != row[1]:
+                    conn.execute("UPDATE reanalysis_jobs SET hint = ? WHERE id = ?", (hint, row[0]))
+                return row[0]
+
+            now = time.time()
+            return conn.execute("""
+                INSERT INTO reanalysis_jobs (message_id, hint, created_ts, available_ts)
+                VALUES (?, ?, ?, ?)
+            """, (message_id, hint or None, now, now)).lastrowid
+
+    def claim_reanalysis_job(self) -> Optional[Dict]:
+        """Take the oldest due pending job and mark it running"""
+        with self.transaction() as conn:
+            row = conn.execute("""
+                SELECT id, message_id, hint, attempts FROM reanalysis_jobs
+                WHERE status = 'pending' AND available_ts <= ?
+                ORDER BY available_ts, id LIMIT 1
+            """, (time.time(),)).fetchone()
+            if not row:
+                return None
+            conn.execute("""
+                UPDATE reanalysis_jobs SET status = 'running', attempts = attempts + 1
+                WHERE id = ?
+            """, (row[0],))
+            return {'job_id': row[0], 'message_id': row[1], 'hint': row[2],
+                    'attempts': row[3] + 1}
+
+    def finish_reanalysis_job(self, job_id: int, previous: Dict, result: Dict) -> None:
+        """Record the new verdict of a job, next to the one it replaced"""
+        self.execute("""
+            UPDATE reanalysis_jobs
+            SET status = 'done', finished_ts = ?, previous_classification = ?,
+                previous_action = ?, classification = ?, confidence = ?, action = ?,
+                reasoning = ?, error = NULL
+            WHERE id = ?
+        """, (time.time(), previous.get('classification'), previous.get('action'),
+              result['classification'], result['confidence'], result['action'],
+              result['reasoning'], job_id))
+
+    def fail_reanalysis_job(self, job_id: int, error: str,
+                            retry_in_s: Optional[float] = None) -> None:
+        """Put a job back on the queue after retry_in_s, or fail it for good"""
+        if retry_in_s is not None:
+            self.execute("""
+                UPDATE reanalysis_jobs SET status = 'pending', available_ts = ?, error = ?
+                WHERE id = ?
+            """, (time.time() + retry_in_s, error, job_id))
+        else:
+            self.execute("""
+                UPDATE reanalysis_jobs SET status = 'failed', finished_ts = ?, error = ?
+                WHERE id = ?
+            """, (time.time(), error, job_id))
+
+    def requeue_running_reanalysis_jobs(self) -> int:
+        """Return jobs left running by a process that died to the queue"""
+        return self.execute("""
+            UPDATE reanalysis_jobs SET status = 'pending' WHERE status = 'running'
+        """).rowcount
+
+    def take_reanalysis_results(self, limit: int = 100) -> List[Dict]:
+        """Finished jobs not yet reported to the admins, marked as reported"""
+        with self.transaction() as conn:
+            rows = conn.execute("""
+                SELECT id, message_id, hint, status, attempts, previous_classification,
+                       previous_action, classification, confidence, action, reasoning, error
+                FROM reanalysis_jobs
+                WHERE notified = 0 AND status IN ('done', 'failed')
+                ORDER BY id LIMIT ?
+            """, (limit,)).fetchall()
+            conn.executemany("UPDATE reanalysis_jobs SET notified = 1 WHERE id = ?",
+                             [(row[0],) for row in rows])
+        keys = ('job_id', 'message_id', 'hint', 'status', 'attempts', 'previous_classification',
+                'previous_action', 'classification', 'confidence', 'action', 'reasoning', 'error')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def reanalysis_counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        rows = self.fetchall("SELECT status, COUNT(*) FROM reanalysis_jobs GROUP BY status")
+        return {row[0]: row[1] for row in rows}
+
+    # Bulk re-moderation
+
+    def start_remoderation_run(self, run_id: str, config: Dict) -> Dict:
+        """Create a run over the messages stored so far, or return the existing one"""
+        with self.transaction() as conn:
+            row = conn.execute("SELECT config FROM remoderation_runs WHERE id = ?",
+                               (run_id,)).fetchone()
+            if row is None:
+                max_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM messages").fetchone()[0]
+                now = time.time()
+                conn.execute("""
+                    INSERT INTO remoderation_runs (id, config, max_rowid, created_ts, updated_ts)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (run_id, json.dumps(config, sort_keys=True, ensure_ascii=False),
+                      max_rowid, now, now))
+        return self.get_remoderation_run(run_id)
+
+    def get_remoderation_run(self, run_id: str) -> Optional[Dict]:
+        row = self.fetchone("""
+            SELECT config, status, max_rowid, last_rowid, created_ts, updated_ts
+            FROM remoderation_runs WHERE id = ?
+        """, (run_id,))
+        if not row:
+            return None
+        return {'run_id': run_id, 'config': json.loads(row[0]), 'status': row[1],
+                'max_rowid': row[2], 'last_rowid': row[3], 'created_ts': row[4],
+                'updated_ts': row[5]}
+
+    def remoderation_page(self, run_id: str, after_rowid: int, max_rowid: int,
+                          limit: int) -> List[Dict]:
+        """Next messages of a run by rowid, without the ones it already has a result for"""
+        rows = self.fetchall("""
+            SELECT m.rowid, m.id, m.user_id, m.content, m.timestamp, m.classification, m.action
+            FROM messages m
+            WHERE m.rowid > ? AND m.rowid <= ?
+              AND NOT EXISTS (SELECT 1 FROM remoderation_results r
+                              WHERE r.run_id = ? AND r.message_id = m.id AND r.error IS NULL)
+            ORDER BY m.rowid LIMIT ?
+        """, (after_rowid, max_rowid, run_id, limit))
+        keys = ('rowid', 'message_id', 'user_id', 'content', 'timestamp', 'classification',
+                'action')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def save_remoderation_result(self, run_id: str, message: Dict, result: Dict,
+                                 error: Optional[str] = None) -> None:
+        """New verdict of a message next to its live one (error: no verdict this time)"""
+        self.execute("""
+            INSERT OR REPLACE INTO remoderation_results
+            (run_id, message_id, old_classification, old_action, classification, confidence,
+             action, reasoning, verdict_source, error, created_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (run_id, message['message_id'], message['classification'], message['action'],
+              result.get('classification'), result.get('confidence'), result.get('action'),
+              result.get('reasoning'), result.get('verdict_source'), error, time.time()))
+
+    def checkpoint_remoderation_run(self, run_id: str, last_rowid: int,
+                                    status: Optional[str] = None) -> None:
+        """Every message up to last_rowid has a result (or was skipped)"""
+        self.execute("""
+            UPDATE remoderation_runs
+            SET last_rowid = MAX(last_rowid, ?), status = COALESCE(?, status), updated_ts = ?
+            WHERE id = ?
+        """, (last_rowid, status, time.time(), run_id))
+
+    def failed_remoderation_messages(self, run_id: str, limit: int) -> List[Dict]:
+        """Messages of a run whose last attempt gave no verdict"""
+        rows = self.fetchall("""
+            SELECT m.rowid, m.id, m.user_id, m.content, m.timestamp, m.classification, m.action
+            FROM remoderation_results r JOIN messages m ON m.id = r.message_id
+            WHERE r.run_id = ? AND r.error IS NOT NULL
+            ORDER BY m.rowid LIMIT ?
+        """, (run_id, limit))
+        keys = ('rowid', 'message_id', 'user_id', 'content', 'timestamp', 'classification',
+                'action')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def remoderation_transitions(self, run_id: str) -> Dict[Tuple[str, str], int]:
+        """(live action, new action) -> messages, for the messages with a new verdict"""
+        rows = self.fetchall("""
+            SELECT old_action, action, COUNT(*) FROM remoderation_results
+            WHERE run_id = ? AND error IS NULL
+            GROUP BY old_action, action
+        """, (run_id,))
+        return {(row[0] or '', row[1] or ''): row[2] for row in rows}
+
+    def remoderation_flips(self, run_id: str, limit: int) -> List[Dict]:
+        """Messages whose action would change, deletions first"""
+        rows = self.fetchall("""
+            SELECT r.message_id, r.old_action, r.action, r.old_classification, r.classification,
+                   r.confidence, r.reasoning, r.verdict_source, m.content
+            FROM remoderation_results r LEFT JOIN messages m ON m.id = r.message_id
+            WHERE r.run_id = ? AND r.error IS NULL
+              AND r.action IS NOT REPLACE(r.old_action, 'APPROVE_DEGRADED', 'APPROVE')
+            ORDER BY (r.action = 'DELETE_MESSAGE') + (r.old_action = 'DELETE_MESSAGE') DESC,
+                     m.rowid
+            LIMIT ?
+        """, (run_id, limit))
+        keys = ('message_id', 'old_action', 'action', 'old_classification', 'classification',
+                'confidence', 'reasoning', 'verdict_source', 'content')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def remoderation_errors(self, run_id: str) -> int:
+        return self.fetchone("""
+            SELECT COUNT(*) FROM remoderation_results WHERE run_id = ? AND error IS NOT NULL
+        """, (run_id,))[0]
+
+    # Retention
+
+    def redact_content(self, before_ts: float, limit: int) -> int:
+        """Drop the content of up to limit messages older than before_ts"""
+        with self.transaction() as conn:
+            return conn.execute("""
+                UPDATE messages SET content = NULL
+                WHERE rowid IN (
+                    SELECT rowid FROM messages
+                    WHERE content IS NOT NULL AND ts < ?
+                    ORDER BY ts LIMIT ?
+                )
+            """, (before_ts, limit)).rowcount
+
+    def archive_messages(self, before_ts: float, limit: int) -> Tuple[int, int, int]:
+        """Move up to limit messages older than before_ts into the archive.
+
+        Returns (rows, raw bytes, compressed bytes). Rollups are untouched -
+        archived messages keep counting in the statistics.
+        """
+        with self.transaction() as conn:
+            rows = conn.execute(f"""
+                SELECT rowid, {', '.join(ARCHIVE_COLUMNS)} FROM messages
+                WHERE ts < ?
+                ORDER BY ts LIMIT ?
+            """, (before_ts, limit)).fetchall()
+            if not rows:
+                return 0, 0, 0
+
+            partitions: Dict[str, List[Dict]] = {}
+            for row in rows:
+                message = dict(zip(ARCHIVE_COLUMNS, row[1:]))
+                partitions.setdefault(month_key(message['ts']), []).append(message)
+
+            raw_bytes = compressed_bytes = 0
+            now = time.time()
+            for month, messages in partitions.items():
+                data, raw = encode_archive(messages)
+                conn.execute("""
+                    INSERT INTO message_archive
+                    (month, rows, first_ts, last_ts, raw_bytes, data, created_ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (month, len(messages), messages[0]['ts'], messages[-1]['ts'], raw, data, now))
+                raw_bytes += raw
+                compressed_bytes += len(data)
+
+            conn.executemany("DELETE FROM messages WHERE rowid = ?", [(row[0],) for row in rows])
+            return len(rows), raw_bytes, compressed_bytes
+
+    def compact_archive(self, month: str, max_rows: int) -> int:
+        """Merge the small chunks of one archive partition; returns chunks removed.
+
+        Chunks are decompressed and recompressed outside the write
+        transaction, which only swaps the merged chunk in.
+        """
+        chunks = self.fetchall("""
+            SELECT id, rows FROM message_archive
+            WHERE month = ? AND rows < ?
+            ORDER BY first_ts, id
+        """, (month, max_rows))
+
+        # Greedy: fill merged chunks up to max_rows, in time order
+        groups: List[List[Tuple]] = []
+        for chunk in chunks:
+            if groups and sum(c[1] for c in groups[-1]) + chunk[1] <= max_rows:
+                groups[-1].append(chunk)
+            else:
+                groups.append([chunk])
+
+        removed = 0
+        for group in groups:
+            if len(group) < 2:
+                continue
+            ids = [chunk[0] for chunk in group]
+            placeholders = ", ".join("?" * len(ids))
+            messages = []
+            for (data,) in self.fetchall(
+                    f"SELECT data FROM message_archive WHERE id IN ({placeholders})", tuple(ids)):
+                messages.extend(decode_archive(data))
+            messages.sort(key=lambda m: m['ts'] or 0)
+            data, raw = encode_archive(messages)
+
+            with self.transaction() as conn:
+                # Another pass may have merged these chunks meanwhile
+                present = conn.execute(
+                    f"SELECT COUNT(*) FROM message_archive WHERE id IN ({placeholders})",
+                    tuple(ids)).fetchone()[0]
+                if present != len(ids):
+                    continue
+                conn.execute("""
+                    INSERT INTO message_archive
+                    (month, rows, first_ts, last_ts, raw_bytes, data, created_ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (month, len(messages), messages[0]['ts'], messages[-1]['ts'], raw,
+                      data, time.time()))
+                conn.execute(f"DELETE FROM message_archive WHERE id IN ({placeholders})",
+                             tuple(ids))
+            removed += len(ids) - 1
+        return removed
+
+    def fragmented_archive_months(self) -> List[str]:
+        """Archive partitions made of more than one chunk"""
+        return [row[0] for row in self.fetchall("""
+            SELECT month FROM message_archive GROUP BY month HAVING COUNT(*) > 1 ORDER BY month
+        """)]
+
+    def iter_archived_messages(self, month: Optional[str] = None) -> Iterator[Dict]:
+        """Archived messages, optionally of one 'YYYY-MM' partition"""
+        sql = "SELECT id FROM message_archive"
+        params: Tuple = ()
+        if month:
+            sql += " WHERE month = ?"
+            params = (month,)
+        for (chunk_id,) in self.fetchall(sql + " ORDER BY month, first_ts, id", params):
+            row = self.fetchone("SELECT data FROM message_archive WHERE id = ?", (chunk_id,))
+            if row:
+                yield from decode_archive(row[0])
+
+    def archive_stats(self) -> Dict[str, Dict]:
+        """Rows, chunks and sizes per archive partition"""
+        rows = self.fetchall("""
+            SELECT month, COUNT(*), SUM(rows), SUM(raw_bytes), SUM(LENGTH(data))
+            FROM message_archive GROUP BY month ORDER BY month
+        """)
+        return {
+            row[0]: {'chunks': row[1], 'messages': row[2], 'raw_bytes': row[3],
+                     'compressed_bytes': row[4]}
+            for row in rows
+        }
+
+    def page_stats(self) -> Dict:
+        """Page size and counts of the database file"""
+        return {
+            'page_size': self.fetchone("PRAGMA page_size")[0],
+            'page_count': self.fetchone("PRAGMA page_count")[0],
+            'freelist_count': self.fetchone("PRAGMA freelist_count")[0],
+            'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(
+                self.fetchone("PRAGMA auto_vacuum")[0], 'unknown'),
+        }
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Return up to pages free pages to the file system; returns pages freed"""
+        before = self.fetchone("PRAGMA freelist_count")[0]
+        self.connection().execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return before - self.fetchone("PRAGMA freelist_count")[0]
+
+    def enable_incremental_vacuum(self) -> None:
+        """Switch an existing database to incremental auto-vacuum (one full VACUUM)"""
+        conn = self.connection()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+    def checkpoint(self) -> None:
+        """Copy the WAL into the database file so its size reflects vacuuming"""
+        self.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    def rebuild_rollups(self) -> None:
+        """Recompute statistics rollups from the messages table and archive (backfill)"""
+        with self.transaction() as conn:
+            rebuild_rollups(conn)
+
+    # Statistics
+
+    def classification_stats(self) -> Dict[str, Dict]:
+        """Count and average confidence per classification"""
+        rows = self.fetchall("""
+            SELECT classification, SUM(messages), SUM(confidence_sum)
+            FROM stats_total
+            GROUP BY classification
+            HAVING SUM(messages) > 0
+        """)
+        return {
+            (row[0] or None): {'count': row[1], 'avg_confidence': row[2] / row[1]}
+            for row in rows
+        }
+
+    def feedback_totals(self) -> Tuple[int, int]:
+        """(total feedback, correct feedback) over all messages"""
+        row = self.fetchone("""
+            SELECT SUM(feedback_total), SUM(feedback_correct) FROM stats_total
+        """)
+        return (row[0] or 0, row[1] or 0) if row else (0, 0)
+
+    def summary_stats(self) -> Dict:
+        """Per-classification counts, feedback accuracy and total messages"""
+        stats = self.classification_stats()
+        total_feedback, correct = self.feedback_totals()
+        return {
+            'classification_stats': stats,
+            'accuracy': (correct / total_feedback) * 100 if total_feedback > 0 else 0,
+            'total_messages': sum(s['count'] for s in stats.values()),
+        }
+
+    def tier_accuracy(self) -> Dict[str, Dict]:
+        """Admin-feedback accuracy per verdict source (tier)"""
+        rows = self.fetchall("""
+            SELECT COALESCE(verdict_source, 'unknown'), COUNT(*),
+                   SUM(CASE WHEN feedback = 'CORRECT' THEN 1 ELSE 0 END)
+            FROM messages
+            WHERE feedback IS NOT NULL
+            GROUP BY 1
+        """)
+        return {
+            row[0]: {'feedback_total': row[1], 'feedback_correct': row[2],
+                     'accuracy': row[2] / row[1] * 100}
+            for row in rows
+        }
+
+    def daily_results(self, days_ago: int = 0) -> List[Tuple[str, str]]:
+        """(classification, action) for every message of a given local day"""
+        start, end = day_range(days_ago)
+        return self.fetchall("""
+            SELECT classification, action
+            FROM messages
+            WHERE ts >= ? AND ts < ?
+        """, (start, end))
+
+    def daily_summary(self, days_ago: int = 0) -> Dict:
+        """Message, action and feedback counts for a given local day"""
+        start, _ = day_range(days_ago)
+        rows = self.fetchall("""
+            SELECT classification, action, messages, feedback_total, feedback_correct
+            FROM stats_daily
+            WHERE day = ?
+        """, (day_key(start),))
+
+        summary = {
+            'messages': 0, 'approved': 0, 'flagged': 0, 'deleted': 0,
+            'feedback_total': 0, 'feedback_correct': 0,
+        }
+        for classification, action, messages, feedback_total, feedback_correct in rows:
+            summary['messages'] += messages
+            if classification == 'APPROVED':
+                summary['approved'] += messages
+            if classification == 'CONTEXT_DEPENDENT':
+                summary['flagged'] += messages
+            if action == 'DELETE_MESSAGE':
+                summary['deleted'] += messages
+            summary['feedback_total'] += feedback_total
+            summary['feedback_correct'] += feedback_correct
+        return summary
+
+    def daily_feedback_totals(self, days_ago: int = 0) -> Tuple[int, int]:
+        """(total feedback, correct feedback) for a given local day"""
+        summary = self.daily_summary(days_ago)
+        return summary['feedback_total'], summary['feedback_correct']
+
+    def hourly_summary(self, days_ago: int = 0) -> Dict[str, int]:
+        """Messages per local hour of a given day"""
+        start, _ = day_range(days_ago)
+        rows = self.fetchall("""
+            SELECT hour, SUM(messages)
+            FROM stats_hourly
+            WHERE hour >= ? AND hour < ?
+            GROUP BY hour
+            ORDER BY hour
+        """, (day_key(start), day_key(start) + '~'))
+        return {row[0]: row[1] for row in rows}
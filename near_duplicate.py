@@ -0,0 +1,305 @@
+"""
+Near-duplicate index for lightly edited reposts.
+
+The same request is often reposted with a different name, a changed
+quantity or extra emojis, which the exact-content verdict cache misses.
+Each message is reduced to character shingles of its normalized text
+(digit runs collapsed, punctuation and emoji dropped) and summarized by a
+one-permutation MinHash signature. LSH banding over the signature finds
+candidates with a few dict lookups, so a lookup never scans the window.
+
+Only admin verdicts are indexed (the classification an admin's reaction
+gave the message), so an unreviewed LLM call never decides a repost. A
+match is not reused when the new message introduces a phone number,
+coordinates or a risk keyword its neighbour did not have.
+The window is bounded in size and age and persisted in SQLite; the
+retention pass deletes persisted entries that fell out of it.
+"""
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from local_classifier import normalize_text
+from moderation_storage import ModerationStorage
+from rule_engine import GPS_DECIMAL_PAIR_RE, GPS_DEGREES_RE, PHONE_RE, RuleEngine
+
+SHINGLE_SIZE = 3
+NUM_BINS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_BINS // BANDS
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# Signals that must not appear in a repost unless the original had them
+RISK_SIGNALS = {"gps_degrees", "gps_decimal", "unit_number", "gaza", "operational", "military"}
+
+_BIN_BITS = 6  # log2(NUM_BINS)
+_VALUE_MASK = (1 << (64 - _BIN_BITS)) - 1
+_EMPTY = _VALUE_MASK + 1
+_SIGNATURE_FORMAT = f"<{NUM_BINS}Q"
+
+_NON_WORD_RE = re.compile(r"[^\w ]+")
+_DIGIT_RUN_RE = re.compile(r"0+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def shingle_text(content: str) -> str:
+    """Normalized text: quantities, punctuation and emoji don't matter"""
+    text = _NON_WORD_RE.sub(" ", normalize_text(content))
+    text = _DIGIT_RUN_RE.sub("0", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def signature(content: str) -> Tuple[int, ...]:
+    """One-permutation MinHash with rotation densification"""
+    text = f" {shingle_text(content)} "
+    bins = [_EMPTY] * NUM_BINS
+    for i in range(max(1, len(text) - SHINGLE_SIZE + 1)):
+        digest = hashlib.blake2b(text[i:i + SHINGLE_SIZE].encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        index = value >> (64 - _BIN_BITS)
+        value &= _VALUE_MASK
+        if value < bins[index]:
+            bins[index] = value
+
+    # Empty bins borrow from the next non-empty one, tagged with the distance
+    original = list(bins)
+    for i in range(NUM_BINS):
+        if original[i] != _EMPTY:
+            continue
+        for distance in range(1, NUM_BINS):
+            source = original[(i + distance) % NUM_BINS]
+            if source != _EMPTY:
+                bins[i] = source | (distance << 58)
+                break
+    return tuple(bins)
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_BINS
+
+
+def _band_keys(sig: Tuple[int, ...]) -> List[Tuple]:
+    return [(band,) + sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND] for band in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    """Bounded MinHash/LSH index of recent confirmed verdicts"""
+
+    def __init__(self, storage: ModerationStorage, rule_engine: Optional[RuleEngine] = None,
+                 threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.storage = storage
+        self.rule_engine = rule_engine or RuleEngine()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._buckets: Dict[Tuple, Set[str]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.blocked = 0
+
+        self.setup_table()
+        self.load()
+
+    def setup_table(self):
+        """Create the persisted index table"""
+        with self.storage.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS near_duplicate_index (
+                    message_id TEXT PRIMARY KEY,
+                    signature BLOB,
+                    markers TEXT,
+                    classification TEXT,
+                    confidence REAL,
+                    reasoning TEXT,
+                    created_at REAL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_near_duplicate_created "
+                "ON near_duplicate_index(created_at)"
+            )
+
+    def _markers(self, content: str) -> Dict:
+        """Sensitive details a repost may not add"""
+        return {
+            'phones': sorted({re.sub(r"\D", "", p)[-9:] for p in PHONE_RE.findall(content)}),
+            'coordinates': sorted(set(GPS_DEGREES_RE.findall(content)) |
+                                  set(GPS_DECIMAL_PAIR_RE.findall(content))),
+            'signals': sorted(self.rule_engine.signals(content) & RISK_SIGNALS),
+        }
+
+    def _introduces_risk(self, new: Dict, old: Dict) -> bool:
+        return any(set(new[key]) - set(old[key]) for key in ('phones', 'coordinates', 'signals'))
+
+    # In-memory window
+
+    def _insert(self, message_id: str, entry: Dict) -> None:
+        self._remove(message_id)
+        self._entries[message_id] = entry
+        for key in _band_keys(entry['signature']):
+            self._buckets.setdefault(key, set()).add(message_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, message_id: str) -> None:
+        entry = self._entries.pop(message_id, None)
+        if entry is None:
+            return
+        for key in _band_keys(entry['signature']):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(message_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _best_match(self, sig: Tuple[int, ...], now: float) -> Tuple[Optional[str], float]:
+        candidates: Set[str] = set()
+        for key in _band_keys(sig):
+            bucket = self._buckets.get(key)
+            if bucket:
+                candidates |= bucket
+
+        best_id, best_score = None, 0.0
+        for message_id in candidates:
+            entry = self._entries[message_id]
+            if now - entry['created_at'] > self.max_age_seconds:
+                continue
+            score = similarity(sig, entry['signature'])
+            if score > best_score:
+                best_id, best_score = message_id, score
+        return best_id, best_score
+
+    # Public API
+
+    def lookup(self, content: str) -> Optional[Dict]:
+        """Verdict of a confirmed near-duplicate, or None"""
+        sig = signature(content)
+        with self._lock:
+            message_id, score = self._best_match(sig, time.time())
+            entry = self._entries.get(message_id) if message_id else None
+            if entry is None or score < self.threshold:
+                self.misses += 1
+                return None
+
+        if self._introduces_risk(self._markers(content), entry['markers']):
+            with self._lock:
+                self.blocked += 1
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return {
+            'message_id': message_id,
+            'similarity': score,
+            'classification': entry['classification'],
+            'confidence': entry['confidence'],
+            'reasoning': entry['reasoning'],
+        }
+
+    def add(self, message_id: str, content: str, classification: str,
+            confidence: float, reasoning: str) -> bool:
+        """Index a verdict an admin confirmed"""
+        entry = {
+            'signature': signature(content),
+            'markers': self._markers(content),
+            'classification': classification,
+            'confidence': confidence,
+            'reasoning': reasoning,
+            'created_at': time.time(),
+        }
+        with self._lock:
+            self._insert(message_id, entry)
+
+        with self.storage.transaction() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO near_duplicate_index
+                (message_id, signature, markers, classification, confidence, reasoning, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (message_id, struct.pack(_SIGNATURE_FORMAT, *entry['signature']),
+                  json.dumps(entry['markers'], ensure_ascii=False), classification,
+                  confidence, reasoning, entry['created_at']))
+        return True
+
+    def invalidate(self, message_id: str, content: Optional[str] = None) -> int:
+        """Drop a message, and every indexed near-duplicate of its content"""
+        with self._lock:
+            removed = [message_id] if message_id in self._entries else []
+            if content is not None:
+                sig = signature(content)
+                candidates: Set[str] = set()
+                for key in _band_keys(sig):
+                    candidates |= self._buckets.get(key, set())
+                removed.extend(candidate for candidate in candidates
+                               if similarity(sig, self._entries[candidate]['signature']) >= self.threshold)
+            for candidate in removed:
+                self._remove(candidate)
+
+        with self.storage.transaction() as conn:
+            conn.executemany("DELETE FROM near_duplicate_index WHERE message_id = ?",
+                             [(candidate,) for candidate in set(removed) | {message_id}])
+        return len(set(removed))
+
+    def load(self) -> int:
+        """Warm the window from the newest persisted entries"""
+        cutoff = time.time() - self.max_age_seconds
+        rows = self.storage.fetchall("""
+            SELECT message_id, signature, markers, classification, confidence, reasoning, created_at
+            FROM near_duplicate_index
+            WHERE created_at >= ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        """, (cutoff, self.max_entries))
+
+        with self._lock:
+            for row in reversed(rows):
+                self._insert(row[0], {
+                    'signature': struct.unpack(_SIGNATURE_FORMAT, row[1]),
+                    'markers': json.loads(row[2]),
+                    'classification': row[3],
+                    'confidence': row[4],
+                    'reasoning': row[5],
+                    'created_at': row[6],
+                })
+        return len(rows)
+
+    def prune(self, limit: Optional[int] = None) -> int:
+        """Delete up to limit persisted entries that fell out of the window"""
+        cutoff = time.time() - self.max_age_seconds
+        with self.storage.transaction() as conn:
+            # LIMIT -1 is no limit
+            cursor = conn.execute("""
+                DELETE FROM near_duplicate_index WHERE message_id IN (
+                    SELECT message_id FROM near_duplicate_index
+                    WHERE created_at < ? OR message_id NOT IN (
+                        SELECT message_id FROM near_duplicate_index
+                        ORDER BY created_at DESC LIMIT ?
+                    )
+                    LIMIT ?
+                )
+            """, (cutoff, self.max_entries, -1 if limit is None else limit))
+            return cursor.rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'blocked': self.blocked,
+                'hit_rate': (self.hits / lookups * 100) if lookups else 0,
+            }
@@ -1,35 +1,68 @@
 """
 Process admin feedback from WhatsApp reactions
+
+Usage:
+    python process_feedback.py <message_id> <reaction> [<message_id> <reaction> ...]
+    python process_feedback.py -    # JSON list of {message_id, reaction, hint, group_id} on stdin
+
+🔄 reactions are queued for re-analysis by the moderation server's workers.
+With a groups.json each reaction goes to its group's database.
 """
 import sys
 import json
-import os
-from llm_moderation_agent import ModerationAgent
+from group_config import find_group, groups_or_default, verdict_cache_db
+from moderation_feedback import FeedbackProcessor
+from moderation_storage import ModerationStorage
+from near_duplicate import NearDuplicateIndex
+from verdict_cache import VerdictCache
+
+def read_items(args):
+    """Reactions from id/reaction argument pairs, or a JSON list on stdin"""
+    if args == ['-']:
+        items = json.load(sys.stdin)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON list of {message_id, reaction, hint}")
+        return items
+    return [{'message_id': message_id, 'reaction': reaction}
+            for message_id, reaction in zip(args[::2], args[1::2])]
 
 def main():
     """Process feedback from admin reactions"""
     
-    if len(sys.argv) != 3:
+    args = sys.argv[1:]
+    if args != ['-'] and (not args or len(args) % 2):
         sys.exit(1)
     
-    message_id = sys.argv[1]
-    reaction = sys.argv[2]
-    
     try:
-        groq_api_key = os.getenv('GROQ_API_KEY')
-        if not groq_api_key:
-            raise Exception("GROQ_API_KEY not found")
+        items = read_items(args)
         
-        agent = ModerationAgent(
-            groq_api_key=groq_api_key,
-            db_path="whatsapp_moderation.db"
-        )
+        groups = groups_or_default()
+        by_group = {}
+        for item in items:
+            group = find_group(groups, item.get('group_id'))
+            by_group.setdefault(group.group_id, (group, []))[1].append(item)
         
-        # Process the feedback
-        success = agent.process_feedback(message_id, reaction)
+        summary = {'processed': 0, 'reanalysis_jobs': []}
+        for group, group_items in by_group.values():
+            # Storage-backed tiers only - no LLM client, no workflow, no API key needed.
+            # The running server's local classifier picks feedback up on retraining.
+            storage = ModerationStorage(group.db_path)
+            storage.setup_schema()
+            cache_storage = ModerationStorage(verdict_cache_db(groups, group))
+            processor = FeedbackProcessor(
+                storage,
+                verdict_cache=VerdictCache(cache_storage),
+                near_duplicates=NearDuplicateIndex(storage)
+            )
+            
+            # Process the feedback - all of a group's reactions in one transaction
+            result = processor.process_batch(group_items)
+            summary['processed'] += result['processed']
+            summary['reanalysis_jobs'].extend(result['reanalysis_jobs'])
         
-        if success:
-            print("Feedback processed successfully")
+        if summary['processed']:
+            print(f"Feedback processed successfully ({summary['processed']} reactions, "
+                  f"{len(summary['reanalysis_jobs'])} queued for re-analysis)")
         else:
             print("Failed to process feedback")
             sys.exit(1)
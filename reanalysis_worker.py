@@ -0,0 +1,142 @@
+"""
+Background re-analysis of messages an admin reacted to with 🔄.
+
+Requests live in the reanalysis_jobs table, so they survive restarts and
+can be queued by any process (the server's feedback op or
+process_feedback.py). A bounded pool of threads claims due jobs and
+re-runs each message through ModerationAgent.reanalyze_message, which
+goes straight to the LLM at low priority with the admin's hint. The new
+verdict replaces the stored one and stays on the job row until the bot
+collects it to notify the admins. A job whose LLM call gave no verdict
+(breaker open, timeout, error) is retried with a growing delay and marked
+failed after max_attempts. With several groups the pool is shared: each
+claim starts at the next group's queue, so the groups take turns.
+"""
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_INTERVAL_S = 2.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY_S = 30.0
+
+
+class ReanalysisFailed(Exception):
+    """The LLM gave no verdict; the stored one was kept"""
+
+
+class ReanalysisWorkers:
+    """Bounded thread pool serving the persistent re-analysis queue"""
+
+    def __init__(self, agents, workers: int = DEFAULT_WORKERS,
+                 poll_interval_s: float = DEFAULT_POLL_INTERVAL_S,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retry_delay_s: float = DEFAULT_RETRY_DELAY_S):
+        # One ModerationAgent, or a list with one agent per group
+        self.agents = list(agents) if isinstance(agents, (list, tuple)) else [agents]
+        self._next_agent = 0
+        self.workers = max(1, workers)
+        # Jobs queued by other processes are only seen on the next poll
+        self.poll_interval_s = poll_interval_s
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay_s = retry_delay_s
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """Requeue jobs interrupted by a previous shutdown and start the threads"""
+        requeued = sum(agent.storage.requeue_running_reanalysis_jobs() for agent in self.agents)
+        if requeued:
+            print(f"Re-analysis: requeued {requeued} interrupted jobs", file=sys.stderr)
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"reanalysis-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self, job_id: Optional[int] = None) -> None:
+        """A job was queued in this process - claim it without waiting for the poll"""
+        self._wake.set()
+
+    def _claim(self) -> Optional[Tuple]:
+        """(agent, job) for the next due job, starting at the next group's queue"""
+        with self._lock:
+            start = self._next_agent
+            self._next_agent = (start + 1) % len(self.agents)
+        for offset in range(len(self.agents)):
+            agent = self.agents[(start + offset) % len(self.agents)]
+            job = agent.storage.claim_reanalysis_job()
+            if job is not None:
+                return agent, job
+        return None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                print(f"Re-analysis: queue error: {e}", file=sys.stderr)
+                claimed = None
+            if claimed is None:
+                self._wake.wait(self.poll_interval_s)
+                self._wake.clear()
+                continue
+            self._process(*claimed)
+
+    def _process(self, agent, job: Dict) -> None:
+        storage = agent.storage
+        try:
+            previous = storage.get_message(job['message_id'])
+            if previous is None or previous['content'] is None:
+                storage.fail_reanalysis_job(
+                    job['job_id'], "Unknown message" if previous is None else "Content redacted")
+                self._count('failed')
+                return
+            result = agent.reanalyze_message(job['message_id'], job['hint'])
+            storage.finish_reanalysis_job(job['job_id'], previous, result)
+            self._count('completed')
+        except Exception as e:
+            if job['attempts'] < self.max_attempts and not self._stopped.is_set():
+                delay = self.retry_delay_s * 2 ** (job['attempts'] - 1)
+                storage.fail_reanalysis_job(job['job_id'], str(e), retry_in_s=delay)
+                self._count('retried')
+            elif self._stopped.is_set():
+                # Shutting down - leave it for the next start
+                storage.fail_reanalysis_job(job['job_id'], str(e), retry_in_s=0)
+            else:
+                storage.fail_reanalysis_job(job['job_id'], str(e))
+                self._count('failed')
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def close(self) -> None:
+        """Finish the jobs in progress, then stop"""
+        self._stopped.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            result = {
+                'workers': self.workers,
+                'completed': self.completed,
+                'retried': self.retried,
+                'failed': self.failed,
+            }
+        jobs: Dict[str, int] = {}
+        for agent in self.agents:
+            for status, count in agent.storage.reanalysis_counts().items():
+                jobs[status] = jobs.get(status, 0) + count
+        result['jobs'] = jobs
+        return result
@@ -0,0 +1,41 @@
+"""
+Rebuild the statistics rollup tables from the messages table.
+
+Run after restoring a backup or importing old messages. Normal operation
+keeps the rollups up to date on every save and feedback.
+
+Usage:
+    python rebuild_stats.py [--db whatsapp_moderation.db]
+"""
+import argparse
+import json
+import time
+
+from moderation_storage import ModerationStorage
+
+
+def main():
+    """Rebuild rollups and print a summary"""
+    parser = argparse.ArgumentParser(description="Rebuild statistics rollups")
+    parser.add_argument("--db", default="whatsapp_moderation.db", help="Database path")
+    args = parser.parse_args()
+
+    storage = ModerationStorage(args.db)
+    storage.setup_schema()
+
+    start = time.perf_counter()
+    storage.rebuild_rollups()
+    elapsed = time.perf_counter() - start
+
+    total_feedback, correct = storage.feedback_totals()
+    stats = storage.classification_stats()
+    print(json.dumps({
+        "rebuilt_in_seconds": round(elapsed, 3),
+        "total_messages": sum(s['count'] for s in stats.values()),
+        "total_feedback": total_feedback,
+        "correct_feedback": correct,
+    }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Bulk re-moderation of stored messages.
+
+After a change to the prompt, the rules or the decision thresholds, a run
+re-scores the history through ModerationAgent.rescore_message (rules, then
+the LLM at low priority) and writes each new verdict to
+remoderation_results, next to the live one, which stays untouched. The
+report shows which messages would flip between APPROVE, FLAG_FOR_REVIEW
+and DELETE_MESSAGE.
+
+Messages are read by rowid in pages, never all at once, and re-scored
+with bounded concurrency under the agent's rate-limit scheduler. The run
+covers the messages stored when it started. Its checkpoint (the last
+rowid done) and every result are committed as it goes, so an interrupted
+run resumes where it stopped, and messages that got no verdict (LLM error,
+open breaker) are tried again at the end of each pass. Content redacted by
+retention is skipped; archived messages are not re-scored.
+"""
+import asyncio
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+from moderation_storage import ModerationStorage
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PAGE_SIZE = 100
+# Leaves most of the shared Groq quota to the live bot
+REMODERATION_REQUESTS_PER_MINUTE = 10
+
+ACTIONS = ('APPROVE', 'FLAG_FOR_REVIEW', 'DELETE_MESSAGE')
+# Verdict sources that are a real answer for the new prompt
+RESCORED_SOURCES = ('rules', 'media', 'llm')
+
+
+class ConfigMismatch(Exception):
+    """The run was started with a different prompt or thresholds"""
+
+
+class Remoderation:
+    """One resumable re-moderation run over a group's messages table"""
+
+    def __init__(self, agent, run_id: str, config: Dict,
+                 storage: Optional[ModerationStorage] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, page_size: int = DEFAULT_PAGE_SIZE):
+        self.agent = agent
+        self.storage = storage or agent.storage
+        self.run_id = run_id
+        # What the verdicts depend on - a resumed run must use the same
+        self.config = config
+        self.concurrency = max(1, concurrency)
+        self.page_size = max(1, page_size)
+
+    def _open(self) -> Dict:
+        run = self.storage.start_remoderation_run(self.run_id, self.config)
+        if run['config'] != json.loads(json.dumps(self.config)):
+            raise ConfigMismatch(
+                f"Run {self.run_id} was started with {run['config']}; "
+                f"use a new run name for {self.config}")
+        return run
+
+    async def _rescore(self, messages: List[Dict], semaphore: asyncio.Semaphore,
+                       counts: Dict) -> None:
+        async def one(message: Dict) -> None:
+            async with semaphore:
+                try:
+                    result = await self.agent.arescore_message(message)
+                    error = None if result['verdict_source'] in RESCORED_SOURCES \
+                        else (result['reasoning'] or result['verdict_source'])
+                except Exception as e:
+                    result, error = {}, str(e)
+            self.storage.save_remoderation_result(self.run_id, message, result, error)
+            counts['errors' if error else 'rescored'] += 1
+
+        await asyncio.gather(*(one(m) for m in messages))
+
+    async def _arun(self, limit: Optional[int]) -> Dict:
+        run = self._open()
+        counts = {'rescored': 0, 'errors': 0, 'redacted': 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        budget = limit if limit is not None else float('inf')
+
+        # Main pass: pages of messages after the checkpoint
+        cursor = run['last_rowid']
+        complete = True
+        while True:
+            if budget <= 0:
+                complete = False
+                break
+            page = self.storage.remoderation_page(
+                self.run_id, cursor, run['max_rowid'], int(min(self.page_size, budget)))
+            if not page:
+                break
+            todo = [m for m in page if m['content'] is not None]
+            counts['redacted'] += len(page) - len(todo)
+            await self._rescore(todo, semaphore, counts)
+            budget -= len(todo)
+            cursor = page[-1]['rowid']
+            self.storage.checkpoint_remoderation_run(self.run_id, cursor)
+            print(f"Re-moderation {self.run_id}: up to message {cursor} of {run['max_rowid']}, "
+                  f"{counts['rescored']} re-scored, {counts['errors']} without a verdict",
+                  file=sys.stderr, flush=True)
+
+        # Then one more try for the messages that got no verdict
+        if complete:
+            failed = self.storage.failed_remoderation_messages(
+                self.run_id, int(min(budget, 1 << 31)))
+            await self._rescore(failed, semaphore, counts)
+            counts['retried'] = len(failed)
+            if not self.storage.remoderation_errors(self.run_id):
+                self.storage.checkpoint_remoderation_run(self.run_id, cursor, status='done')
+
+        # Messages of the run still without a new verdict
+        counts['failed'] = self.storage.remoderation_errors(self.run_id)
+        del counts['errors']
+        counts['complete'] = complete
+        counts['seconds'] = round(time.monotonic() - started, 1)
+        return counts
+
+    def run(self, limit: Optional[int] = None) -> Dict:
+        """Re-score up to limit more messages (all by default); returns this pass's counts"""
+        return asyncio.run(self._arun(limit))
+
+    def report(self, show: int = 20) -> Dict:
+        """Action transitions of the run so far and the messages that would flip"""
+        run = self.storage.get_remoderation_run(self.run_id)
+        if run is None:
+            raise ValueError(f"Unknown run: {self.run_id}")
+        transitions = self.storage.remoderation_transitions(self.run_id)
+        # Degraded approvals count as approvals
+        matrix = {old: {new: 0 for new in ACTIONS} for old in ACTIONS}
+        other = 0
+        for (old, new), count in transitions.items():
+            old = 'APPROVE' if old == 'APPROVE_DEGRADED' else old
+            if old in matrix and new in matrix[old]:
+                matrix[old][new] += count
+            else:
+                other += count
+        rescored = sum(transitions.values())
+        flipped = sum(count for old, row in matrix.items()
+                      for new, count in row.items() if old != new)
+        return {
+            'run_id': self.run_id,
+            'status': run['status'],
+            'config': run['config'],
+            'progress': {'last_rowid': run['last_rowid'], 'max_rowid': run['max_rowid']},
+            'rescored': rescored,
+            'failed': self.storage.remoderation_errors(self.run_id),
+            'flipped': flipped,
+            'unmatched_actions': other,
+            'transitions': matrix,
+            'flips': self.storage.remoderation_flips(self.run_id, show),
+        }
@@ -0,0 +1,199 @@
+"""
+Retention, archival and space reclamation for the moderation database.
+
+Messages are kept in full for redact_after_days. After that their content
+is dropped, and the verdict, feedback and tier stay for the accuracy
+statistics. After archive_after_days the rows leave the messages table for
+compressed monthly partitions in message_archive, where small chunks of a
+partition are later merged. The rollups keep counting archived messages.
+Expired verdict-cache entries and near-duplicate entries that fell out of
+their window are deleted in the same pass.
+Freed pages go back to the file system through incremental vacuum, never a
+blocking full VACUUM.
+
+Every step runs as short transactions. Each chunk is resized to stay under
+max_chunk_ms, and the steps pause between chunks, so live moderation only
+ever waits for one small chunk. A run stops when its time budget is spent,
+and the next run carries on where it stopped.
+"""
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from moderation_storage import ModerationStorage
+from near_duplicate import NearDuplicateIndex
+from verdict_cache import VerdictCache
+
+DEFAULT_REDACT_AFTER_DAYS = 30
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+DEFAULT_CHUNK_ROWS = 500
+MIN_CHUNK_ROWS = 10
+DEFAULT_MAX_CHUNK_MS = 50.0
+DEFAULT_PAUSE_MS = 20.0
+DEFAULT_VACUUM_PAGES = 256
+# Messages per archive chunk once a partition has been compacted
+DEFAULT_ARCHIVE_CHUNK_ROWS = 20000
+DEFAULT_INTERVAL_S = 3600.0
+DEFAULT_TIME_BUDGET_S = 5.0
+
+DAY_S = 86400
+
+
+class RetentionManager:
+    """Redacts, archives and vacuums the database in bounded-time chunks"""
+
+    def __init__(self, storage: ModerationStorage,
+                 redact_after_days: Optional[float] = DEFAULT_REDACT_AFTER_DAYS,
+                 archive_after_days: Optional[float] = DEFAULT_ARCHIVE_AFTER_DAYS,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 max_chunk_ms: float = DEFAULT_MAX_CHUNK_MS,
+                 pause_ms: float = DEFAULT_PAUSE_MS,
+                 vacuum_pages: int = DEFAULT_VACUUM_PAGES,
+                 archive_chunk_rows: int = DEFAULT_ARCHIVE_CHUNK_ROWS,
+                 verdict_cache: Optional[VerdictCache] = None,
+                 near_duplicates: Optional[NearDuplicateIndex] = None):
+        self.storage = storage
+        self.verdict_cache = verdict_cache
+        self.near_duplicates = near_duplicates
+        # None or 0 turns a step off
+        self.redact_after_days = redact_after_days or None
+        self.archive_after_days = archive_after_days or None
+        self.chunk_rows = max(MIN_CHUNK_ROWS, chunk_rows)
+        self.max_chunk_s = max_chunk_ms / 1000
+        self.pause_s = pause_ms / 1000
+        self.vacuum_pages = max(1, vacuum_pages)
+        self.archive_chunk_rows = max(1, archive_chunk_rows)
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.last_report: Optional[Dict] = None
+
+    def _file_bytes(self) -> int:
+        path = self.storage.db_path
+        return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+    def _chunked(self, step: Callable[[int], int], max_size: int, deadline: Optional[float],
+                 report: Dict) -> bool:
+        """Run step(chunk size) until it does less than a full chunk; False if out of time"""
+        size = max_size
+        while True:
+            if self._stop.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            start = time.perf_counter()
+            done = step(size)
+            elapsed = time.perf_counter() - start
+            report['chunks'] += 1
+            report['max_chunk_ms'] = max(report['max_chunk_ms'], round(elapsed * 1000, 2))
+            if done < size:
+                return True
+
+            # Keep every write transaction short enough not to hold up the bot
+            if elapsed > self.max_chunk_s:
+                size = max(MIN_CHUNK_ROWS, size // 2)
+            elif elapsed < self.max_chunk_s / 2:
+                size = min(max_size, size * 2)
+            time.sleep(self.pause_s)
+
+    def run(self, time_budget_s: Optional[float] = None) -> Dict:
+        """One retention pass; returns a report including bytes reclaimed"""
+        with self._lock:
+            return self._run(time_budget_s)
+
+    def _run(self, time_budget_s: Optional[float]) -> Dict:
+        started = time.monotonic()
+        deadline = started + time_budget_s if time_budget_s else None
+        now = time.time()
+        pages_before = self.storage.page_stats()
+        file_before = self._file_bytes()
+
+        report = {
+            'redacted': 0, 'archived': 0, 'archive_raw_bytes': 0, 'archive_compressed_bytes': 0,
+            'archive_chunks_merged': 0, 'cache_purged': 0, 'near_duplicates_pruned': 0,
+            'vacuumed_pages': 0, 'bytes_reclaimed': 0, 'chunks': 0, 'max_chunk_ms': 0.0, 'complete': True,
+            'auto_vacuum': pages_before['auto_vacuum'],
+        }
+
+        def redact(limit: int) -> int:
+            done = self.storage.redact_content(now - self.redact_after_days * DAY_S, limit)
+            report['redacted'] += done
+            return done
+
+        def archive(limit: int) -> int:
+            rows, raw, compressed = self.storage.archive_messages(
+                now - self.archive_after_days * DAY_S, limit)
+            report['archived'] += rows
+            report['archive_raw_bytes'] += raw
+            report['archive_compressed_bytes'] += compressed
+            return rows
+
+        complete = True
+        if self.redact_after_days:
+            complete = self._chunked(redact, self.chunk_rows, deadline, report)
+        if complete and self.archive_after_days:
+            complete = self._chunked(archive, self.chunk_rows, deadline, report)
+
+            # Recompression happens outside the lock; only the swap is a transaction
+            for month in self.storage.fragmented_archive_months():
+                if self._stop.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                    complete = False
+                    break
+                report['archive_chunks_merged'] += self.storage.compact_archive(
+                    month, self.archive_chunk_rows)
+                time.sleep(self.pause_s)
+
+        if complete and self.verdict_cache is not None:
+            def purge_cache(limit: int) -> int:
+                done = self.verdict_cache.purge_expired(limit)
+                report['cache_purged'] += done
+                return done
+
+            complete = self._chunked(purge_cache, self.chunk_rows, deadline, report)
+        if complete and self.near_duplicates is not None:
+            def prune_near_duplicates(limit: int) -> int:
+                done = self.near_duplicates.prune(limit)
+                report['near_duplicates_pruned'] += done
+                return done
+
+            complete = self._chunked(prune_near_duplicates, self.chunk_rows, deadline, report)
+
+        if pages_before['auto_vacuum'] == 'incremental':
+            def vacuum(limit: int) -> int:
+                freed = self.storage.incremental_vacuum(limit)
+                report['vacuumed_pages'] += freed
+                return freed
+
+            complete = self._chunked(vacuum, self.vacuum_pages, deadline, report) and complete
+            self.storage.checkpoint()
+
+        pages_after = self.storage.page_stats()
+        report['bytes_reclaimed'] = report['vacuumed_pages'] * pages_after['page_size']
+        report['free_bytes'] = pages_after['freelist_count'] * pages_after['page_size']
+        report['file_bytes_before'] = file_before
+        report['file_bytes_after'] = self._file_bytes()
+        report['complete'] = complete
+        report['seconds'] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        return report
+
+    def start(self, interval_s: float = DEFAULT_INTERVAL_S,
+              time_budget_s: float = DEFAULT_TIME_BUDGET_S) -> None:
+        """Run a bounded pass every interval_s in a background thread"""
+        def loop() -> None:
+            while not self._stop.wait(interval_s):
+                try:
+                    self.run(time_budget_s)
+                except Exception as e:
+                    print(f"Retention pass failed: {e}", file=sys.stderr)
+
+        self._thread = threading.Thread(target=loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop the background thread; a pass in progress ends after its current chunk"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
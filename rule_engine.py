@@ -0,0 +1,222 @@
+"""
+Deterministic rule engine for the moderation fast path.
+
+Runs before the LLM. Golden rules that can be matched with certainty
+(GPS coordinates, unit numbers with operational detail, messages made
+only of a volunteer's name and phone, or only of thanks and greetings)
+produce a final verdict in microseconds. Everything else is left to the later tiers and the LLM.
+
+Matching uses a set of precompiled regular expressions plus a single
+multi-pattern keyword automaton (Aho-Corasick) over Hebrew terms, so each
+message is scanned once regardless of how many keywords are configured.
+"""
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Regex rules
+GPS_DEGREES_RE = re.compile(
+    r"\d{1,3}(?:[.,]\d+)?\s*°\s*(?:\d{1,2}(?:[.,]\d+)?\s*['′]\s*)?[NSEWnsew]"
+)
+GPS_DECIMAL_PAIR_RE = re.compile(r"\b\d{2}\.\d{4,}\s*,\s*\d{2}\.\d{4,}\b")
+UNIT_NUMBER_RE = re.compile(
+    r"(?:גדוד|יחידה|יחידת|חטיבה|חטיבת|פלוגה|פלוגת|סיירת|אוגדה|אוגדת)\s*\d{2,4}"
+)
+PHONE_RE = re.compile(r"(?:\+972[-\s]?|\b0)5\d[-\s]?\d{3}[-\s]?\d{4}\b")
+TIME_RE = re.compile(r"\b(?:[01]?\d|2[0-3]):[0-5]\d\b")
+DIGIT_RE = re.compile(r"\d")
+# Any letter in any script
+LETTER_RE = re.compile(r"[^\W\d_]")
+
+# Keyword categories for the automaton
+DEFAULT_KEYWORDS: Dict[str, List[str]] = {
+    "operational": [
+        "משימה", "מבצע", "יוצא", "יוצאים", "נכנס", "נכנסים", "פריסה", "מארב",
+        "תקיפה", "קואורדינטות", "מיקום", "ממוקמים", "עמדה", "ציר", "כוחות",
+    ],
+    "military": [
+        "חייל", "חיילים", "חיילת", "לוחם", "לוחמים", "לוחמות", "מפקד", "קצין",
+        "בסיס", "שטח", "גדוד", "יחידה", "חטיבה", "פלוגה", "סיירת", "צבא", "צה\"ל",
+    ],
+    "gaza": ["עזה"],
+    "kfar_aza": ["כפר עזה"],
+    "gratitude": [
+        "תודה", "תודות", "שלום", "בוקר טוב", "ערב טוב", "לילה טוב", "שבת שלום",
+        "כל הכבוד", "אלופים", "אלופות", "מרגש", "❤️", "🙏", "👏",
+        # Words that may accompany a greeting without adding content
+        "רבה", "לכולם", "לכל המתנדבים", "לכל המתנדבות", "חברים",
+    ],
+}
+
+# Personal names that mark a phone number as a volunteer contact
+DEFAULT_VOLUNTEER_NAMES = ["לימור", "עומרי", "יפה"]
+
+# Signals that rule out a certain APPROVED verdict
+RISK_CATEGORIES = {"operational", "military", "gaza"}
+
+GRATITUDE_MAX_LENGTH = 80
+
+RULE_PREFIX = "כלל אוטומטי"
+
+
+def _is_word(text: str, start: int, end: int) -> bool:
+    """The span is not part of a longer word"""
+    return (start == 0 or not text[start - 1].isalpha()) \
+        and (end == len(text) or not text[end].isalpha())
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton mapping keywords to categories"""
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, int]]] = [[]]
+
+        for category, words in keywords.items():
+            for word in words:
+                self._add(word.lower(), category)
+
+        self._build_failure_links()
+
+    def _add(self, word: str, category: str) -> None:
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append((category, len(word)))
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[str, int, int]]:
+        """Return (category, start, end) for every keyword occurrence"""
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        state = 0
+        for index, char in enumerate(text.lower()):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for category, length in output[state]:
+                    matches.append((category, index - length + 1, index + 1))
+        return matches
+
+
+class RuleEngine:
+    """Compiled golden-rule checks run ahead of the LLM"""
+
+    def __init__(self, keywords: Optional[Dict[str, List[str]]] = None,
+                 volunteer_names: Optional[List[str]] = None):
+        keywords = dict(keywords or DEFAULT_KEYWORDS)
+        keywords["volunteer_name"] = list(volunteer_names or DEFAULT_VOLUNTEER_NAMES)
+        self.automaton = KeywordAutomaton(keywords)
+
+    def signals(self, content: str) -> Set[str]:
+        """Return the set of signal names found in a message"""
+        found: Set[str] = set()
+
+        kfar_aza_spans = []
+        gaza_spans = []
+        for category, start, end in self.automaton.find(content):
+            if category == "kfar_aza":
+                kfar_aza_spans.append((start, end))
+            elif category == "gaza":
+                gaza_spans.append((start, end))
+            elif category == "volunteer_name":
+                # Whole words only - "יפה" is also an adjective
+                if _is_word(content, start, end):
+                    found.add(category)
+            else:
+                found.add(category)
+
+        if kfar_aza_spans:
+            found.add("kfar_aza")
+        # "עזה" counts as ambiguous only when it is not part of "כפר עזה"
+        for start, end in gaza_spans:
+            if not any(k_start <= start and end <= k_end for k_start, k_end in kfar_aza_spans):
+                found.add("gaza")
+                break
+
+        if GPS_DEGREES_RE.search(content):
+            found.add("gps_degrees")
+        if GPS_DECIMAL_PAIR_RE.search(content):
+            found.add("gps_decimal")
+        if UNIT_NUMBER_RE.search(content):
+            found.add("unit_number")
+        if PHONE_RE.search(content):
+            found.add("phone")
+        if TIME_RE.search(content):
+            found.add("time")
+        if DIGIT_RE.search(content):
+            found.add("digits")
+
+        return found
+
+    def evaluate(self, content: str) -> Optional[Dict]:
+        """Return a final verdict if a rule fires with certainty, else None"""
+        found = self.signals(content)
+
+        if "gps_degrees" in found or "gps_decimal" in found:
+            return self._verdict("gps_coordinates", 'CLEAR_VIOLATION', 0.97,
+                                 "קואורדינטות GPS בהודעה", found)
+
+        if "unit_number" in found and ("operational" in found or "time" in found):
+            return self._verdict("unit_operational", 'CLEAR_VIOLATION', 0.95,
+                                 "מספר יחידה יחד עם פרטים מבצעיים", found)
+
+        if found & RISK_CATEGORIES or "unit_number" in found:
+            return None
+
+        if ("phone" in found and "volunteer_name" in found
+                and self._only(content, {"volunteer_name", "gratitude"}, phones=True)):
+            return self._verdict("volunteer_contact", 'APPROVED', 0.9,
+                                 "שם אישי + טלפון = מתנדב", found)
+
+        if ("gratitude" in found and "digits" not in found
+                and len(content) <= GRATITUDE_MAX_LENGTH and self._only(content, {"gratitude"})):
+            return self._verdict("gratitude", 'APPROVED', 0.9,
+                                 "הודעת תודה/ברכה ללא פרטים רגישים", found)
+
+        return None
+
+    def _only(self, content: str, categories: Set[str], phones: bool = False) -> bool:
+        """True if nothing but these keywords (and phone numbers), emoji and punctuation is left"""
+        covered = [False] * len(content)
+        for category, start, end in self.automaton.find(content):
+            if category in categories and (category != "volunteer_name"
+                                           or _is_word(content, start, end)):
+                covered[start:end] = [True] * (end - start)
+        if phones:
+            for match in PHONE_RE.finditer(content):
+                covered[match.start():match.end()] = [True] * (match.end() - match.start())
+        rest = "".join(char for char, skip in zip(content, covered) if not skip)
+        return not LETTER_RE.search(rest) and not DIGIT_RE.search(rest)
+
+    def _verdict(self, rule: str, classification: str, confidence: float,
+                 reason: str, found: Set[str]) -> Dict:
+        return {
+            'rule': rule,
+            'classification': classification,
+            'confidence': confidence,
+            'reasoning': f"{RULE_PREFIX} ({rule}): {reason}",
+            'signals': sorted(found),
+        }
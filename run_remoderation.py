@@ -0,0 +1,148 @@
+"""
+Re-score stored messages with the current prompt and thresholds.
+
+Runs a bulk re-moderation (see remoderation.py) of one group's history
+and prints which messages would flip between APPROVE, FLAG_FOR_REVIEW and
+DELETE_MESSAGE. Live verdicts are never changed. Running the same --run
+again resumes it; --report-only prints the diff so far without calling
+the LLM. A run name is tied to its prompt and thresholds - try a change
+under a new name.
+
+Usage:
+    python run_remoderation.py --run prompt-v2 --prompt-file prompt_v2.json
+    python run_remoderation.py --run strict-delete --delete-confidence 0.8 --limit 500
+    python run_remoderation.py --run prompt-v2 --report-only --show 50 --json diff.json
+"""
+import argparse
+import json
+import os
+import sys
+
+from group_config import find_group, groups_or_default
+from remoderation import (
+    ACTIONS, DEFAULT_CONCURRENCY, DEFAULT_PAGE_SIZE, REMODERATION_REQUESTS_PER_MINUTE,
+    ConfigMismatch, Remoderation
+)
+
+PREVIEW_CHARS = 60
+
+
+def print_report(report: dict) -> None:
+    print(f"Run {report['run_id']} ({report['status']}): {report['rescored']} messages re-scored, "
+          f"{report['flipped']} would change, {report['failed']} without a verdict")
+    print("\n" + "live \\ new".ljust(18) + "".join(f"{action:>18}" for action in ACTIONS))
+    for old in ACTIONS:
+        print(f"{old:<18}" + "".join(f"{report['transitions'][old][new]:>18}" for new in ACTIONS))
+    if report['flips']:
+        print("\nChanged verdicts:")
+    for flip in report['flips']:
+        content = (flip['content'] or "").replace("\n", " ")[:PREVIEW_CHARS]
+        print(f"  {flip['message_id']}: {flip['old_action']} -> {flip['action']} "
+              f"({flip['classification']} {flip['confidence'] or 0:.2f}, {flip['verdict_source']}) "
+              f"{content}")
+
+
+def print_remoderation_report(remoderation: Remoderation, args) -> None:
+    try:
+        report = remoderation.report(show=args.show)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+def main():
+    """Run or resume a re-moderation and print its diff"""
+    parser = argparse.ArgumentParser(description="Re-score history without touching live verdicts")
+    parser.add_argument("--run", required=True, help="Run name; the same name resumes the run")
+    parser.add_argument("--group", help="Group id from groups.json (default: the first group)")
+    parser.add_argument("--groups", default="groups.json", help="Groups file, if any")
+    parser.add_argument("--db", default="whatsapp_moderation.db",
+                        help="Database path when there is no groups file")
+    parser.add_argument("--prompt-version", help="Prompt artifact version to test")
+    parser.add_argument("--prompt-file", help="JSON file overriding prompt artifact fields")
+    parser.add_argument("--delete-confidence", type=float,
+                        help="Confidence above which a CLEAR_VIOLATION is deleted")
+    parser.add_argument("--no-rules", action="store_true", help="Send every message to the LLM")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="LLM calls in flight at once")
+    parser.add_argument("--groq-rpm", type=float, default=REMODERATION_REQUESTS_PER_MINUTE,
+                        help="Requests per minute for this run (the bot shares the quota)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help="Messages read and checkpointed at a time")
+    parser.add_argument("--limit", type=int, help="Stop after this many messages (resume later)")
+    parser.add_argument("--report-only", action="store_true", help="Print the diff so far")
+    parser.add_argument("--show", type=int, default=20, help="Changed messages to list")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    try:
+        group = find_group(groups_or_default(args.groups, args.db), args.group)
+    except (OSError, ValueError) as e:
+        print(f"Invalid group: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.prompt_version:
+        group.prompt_version = args.prompt_version
+    if args.prompt_file:
+        group.prompt_file = args.prompt_file
+    if args.no_rules:
+        group.use_rules = False
+    try:
+        prompt_config = group.prompt_config()
+        policy_key = group.policy_key()
+    except (OSError, ValueError) as e:
+        print(f"Invalid prompt: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.report_only:
+        from moderation_storage import get_storage
+        storage = get_storage(group.db_path)
+        storage.setup_schema()
+        print_remoderation_report(Remoderation(None, args.run, {}, storage=storage), args)
+        return
+
+    # Imported here so --report-only does not load the LLM stack
+    from llm_moderation_agent import DELETE_CONFIDENCE, ModerationAgent
+    from moderation_prompts import CompiledPrompt
+
+    delete_confidence = args.delete_confidence if args.delete_confidence is not None \
+        else group.delete_confidence if group.delete_confidence is not None else DELETE_CONFIDENCE
+    # Everything the new verdicts depend on, so a resumed run cannot mix two settings
+    config = {
+        'group': group.group_id, 'prompt_version': group.prompt_version,
+        'prompt': policy_key, 'delete_confidence': delete_confidence,
+        'use_rules': group.use_rules,
+    }
+
+    groq_api_key = os.getenv('GROQ_API_KEY')
+    if not groq_api_key:
+        print("GROQ_API_KEY not found in environment variables", file=sys.stderr)
+        sys.exit(1)
+    agent = ModerationAgent(
+        groq_api_key, db_path=group.db_path, prompt=CompiledPrompt(prompt_config),
+        rule_engine=group.rule_engine(), use_rules=group.use_rules,
+        use_cache=False, use_near_duplicates=False, use_local_classifier=False,
+        requests_per_minute=args.groq_rpm, delete_confidence=delete_confidence,
+        group_id=group.group_id)
+    remoderation = Remoderation(agent, args.run, config, concurrency=args.concurrency,
+                                page_size=args.page_size)
+    try:
+        summary = remoderation.run(limit=args.limit)
+    except ConfigMismatch as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"Interrupted - run again with --run {args.run} to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        agent.close()
+    print(f"This pass: {json.dumps(summary)}", file=sys.stderr)
+    print_remoderation_report(remoderation, args)
+
+
+if __name__ == "__main__":
+    main()
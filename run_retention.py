@@ -0,0 +1,65 @@
+"""
+Apply the retention policy to the moderation database.
+
+Redacts message content after --redact-after-days, moves messages older
+than --archive-after-days into compressed monthly archive partitions, and
+deletes expired verdict-cache and near-duplicate entries. Then it returns
+free pages to the file system with incremental vacuum. Work is done in
+short chunks, so it is safe to run while the bot is live; with --budget the
+pass stops after that many seconds and the next run continues. The
+moderation server runs the same pass periodically.
+
+An existing database has to be converted to incremental auto-vacuum once
+(--enable-incremental-vacuum runs a single full VACUUM; stop the bot first).
+
+Usage:
+    python run_retention.py [--db whatsapp_moderation.db] [--redact-after-days 30]
+                            [--archive-after-days 180] [--budget 60]
+"""
+import argparse
+import json
+
+from moderation_storage import ModerationStorage
+from near_duplicate import NearDuplicateIndex
+from retention import (
+    DEFAULT_ARCHIVE_AFTER_DAYS, DEFAULT_CHUNK_ROWS, DEFAULT_MAX_CHUNK_MS,
+    DEFAULT_REDACT_AFTER_DAYS, RetentionManager
+)
+from verdict_cache import VerdictCache
+
+
+def main():
+    """Run one retention pass and print its report"""
+    parser = argparse.ArgumentParser(description="Redact, archive and vacuum old messages")
+    parser.add_argument("--db", default="whatsapp_moderation.db", help="Database path")
+    parser.add_argument("--redact-after-days", type=float, default=DEFAULT_REDACT_AFTER_DAYS,
+                        help="Drop message content after this many days (0 = keep)")
+    parser.add_argument("--archive-after-days", type=float, default=DEFAULT_ARCHIVE_AFTER_DAYS,
+                        help="Move messages to the archive after this many days (0 = never)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Largest number of rows per transaction")
+    parser.add_argument("--max-chunk-ms", type=float, default=DEFAULT_MAX_CHUNK_MS,
+                        help="Shrink chunks that hold the write lock longer than this")
+    parser.add_argument("--budget", type=float, help="Stop after this many seconds")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Convert the database to incremental auto-vacuum (one full VACUUM)")
+    args = parser.parse_args()
+
+    storage = ModerationStorage(args.db)
+    storage.setup_schema()
+
+    if args.enable_incremental_vacuum and storage.page_stats()['auto_vacuum'] != 'incremental':
+        storage.enable_incremental_vacuum()
+
+    manager = RetentionManager(storage, redact_after_days=args.redact_after_days,
+                               archive_after_days=args.archive_after_days,
+                               chunk_rows=args.chunk_rows, max_chunk_ms=args.max_chunk_ms,
+                               verdict_cache=VerdictCache(storage),
+                               near_duplicates=NearDuplicateIndex(storage))
+    report = manager.run(time_budget_s=args.budget)
+    report['archive'] = storage.archive_stats()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
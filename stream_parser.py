@@ -0,0 +1,163 @@
+"""
+Incremental parser for the LLM's JSON verdict.
+
+The model is asked for a flat JSON object but often wraps it in prose or
+code fences, truncates it, or puts braces inside the reasoning text, which
+defeats slicing between the first '{' and the last '}'. This parser is fed
+the output chunk by chunk (or all at once) and reports each top-level field
+of the first object as soon as its value is complete, so a streaming
+caller can act on "classification" and "confidence" before the reasoning
+has been generated. Text before the object is skipped; a syntax error
+drops the partial object and the search for the next '{' starts again.
+"""
+import json
+from typing import Any, Dict
+
+_SEEK = 0        # Before the object
+_KEY = 1         # Expecting a key, ',' or '}'
+_KEY_STRING = 2  # Inside a key
+_COLON = 3       # After a key
+_VALUE = 4       # Expecting a value
+_STRING = 5      # Inside a string value
+_LITERAL = 6     # Inside a number / true / false / null
+_NESTED = 7      # Inside a nested object or array (kept raw)
+_DONE = 8        # Object closed
+
+_LITERAL_START = set("-0123456789tfn")
+_WHITESPACE = set(" \t\r\n")
+
+
+class IncrementalJsonParser:
+    """Top-level fields of the first JSON object in a text stream"""
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._state = _SEEK
+        self._key = ""
+        self._buffer = []
+        self._escaped = False
+        self._depth = 0
+        self._nested_in_string = False
+
+    @property
+    def complete(self) -> bool:
+        return self._state == _DONE
+
+    def _fail(self) -> None:
+        """Malformed object - forget it and look for the next one"""
+        self.fields = {}
+        self._state = _SEEK
+
+    def _store(self, raw: str, state_after: int = _KEY) -> bool:
+        try:
+            self.fields[self._key] = json.loads(raw)
+        except ValueError:
+            self._fail()
+            return False
+        self._state = state_after
+        return True
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Consume more output; returns the fields known so far"""
+        for char in chunk or "":
+            state = self._state
+            if state == _DONE:
+                break
+
+            if state == _SEEK:
+                if char == "{":
+                    self.fields = {}
+                    self._state = _KEY
+
+            elif state == _KEY:
+                if char == '"':
+                    self._buffer = []
+                    self._escaped = False
+                    self._state = _KEY_STRING
+                elif char == "}":
+                    self._state = _DONE
+                elif char != "," and char not in _WHITESPACE:
+                    self._fail()
+
+            elif state in (_KEY_STRING, _STRING):
+                if self._escaped:
+                    self._escaped = False
+                    self._buffer.append(char)
+                elif char == "\\":
+                    self._escaped = True
+                    self._buffer.append(char)
+                elif char == '"':
+                    raw = '"' + "".join(self._buffer) + '"'
+                    if state == _KEY_STRING:
+                        try:
+                            self._key = json.loads(raw)
+                            self._state = _COLON
+                        except ValueError:
+                            self._fail()
+                    else:
+                        self._store(raw)
+                else:
+                    self._buffer.append(char)
+
+            elif state == _COLON:
+                if char == ":":
+                    self._state = _VALUE
+                elif char not in _WHITESPACE:
+                    self._fail()
+
+            elif state == _VALUE:
+                if char == '"':
+                    self._buffer = []
+                    self._escaped = False
+                    self._state = _STRING
+                elif char in "{[":
+                    self._buffer = [char]
+                    self._depth = 1
+                    self._nested_in_string = False
+                    self._escaped = False
+                    self._state = _NESTED
+                elif char in _LITERAL_START:
+                    self._buffer = [char]
+                    self._state = _LITERAL
+                elif char not in _WHITESPACE:
+                    self._fail()
+
+            elif state == _LITERAL:
+                if char == "," or char == "}" or char in _WHITESPACE:
+                    if self._store("".join(self._buffer)) and char == "}":
+                        self._state = _DONE
+                else:
+                    self._buffer.append(char)
+
+            elif state == _NESTED:
+                self._buffer.append(char)
+                if self._nested_in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._nested_in_string = False
+                elif char == '"':
+                    self._nested_in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._store("".join(self._buffer))
+
+        return self.fields
+
+    def finish(self) -> Dict[str, Any]:
+        """End of output - a trailing number without a delimiter still counts"""
+        if self._state == _LITERAL:
+            self._store("".join(self._buffer))
+        return self.fields
+
+
+def parse_json_fields(text: str) -> Dict[str, Any]:
+    """Fields of the first JSON object in text, even if it is cut short"""
+    parser = IncrementalJsonParser()
+    parser.feed(text)
+    return parser.finish()
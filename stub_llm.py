@@ -0,0 +1,194 @@
+"""
+Local stand-in for ChatGroq used by the offline benchmarks.
+
+Implements the invoke()/ainvoke() subset ModerationAgent uses, with
+configurable latency, error rate, malformed-output rate and an optional
+provider-side rate limit (429 with Retry-After), and a crude keyword
+classifier so verdicts look plausible. Micro-batch prompts are answered
+with a JSON array. stream()/astream() deliver the same reply in small
+chunks, with part of the latency before the first chunk.
+
+    agent = ModerationAgent(groq_api_key="stub", db_path=...)
+    agent.llm = StubLLM(latency_ms=300, error_rate=0.02, malformed_rate=0.05)
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+STREAM_CHUNK_CHARS = 8
+FIRST_CHUNK_SHARE = 0.4  # Of the latency, spent before the first chunk
+
+
+class StubLLMError(Exception):
+    """Simulated provider failure"""
+
+    def __init__(self, message: str, status_code: int = 429, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class StubLLM:
+    """Fake chat model with tunable latency and failure modes"""
+
+    def __init__(self, latency_ms: float = 300, jitter_ms: float = 100,
+                 error_rate: float = 0.0, malformed_rate: float = 0.0,
+                 rate_limit_rpm: Optional[float] = None, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.rate_limit_rpm = rate_limit_rpm
+        self._window: deque = deque()
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.streams_stopped = 0
+
+    def _check_rate_limit(self) -> None:
+        """Sliding one-minute window, like the provider's RPM quota"""
+        if not self.rate_limit_rpm:
+            return
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            if len(self._window) >= self.rate_limit_rpm:
+                self.rate_limited += 1
+                raise StubLLMError("429 Too Many Requests: rate limit reached",
+                                   retry_after=round(60 - (now - self._window[0]), 3))
+            self._window.append(now)
+
+    def _roll(self):
+        self._check_rate_limit()
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            return delay, self._rng.random(), self._rng.random()
+
+    def _message_text(self, messages: List) -> str:
+        prompt = "".join(str(getattr(m, "content", m)) for m in messages)
+        marker = 'הודעה לבדיקה: "'
+        start = prompt.rfind(marker)
+        if start == -1:
+            return prompt
+        start += len(marker)
+        end = prompt.find('"\n', start)
+        return prompt[start:end if end != -1 else None]
+
+    def _batch_texts(self, messages: List) -> Optional[List[str]]:
+        """Message contents of a micro-batch prompt, or None for a single message"""
+        prompt = "".join(str(getattr(m, "content", m)) for m in messages)
+        marker = "הודעות לבדיקה:\n"
+        start = prompt.rfind(marker)
+        if start == -1:
+            return None
+        texts = []
+        for line in prompt[start + len(marker):].split("\n"):
+            number, _, quoted = line.partition(". ")
+            if not number.isdigit():
+                break
+            texts.append(json.loads(quoted))
+        return texts
+
+    def _classify(self, text: str):
+        if '°' in text or 'גדוד' in text or 'יחידה' in text:
+            return 'CLEAR_VIOLATION', 0.9, "פרטים מבצעיים"
+        if 'עזה' in text and 'כפר עזה' not in text:
+            return 'CONTEXT_DEPENDENT', 0.6, "איזה עזה?"
+        return 'APPROVED', 0.85, "בקשת עזרה לגיטימית"
+
+    def _single_reply(self, text: str, malformed_roll: float) -> str:
+        classification, confidence, reasoning = self._classify(text)
+        if malformed_roll < self.malformed_rate:
+            # Alternate between prose (fallback parser) and truncated JSON (error path)
+            if malformed_roll < self.malformed_rate / 2:
+                return f"הסיווג הוא {classification}\nההודעה נראית כמו {reasoning} ולכן זה הסיווג"
+            return '{"classification": "%s", "confidence": ' % classification
+        return json.dumps({
+            "classification": classification,
+            "confidence": confidence,
+            "reasoning": reasoning,
+        }, ensure_ascii=False)
+
+    def _respond(self, messages: List, error_roll: float, malformed_roll: float) -> AIMessage:
+        if error_roll < self.error_rate:
+            raise StubLLMError("Simulated LLM failure (503 Service Unavailable)", status_code=503)
+
+        batch = self._batch_texts(messages)
+        if batch is not None:
+            items = []
+            for number, text in enumerate(batch, start=1):
+                classification, confidence, reasoning = self._classify(text)
+                items.append({"message_id": str(number), "classification": classification,
+                              "confidence": confidence, "reasoning": reasoning})
+            if malformed_roll < self.malformed_rate:
+                items.pop(int(malformed_roll * 1000) % len(items))  # One answer goes missing
+            content = json.dumps(items, ensure_ascii=False)
+        else:
+            content = self._single_reply(self._message_text(messages), malformed_roll)
+
+        prompt_chars = sum(len(str(getattr(m, "content", m))) for m in messages)
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_chars // 3,
+            "output_tokens": len(content) // 3,
+            "total_tokens": prompt_chars // 3 + len(content) // 3,
+        })
+
+    def invoke(self, messages: List, **kwargs) -> AIMessage:
+        delay, error_roll, malformed_roll = self._roll()
+        time.sleep(delay)
+        return self._respond(messages, error_roll, malformed_roll)
+
+    async def ainvoke(self, messages: List, **kwargs) -> AIMessage:
+        delay, error_roll, malformed_roll = self._roll()
+        await asyncio.sleep(delay)
+        return self._respond(messages, error_roll, malformed_roll)
+
+    def _stream_plan(self, messages: List):
+        """(delay before first chunk, delay per chunk, chunks) for one streamed reply"""
+        delay, error_roll, malformed_roll = self._roll()
+        message = self._respond(messages, error_roll, malformed_roll)
+        content = message.content
+        chunks = [AIMessageChunk(content=content[i:i + STREAM_CHUNK_CHARS])
+                  for i in range(0, len(content), STREAM_CHUNK_CHARS)] or [AIMessageChunk(content="")]
+        chunks[-1] = AIMessageChunk(content=chunks[-1].content, usage_metadata=message.usage_metadata)
+        return delay * FIRST_CHUNK_SHARE, delay * (1 - FIRST_CHUNK_SHARE) / len(chunks), chunks
+
+    def stream(self, messages: List, **kwargs) -> Iterator[AIMessageChunk]:
+        first, per_chunk, chunks = self._stream_plan(messages)
+        time.sleep(first)
+        sent = 0
+        try:
+            for chunk in chunks:
+                yield chunk
+                sent += 1
+                if sent < len(chunks):
+                    time.sleep(per_chunk)
+        finally:
+            if sent < len(chunks):
+                with self._lock:
+                    self.streams_stopped += 1
+
+    async def astream(self, messages: List, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        first, per_chunk, chunks = self._stream_plan(messages)
+        await asyncio.sleep(first)
+        sent = 0
+        try:
+            for chunk in chunks:
+                yield chunk
+                sent += 1
+                if sent < len(chunks):
+                    await asyncio.sleep(per_chunk)
+        finally:
+            if sent < len(chunks):
+                with self._lock:
+                    self.streams_stopped += 1
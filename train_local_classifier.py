@@ -0,0 +1,43 @@
+"""
+Retrain and calibrate the local classifier from stored messages and feedback.
+
+Trains on 80% of the labelled messages, picks the confidence threshold
+at which local approvals reach the target precision on the other 20%,
+then retrains on everything and saves the model. Restart the bot (or
+server) to load it; a running one loads it at its next save instead of
+overwriting it.
+
+Usage:
+    python train_local_classifier.py [--db whatsapp_moderation.db] [--target-precision 0.97]
+"""
+import argparse
+import json
+import time
+
+from local_classifier import DEFAULT_TARGET_PRECISION, LocalClassifier
+from moderation_storage import ModerationStorage
+
+
+def main():
+    """Retrain the local classifier and print calibration and per-tier accuracy"""
+    parser = argparse.ArgumentParser(description="Retrain the local classifier")
+    parser.add_argument("--db", default="whatsapp_moderation.db", help="Database path")
+    parser.add_argument("--target-precision", type=float, default=DEFAULT_TARGET_PRECISION,
+                        help="Required precision of local verdicts on held-out messages")
+    args = parser.parse_args()
+
+    storage = ModerationStorage(args.db)
+    storage.setup_schema()
+    classifier = LocalClassifier(storage)
+
+    start = time.perf_counter()
+    result = classifier.retrain(target_precision=args.target_precision)
+    result['trained_in_seconds'] = round(time.perf_counter() - start, 3)
+    result['active'] = classifier.stats()['active']
+    result['tier_accuracy'] = storage.tier_accuracy()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
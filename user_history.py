@@ -0,0 +1,135 @@
+"""
+In-memory per-user verdict history for the get_context node.
+
+An LRU over users, each holding a fixed-size ring buffer of their most
+recent verdicts (newest first). A user's buffer is warmed lazily from the
+database on first lookup and then kept current on every save and every
+admin feedback, so the context node does no I/O for active members.
+Memory is bounded by max_users * per_user entries with truncated reasoning.
+"""
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from moderation_storage import ModerationStorage
+
+DEFAULT_MAX_USERS = 2000
+DEFAULT_PER_USER = 5
+MAX_REASONING_CHARS = 200
+
+
+class _UserBuffer:
+    __slots__ = ("entries", "warm")
+
+    def __init__(self, per_user: int, warm: bool):
+        self.entries: Deque[Dict] = deque(maxlen=per_user)
+        # False when the buffer only holds verdicts seen since startup
+        self.warm = warm
+
+
+class UserHistoryCache:
+    """Bounded LRU of per-user recent verdict ring buffers"""
+
+    def __init__(self, storage: ModerationStorage, max_users: int = DEFAULT_MAX_USERS,
+                 per_user: int = DEFAULT_PER_USER):
+        self.storage = storage
+        self.max_users = max_users
+        self.per_user = per_user
+
+        self._users: "OrderedDict[str, _UserBuffer]" = OrderedDict()
+        self._message_users: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.loads = 0
+
+    def _entry(self, message_id: Optional[str], classification: str,
+               reasoning: str, feedback: Optional[str]) -> Dict:
+        return {
+            'message_id': message_id,
+            'classification': classification,
+            'reasoning': (reasoning or '')[:MAX_REASONING_CHARS],
+            'feedback': feedback,
+        }
+
+    def _touch(self, user_id: str, buffer: _UserBuffer) -> None:
+        self._users[user_id] = buffer
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            _, evicted = self._users.popitem(last=False)
+            for entry in evicted.entries:
+                self._message_users.pop(entry['message_id'], None)
+
+    def _push(self, user_id: str, buffer: _UserBuffer, entry: Dict, newest: bool) -> None:
+        """Insert a fresh verdict at the front, or an older one at the back"""
+        message_id = entry['message_id']
+        for existing in buffer.entries:
+            if existing['message_id'] == message_id:
+                if not newest:
+                    return  # Memory already has this (possibly newer) verdict
+                buffer.entries.remove(existing)
+                break
+
+        if newest:
+            if len(buffer.entries) == buffer.entries.maxlen:
+                self._message_users.pop(buffer.entries[-1]['message_id'], None)
+            buffer.entries.appendleft(entry)
+        elif len(buffer.entries) < buffer.entries.maxlen:
+            buffer.entries.append(entry)
+        else:
+            return
+
+        self._message_users[message_id] = user_id
+
+    def get(self, user_id: str) -> List[Dict]:
+        """Recent verdicts for a user, newest first"""
+        with self._lock:
+            buffer = self._users.get(user_id)
+            if buffer is not None and buffer.warm:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return [dict(entry) for entry in buffer.entries]
+
+        # Cold user - one indexed query, then served from memory
+        rows = self.storage.get_user_history(user_id, limit=self.per_user)
+
+        with self._lock:
+            self.loads += 1
+            buffer = self._users.get(user_id) or _UserBuffer(self.per_user, warm=False)
+            for row in rows:
+                self._push(user_id, buffer,
+                           self._entry(row['message_id'], row['classification'],
+                                       row['reasoning'], row['feedback']),
+                           newest=False)
+            buffer.warm = True
+            self._touch(user_id, buffer)
+            return [dict(entry) for entry in buffer.entries]
+
+    def record(self, user_id: str, message_id: str, classification: str, reasoning: str) -> None:
+        """Add a fresh verdict (called on every save)"""
+        with self._lock:
+            buffer = self._users.get(user_id) or _UserBuffer(self.per_user, warm=False)
+            self._push(user_id, buffer,
+                       self._entry(message_id, classification, reasoning, None),
+                       newest=True)
+            self._touch(user_id, buffer)
+
+    def record_feedback(self, message_id: str, feedback: str) -> None:
+        """Attach admin feedback to a cached verdict, if present"""
+        with self._lock:
+            user_id = self._message_users.get(message_id)
+            buffer = self._users.get(user_id) if user_id else None
+            if buffer is None:
+                return
+            for entry in buffer.entries:
+                if entry['message_id'] == message_id:
+                    entry['feedback'] = feedback
+                    break
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'hits': self.hits,
+                'loads': self.loads,
+            }
@@ -0,0 +1,175 @@
+"""
+Verdict cache keyed on normalized message content.
+
+Forwarded messages (the same donation request reposted by many members)
+are answered from the cache instead of a fresh LLM call. Two layers:
+an in-memory LRU for the hot set and a SQLite table that survives
+restarts. Entries expire after a configurable TTL and are invalidated
+when admin feedback says the verdict was wrong.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from moderation_storage import ModerationStorage
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# Punctuation and symbols are folded away; letters, digits and emoji stay,
+# so phone numbers survive normalization ("050-1234567" -> "0501234567")
+_PUNCTUATION_RE = re.compile(r"[\s\-_.,:;!?\"'`()\[\]{}<>/\\|*~^+=#@&%$׳״־…–—]+")
+_DIGIT_SEPARATOR_RE = re.compile(r"(?<=\d)[\s\-]+(?=\d)")
+
+
+def normalize_content(content: str) -> str:
+    """Fold whitespace and punctuation, keep words and digits"""
+    # Join digit groups first so "050-123 4567" and "0501234567" match
+    content = _DIGIT_SEPARATOR_RE.sub("", content.lower())
+    return _PUNCTUATION_RE.sub(" ", content).strip()
+
+
+def content_key(content: str) -> str:
+    """Stable cache key for a message"""
+    return hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """Two-level (memory LRU + SQLite) verdict cache"""
+
+    def __init__(self, storage: ModerationStorage, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+        self.setup_table()
+
+    def setup_table(self):
+        """Create the persistent cache table"""
+        with self.storage.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS verdict_cache (
+                    content_hash TEXT PRIMARY KEY,
+                    classification TEXT,
+                    confidence REAL,
+                    reasoning TEXT,
+                    created_at REAL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_verdict_cache_created "
+                "ON verdict_cache(created_at)"
+            )
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry['created_at'] > self.ttl_seconds
+
+    def _remember(self, key: str, entry: Dict) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, content: str) -> Optional[Dict]:
+        """Return cached verdict for this content, or None"""
+        key = content_key(content)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry, now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return dict(entry)
+                del self._memory[key]
+
+        row = self.storage.fetchone("""
+            SELECT classification, confidence, reasoning, created_at
+            FROM verdict_cache WHERE content_hash = ?
+        """, (key,))
+
+        if row:
+            entry = {
+                'classification': row[0],
+                'confidence': row[1],
+                'reasoning': row[2],
+                'created_at': row[3]
+            }
+            if not self._expired(entry, now):
+                self._remember(key, entry)
+                with self._lock:
+                    self.db_hits += 1
+                return dict(entry)
+            self.invalidate(content)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, content: str, classification: str, confidence: float, reasoning: str) -> None:
+        """Store a verdict for this content"""
+        key = content_key(content)
+        entry = {
+            'classification': classification,
+            'confidence': confidence,
+            'reasoning': reasoning,
+            'created_at': time.time()
+        }
+        self._remember(key, entry)
+
+        with self.storage.transaction() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO verdict_cache
+                (content_hash, classification, confidence, reasoning, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, classification, confidence, reasoning, entry['created_at']))
+
+    def invalidate(self, content: str) -> None:
+        """Drop the cached verdict for this content from both layers"""
+        key = content_key(content)
+        with self._lock:
+            self._memory.pop(key, None)
+
+        with self.storage.transaction() as conn:
+            conn.execute("DELETE FROM verdict_cache WHERE content_hash = ?", (key,))
+
+    def purge_expired(self, limit: Optional[int] = None) -> int:
+        """Delete up to limit expired rows from the persistent layer"""
+        if self.ttl_seconds is None:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        with self.storage.transaction() as conn:
+            # LIMIT -1 is no limit
+            cursor = conn.execute("""
+                DELETE FROM verdict_cache WHERE rowid IN (
+                    SELECT rowid FROM verdict_cache WHERE created_at < ? LIMIT ?
+                )
+            """, (cutoff, -1 if limit is None else limit))
+            return cursor.rowcount
+
+    def stats(self) -> Dict:
+        """Hit/miss counters"""
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': (hits / lookups * 100) if lookups else 0,
+                'memory_entries': len(self._memory),
+            }
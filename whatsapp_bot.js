@@ -3,15 +3,51 @@ const qrcode = require('qrcode-terminal');
 const { spawn } = require('child_process');
 const fs = require('fs');
 const path = require('path');
+const ModerationClient = require('./moderation_client');
+
+// Admin reactions are collected for this long and sent to the server together
+const FEEDBACK_FLUSH_MS = 2000;
+const REANALYSIS_POLL_MS = 15000;
+
+// Moderated groups and their rules - shared with moderation_server.py (see group_config.py)
+const GROUPS_FILE = process.env.GROUPS_FILE || 'groups.json';
+// Worker processes for the moderation server (unset = moderate in the server process)
+const MODERATION_PROCESSES = process.env.MODERATION_PROCESSES;
+const DEFAULT_GROUP = { id: 'default', name: 'אורות ברזל התנדבויות ועזרה 🇮🇱❤️' };
+
+function loadGroupConfigs() {
+    if (!fs.existsSync(GROUPS_FILE)) {
+        return [DEFAULT_GROUP];
+    }
+    const data = JSON.parse(fs.readFileSync(GROUPS_FILE, 'utf8'));
+    const groups = Array.isArray(data) ? data : data.groups;
+    return groups.map(group => ({ id: String(group.id), name: group.name || String(group.id) }));
+}
 
 class WhatsAppModerationBot {
     constructor() {
         this.client = null;
-        this.targetGroupId = null;
-        this.targetGroupName = 'אורות ברזל התנדבויות ועזרה 🇮🇱❤️';
+        this.groupConfigs = loadGroupConfigs();
+        // Found groups by chat id: { id, name, chatId, members, admins }
+        this.groups = new Map();
+        // Admins of any moderated group
         this.adminIds = new Set();
-        this.allMembers = new Set(); 
         this.pendingReviews = new Map(); 
+        this.moderationClient = new ModerationClient({
+            timeoutMs: 15000,
+            args: [
+                ...(fs.existsSync(GROUPS_FILE) ? ['--groups', GROUPS_FILE] : []),
+                ...(MODERATION_PROCESSES ? ['--processes', MODERATION_PROCESSES] : [])
+            ]
+        });
+        // Set while the LLM is unavailable and the server answers in degraded mode
+        this.degradedSince = null;
+        this.degradedApprovals = 0;
+        // Admin reactions waiting to be sent as one batch
+        this.feedbackQueue = [];
+        this.feedbackTimer = null;
+        // 🔄 requests by message id, until the server reports the new verdict
+        this.reanalysisRequests = new Map();
         
         this.setupClient();
     }
@@ -52,7 +88,7 @@ class WhatsAppModerationBot {
         // Client ready
         this.client.on('ready', async () => {
             console.log('WhatsApp Bot Ready for action!!');
-            await this.initializeGroup();
+            await this.initializeGroups();
             await this.sendStartupMessage();
         });
         
@@ -88,60 +124,72 @@ class WhatsAppModerationBot {
         });
     }
     
-    async initializeGroup() {
+    async initializeGroups() {
         try {
-            console.log(`Searching group: "${this.targetGroupName}"`);
-            
             const chats = await this.client.getChats();
-            const targetGroup = chats.find(chat => 
-                chat.isGroup && chat.name.includes(this.targetGroupName)
-            );
             
-            if (targetGroup) {
-                this.targetGroupId = targetGroup.id._serialized;
-                console.log(`Target group found:: ${targetGroup.name}`);
-                console.log(`${targetGroup.participants.length} participants in group`);
+            for (const config of this.groupConfigs) {
+                console.log(`Searching group: "${config.name}"`);
+                const targetGroup = chats.find(chat => 
+                    chat.isGroup && chat.name.includes(config.name)
+                );
                 
-                // FIX: Collect ALL participants, not just admins
-                const participants = targetGroup.participants;
-                for (const participant of participants) {
-                    // Add to all members set
-                    this.allMembers.add(participant.id._serialized);
-                    
-                    // Separately track admins
-                    if (participant.isAdmin || participant.isSuperAdmin) {
-                        this.adminIds.add(participant.id._serialized);
-                        console.log(`Admin identified: ${participant.id.user}`);
-                    } else {
-                        console.log(`Member identified: ${participant.id.user}`);
-                    }
+                if (!targetGroup) {
+                    console.log(`No group found with the name"${config.name}"`);
+                    console.log('Availability groups:');
+                    chats.filter(chat => chat.isGroup).forEach(chat => {
+                        console.log(`  - ${chat.name}`);
+                    });
+                    continue;
                 }
                 
-                console.log(`identified ${this.allMembers.size} Members including ${this.adminIds.size} Admins`);
-                
-                // Debug: Print member counts
-                console.log(`Total Members: ${this.allMembers.size}`);
-                console.log(`Admins: ${this.adminIds.size}`);
-                console.log(`Members: ${this.allMembers.size - this.adminIds.size}`);
+                const group = {
+                    ...config,
+                    chatId: targetGroup.id._serialized,
+                    members: new Set(),
+                    admins: new Set()
+                };
+                this.groups.set(group.chatId, group);
+                console.log(`Target group found:: ${targetGroup.name} (${group.id})`);
+                console.log(`${targetGroup.participants.length} participants in group`);
                 
-            } else {
-                console.log(`No group found with the name"${this.targetGroupName}"`);
-                console.log('Availability groups:');
-                chats.filter(chat => chat.isGroup).forEach(chat => {
-                    console.log(`  - ${chat.name}`);
-                });
+                this.loadParticipants(group, targetGroup.participants);
+                console.log(`identified ${group.members.size} Members including ${group.admins.size} Admins`);
             }
         } catch (error) {
             console.error('Error initializing group::', error);
         }
     }
     
+    loadParticipants(group, participants) {
+        // Collect ALL participants, not just admins
+        group.members.clear();
+        group.admins.clear();
+        for (const participant of participants) {
+            group.members.add(participant.id._serialized);
+            
+            // Separately track admins
+            if (participant.isAdmin || participant.isSuperAdmin) {
+                group.admins.add(participant.id._serialized);
+            }
+        }
+        
+        this.adminIds = new Set([...this.groups.values()].flatMap(g => [...g.admins]));
+    }
+    
+    groupById(groupId) {
+        return [...this.groups.values()].find(group => group.id === groupId) || null;
+    }
+    
     async sendStartupMessage() {
-        if (this.adminIds.size > 0) {
+        for (const group of this.groups.values()) {
+            if (group.admins.size === 0) {
+                continue;
+            }
             const startupMsg = `🤖 **סוכן חמ"ל פיקוח פעיל!**
 
-מחובר לקבוצת: ${this.targetGroupName}
-מפקח על ${this.allMembers.size} חברים (כולל ${this.adminIds.size} מנהלים)
+מחובר לקבוצת: ${group.name}
+מפקח על ${group.members.size} חברים (כולל ${group.admins.size} מנהלים)
 
 
 **איך זה עובד:**
@@ -152,13 +200,20 @@ class WhatsAppModerationBot {
 
 הסוכן פעיל ומפקח על כל ההודעות!`;
 
-            await this.notifyAdmins(startupMsg);
+            await this.notifyAdmins(startupMsg, group);
         }
     }
     
     async handleMessage(message) {
-        // Check if message is from the target group
-        if (!this.targetGroupId || message.from !== this.targetGroupId) {
+        // Admin asking in private for a re-analysis with a hint
+        if (!message.fromMe && this.adminIds.has(message.from) && message.body?.startsWith('🔄')) {
+            await this.handleReanalysisCommand(message);
+            return;
+        }
+        
+        // Check if message is from a moderated group
+        const group = this.groups.get(message.from);
+        if (!group) {
             return; 
         }
         
@@ -178,20 +233,19 @@ class WhatsAppModerationBot {
         }
         
         // Log message details for debugging
-        console.log(`\nAnalyzing new message from Orot Barzel group...`);
-        console.log(`DEBUG: Message from group: ${message.from}`);
-        console.log(`DEBUG: Target group: ${this.targetGroupId}`);
+        console.log(`\nAnalyzing new message from group ${group.name}...`);
+        console.log(`DEBUG: Message from group: ${message.from} (${group.id})`);
         console.log(`DEBUG: Sender: ${message.author || message.from}`);
-        console.log(`DEBUG: Is admin: ${this.adminIds.has(message.author || message.from)}`);
+        console.log(`DEBUG: Is admin: ${group.admins.has(message.author || message.from)}`);
         console.log(`DEBUG: Message body: "${message.body}"`);
-        console.log(`DEBUG: All members size: ${this.allMembers.size}`);
-        console.log(`DEBUG: Admin IDs: ${Array.from(this.adminIds).join(', ')}`);
+        console.log(`DEBUG: All members size: ${group.members.size}`);
+        console.log(`DEBUG: Admin IDs: ${Array.from(group.admins).join(', ')}`);
         
         // Get the actual sender ID
         const senderId = message.author || message.from;
         
         // Check if sender is a member (should include ALL members, not just admins)
-        if (!this.allMembers.has(senderId) && !senderId.endsWith('@g.us')) {
+        if (!group.members.has(senderId) && !senderId.endsWith('@g.us')) {
             console.log(`Message from unknown user ${senderId}`);
             // Still process the message but flag it
         }
@@ -199,18 +253,24 @@ class WhatsAppModerationBot {
         console.log(`New message from ${senderId}: "${message.body?.substring(0, 50) || '[מדיה]'}..."`);
         
         try {
-            await this.processMessage(message);
+            await this.processMessage(message, group);
         } catch (error) {
             console.error('Error processing message:', error);
-            await this.notifyAdmins(`Error processing message from: ${senderId}: ${error.message}`);
+            await this.notifyAdmins(`Error processing message from: ${senderId}: ${error.message}`, group);
         }
     }
     
-    async processMessage(message) {
+    async processMessage(message, group) {
+        const envelope = await this.buildEnvelope(message);
         const messageData = {
             id: message.id._serialized,
+            // Picks the group's rules and database on the server
+            groupId: group.id,
             userId: message.author || message.from,
-            content: message.body || '[מדיה]',
+            content: message.body || '',
+            // Sent for moderation; the server adds the "[mimetype]" prefix from the envelope
+            body: message.body || '',
+            envelope: envelope,
             timestamp: new Date(message.timestamp * 1000),
             // Add message type for better processing
             messageType: message.type,
@@ -218,15 +278,10 @@ class WhatsAppModerationBot {
             isForwarded: message.isForwarded
         };
         
-        // Handle different message types
         if (message.hasMedia) {
-            try {
-                const media = await message.downloadMedia();
-                messageData.content = `[${media.mimetype}] ${message.body || 'קובץ מדיה'}`;
-            } catch (error) {
-                console.log('Unavle to download media', error.message);
-                messageData.content = `[מדיה] ${message.body || 'קובץ מדיה'}`;
-            }
+            // Shown to the admins and in logs
+            messageData.content = `[${envelope.mimetype || 'מדיה'}] ${message.body || 'קובץ מדיה'}`;
+            envelope.caption = messageData.body;
         }
         
         console.log(`Sending for analysis: ${messageData.content.substring(0, 50)}...`);
@@ -242,73 +297,62 @@ class WhatsAppModerationBot {
                 confidence: 0.0,
                 action: "FLAG_FOR_REVIEW",
                 reasoning: "לא ניתן לנתח את ההודעה כראוי. יש לבדוק ידנית.",
-            }, await this.getContactName(messageData.userId), messageData);
+            }, await this.getContactName(messageData.userId), messageData, group);
             return;
         }
         
         console.log(`Analysis result: ${result.classification} (${(result.confidence * 100).toFixed(1)}%)`);
         
+        await this.trackDegradedMode(result);
+        
         // Execute action based on result
-        await this.executeAction(result, message, messageData);
+        await this.executeAction(result, message, messageData, group);
+    }
+    
+    async buildEnvelope(message) {
+        // Metadata only - the media itself is never downloaded
+        const envelope = {
+            type: message.type,
+            mimetype: message._data?.mimetype || '',
+            size: message._data?.size ?? null,
+            forwarded: Boolean(message.isForwarded),
+            caption: '',
+            quoted_message_id: ''
+        };
+        
+        if (message.hasQuotedMsg) {
+            try {
+                const quoted = await message.getQuotedMessage();
+                envelope.quoted_message_id = quoted?.id?._serialized || '';
+            } catch (error) {
+                console.log('Unable to get quoted message', error.message);
+            }
+        }
+        
+        return envelope;
     }
     
     async callModerationAgent(messageData) {
-        return new Promise((resolve, reject) => {
-            const pythonProcess = spawn('python', [
-                'moderation_api.py',
-                messageData.id,
-                messageData.userId,
-                messageData.content
-            ], {
-                cwd: process.cwd()
-            });
-            
-            let result = '';
-            let error = '';
-            
-            pythonProcess.stdout.on('data', (data) => {
-                result += data.toString();
-            });
-            
-            pythonProcess.stderr.on('data', (data) => {
-                error += data.toString();
-            });
-            
-            pythonProcess.on('close', (code) => {
-                if (code === 0) {
-                    try {
-                        const parsedResult = JSON.parse(result);
-                        resolve(parsedResult);
-                    } catch (e) {
-                        console.error('JSON parsing error:', e);
-                        console.error('Python response:', result);
-                        resolve(null);
-                    }
-                } else {
-                    console.error('Python process failed:', error);
-                    resolve(null);
-                }
-            });
-            
-            // Timeout after 15 seconds
-            setTimeout(() => {
-                pythonProcess.kill();
-                console.log('Python process timeout');
-                resolve(null);
-            }, 15000);
-        });
+        // Persistent moderation server - warm agent, replies matched by message_id
+        return this.moderationClient.moderate(messageData);
     }
     
-    async executeAction(result, message, messageData) {
+    async executeAction(result, message, messageData, group) {
         const contact = await this.getContactName(messageData.userId);
         
         switch (result.action) {
             case 'DELETE_MESSAGE':
-                await this.deleteMessage(message, result, contact);
+                await this.deleteMessage(message, result, contact, messageData, group);
                 break;
                 
             case 'FLAG_FOR_REVIEW':
-                await this.flagForReview(message, result, contact, messageData);
+                await this.flagForReview(message, result, contact, messageData, group);
+                break;
+                
+            case 'APPROVE_DEGRADED':
+                // LLM unavailable - approved provisionally, no admin message per message
+                this.degradedApprovals++;
+                console.log(`Message approved (degraded mode): ${messageData.content.substring(0, 30)}...`);
                 break;
                 
             case 'APPROVE':
@@ -324,7 +368,40 @@ class WhatsAppModerationBot {
         }
     }
     
-    async deleteMessage(message, result, contact) {
+    /**
+     * One admin notice when degraded mode starts and one when it ends,
+     * instead of a review message for every message during an outage.
+     * Follows the LLM circuit breaker sent with each reply, not the
+     * message's own verdict: rules, cache and local verdicts arrive during
+     * an outage too, and a burst can shed a message without one.
+     */
+    async trackDegradedMode(result) {
+        if (!result.llm_breaker) {
+            return; // Error reply or breaker disabled - nothing known
+        }
+        const llmDown = result.llm_breaker !== 'closed';
+        if (llmDown && !this.degradedSince) {
+            this.degradedSince = new Date();
+            this.degradedApprovals = 0;
+            await this.notifyAdmins(`⚠️ **מצב מוגבל - ה-LLM לא זמין**
+
+הודעות נבדקות כעת לפי כללים בלבד.
+הודעות עם סימנים רגישים יסומנו לבדיקה, שאר ההודעות מאושרות זמנית.
+
+⏰ ${this.degradedSince.toLocaleString('he-IL')}`);
+        } else if (!llmDown && this.degradedSince) {
+            const minutes = Math.round((Date.now() - this.degradedSince.getTime()) / 60000);
+            const approvals = this.degradedApprovals;
+            this.degradedSince = null;
+            this.degradedApprovals = 0;
+            await this.notifyAdmins(`✅ **ה-LLM זמין שוב**
+
+משך המצב המוגבל: ${minutes} דקות
+הודעות שאושרו זמנית: ${approvals}`);
+        }
+    }
+    
+    async deleteMessage(message, result, contact, messageData, group) {
         try {
             // Try to delete the message
             await message.delete(true);
@@ -332,7 +409,7 @@ class WhatsAppModerationBot {
             
             // Notify admins
             const notificationMsg = `🚨 **הודעה נמחקה אוטומטית**
-
+${this.groupLine(group)}
 👤 **משתמש:** ${contact}
 🏷️ **סיווג:** ${result.classification}
 📊 **ביטחון:** ${(result.confidence * 100).toFixed(1)}%
@@ -343,7 +420,7 @@ class WhatsAppModerationBot {
 
 ⏰ **זמן:** ${new Date().toLocaleString('he-IL')}`;
 
-            await this.notifyAdmins(notificationMsg);
+            await this.notifyAdmins(notificationMsg, group);
             
         } catch (error) {
             console.error('נכשל במחיקת הודעה:', error);
@@ -352,23 +429,30 @@ class WhatsAppModerationBot {
             await this.flagForReview(message, {
                 ...result,
                 reasoning: `מחיקה אוטומטית נכשלה: ${error.message}. ${result.reasoning}`
-            }, contact, { content: message.body });
+            }, contact, messageData, group);
         }
     }
     
-    async flagForReview(message, result, contact, messageData) {
+    groupLine(group) {
+        // Only worth a line when admins get reviews from more than one group
+        return group && this.groups.size > 1 ? `\n👥 **קבוצה:** ${group.name}` : '';
+    }
+    
+    async flagForReview(message, result, contact, messageData, group) {
         const reviewId = `review_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
         
         // Store for reaction handling
         this.pendingReviews.set(message.id._serialized, {
             reviewId,
             messageId: messageData.id,
+            groupId: group.id,
+            content: messageData.content,
             result,
             timestamp: new Date()
         });
         
         const reviewMsg = `**הודעה מסומנת לבדיקה**
-
+${this.groupLine(group)}
 👤 **משתמש:** ${contact}
 🏷️ **סיווג:** ${result.classification}
 📊 **ביטחון:** ${(result.confidence * 100).toFixed(1)}%
@@ -386,18 +470,13 @@ class WhatsAppModerationBot {
 🆔 Review ID: ${reviewId}
 ⏰ ${new Date().toLocaleString('he-IL')}`;
 
-        await this.notifyAdmins(reviewMsg);
+        await this.notifyAdmins(reviewMsg, group);
         
         console.log(`Message flagged for review: ${reviewId}`);
     }
     
     async handleReaction(reaction) {
         try {
-            // Check if reaction is from admin
-            if (!this.adminIds.has(reaction.senderId)) {
-                return;
-            }
-            
             const messageId = reaction.msgId._serialized;
             const reactionEmoji = reaction.reaction;
             
@@ -407,10 +486,15 @@ class WhatsAppModerationBot {
             }
             
             const reviewData = this.pendingReviews.get(messageId);
+            
+            // Check if reaction is from an admin of the review's group
+            if (!this.groupById(reviewData.groupId)?.admins.has(reaction.senderId)) {
+                return;
+            }
             console.log(`Admin reacted ${reactionEmoji} to review ${reviewData.reviewId}`);
             
             // Process the feedback
-            await this.processFeedback(reviewData, reactionEmoji);
+            await this.processFeedback({ ...reviewData, reviewKey: messageId }, reactionEmoji);
             
             // Remove from pending
             this.pendingReviews.delete(messageId);
@@ -420,7 +504,23 @@ class WhatsAppModerationBot {
         }
     }
     
-    async processFeedback(reviewData, reaction) {
+    async handleReanalysisCommand(message) {
+        // Format: 🔄 <Review ID> <hint>
+        const [, reviewId, ...hintWords] = message.body.trim().split(/\s+/);
+        const entry = [...this.pendingReviews.entries()]
+            .find(([, reviewData]) => reviewData.reviewId === reviewId);
+        
+        if (!entry) {
+            await message.reply(`לא נמצאה בדיקה פתוחה עם המזהה ${reviewId || ''}\nפורמט: 🔄 <Review ID> <הסבר>`);
+            return;
+        }
+        
+        const [key, reviewData] = entry;
+        await this.processFeedback({ ...reviewData, reviewKey: key }, '🔄', hintWords.join(' ') || null);
+        this.pendingReviews.delete(key);
+    }
+    
+    async processFeedback(reviewData, reaction, hint = null) {
         const feedbackMapping = {
             '✅': 'CORRECT',
             '❌': 'INCORRECT',
@@ -434,38 +534,136 @@ class WhatsAppModerationBot {
             return;
         }
         
-        // Send feedback to Python agent
+        if (feedbackType === 'REANALYZE') {
+            this.reanalysisRequests.set(reviewData.messageId, reviewData);
+        }
+        
+        // Sent to the Python agent with the other reactions of the next few seconds
+        this.feedbackQueue.push({ reviewData, reaction, hint });
+        if (!this.feedbackTimer) {
+            this.feedbackTimer = setTimeout(() => this.flushFeedback(), FEEDBACK_FLUSH_MS);
+        }
+    }
+    
+    async flushFeedback() {
+        if (this.feedbackTimer) {
+            clearTimeout(this.feedbackTimer);
+            this.feedbackTimer = null;
+        }
+        
+        const batch = this.feedbackQueue.splice(0);
+        if (batch.length === 0) {
+            return;
+        }
+        
+        const items = batch.map(({ reviewData, reaction, hint }) => ({
+            message_id: reviewData.messageId,
+            group_id: reviewData.groupId,
+            reaction,
+            hint
+        }));
+        
         try {
-            const feedbackProcess = spawn('python', [
-                'process_feedback.py',
-                reviewData.messageId,
-                reaction
-            ]);
+            let result = await this.moderationClient.feedback(items);
+            if (!result) {
+                // Server unavailable - one process for the whole batch
+                result = await this.runFeedbackProcess(items);
+            }
             
-            feedbackProcess.on('close', (code) => {
-                if (code === 0) {
-                    console.log(`Feedback sent successfully: ${reaction}`);
-                } else {
-                    console.error(`Error sending feedback: code ${code}`);
-                }
-            });
+            if (result) {
+                console.log(`Feedback sent successfully: ${items.length} reactions`);
+            } else {
+                console.error(`Error sending feedback: ${items.length} reactions lost`);
+                return;
+            }
             
-            // Acknowledge feedback
-            const ackMsg = `**פידבק התקבל**
+            // Acknowledge feedback - one message per batch to each group's admins
+            const byGroup = new Map();
+            for (const entry of batch) {
+                const groupId = entry.reviewData.groupId;
+                byGroup.set(groupId, [...(byGroup.get(groupId) || []), entry]);
+            }
+            
+            for (const [groupId, entries] of byGroup) {
+                const lines = entries.map(({ reviewData, reaction, hint }) =>
+                    `🆔 ${reviewData.reviewId}: ${this.getFeedbackDescription(reaction)}${hint ? ` (${hint})` : ''}`);
+                const ackMsg = `**פידבק התקבל**
 
-🆔 Review: ${reviewData.reviewId}
-📝 פעולה: ${this.getFeedbackDescription(reaction)}
+${lines.join('\n')}
 🕐 זמן: ${new Date().toLocaleString('he-IL')}
 
-הסוכן ילמד מהפידבק הזה!`;
+הסוכן ילמד מהפידבק הזה!${entries.some(({ reaction }) => reaction === '🔄') ? '\nתוצאות הניתוח מחדש יישלחו כשיהיו מוכנות.' : ''}`;
 
-            await this.notifyAdmins(ackMsg);
+                await this.notifyAdmins(ackMsg, this.groupById(groupId));
+            }
             
         } catch (error) {
             console.error('Error processing feedback:', error);
         }
     }
     
+    runFeedbackProcess(items) {
+        return new Promise((resolve) => {
+            const feedbackProcess = spawn('python', ['process_feedback.py', '-']);
+            
+            feedbackProcess.on('error', (error) => {
+                console.error('Failed to start process_feedback.py:', error.message);
+                resolve(null);
+            });
+            feedbackProcess.on('close', (code) => {
+                resolve(code === 0 ? { processed: items.length } : null);
+            });
+            
+            feedbackProcess.stdin.end(JSON.stringify(items));
+        });
+    }
+    
+    async checkReanalysisResults() {
+        const response = await this.moderationClient.reanalysisResults();
+        if (!response || !response.results) {
+            return;
+        }
+        
+        for (const job of response.results) {
+            const reviewData = this.reanalysisRequests.get(job.message_id);
+            this.reanalysisRequests.delete(job.message_id);
+            const reviewId = reviewData ? reviewData.reviewId : job.message_id;
+            const content = reviewData?.content || '';
+            const group = this.groupById(job.group_id || reviewData?.groupId);
+            
+            if (job.status !== 'done') {
+                await this.notifyAdmins(`**ניתוח מחדש נכשל**
+
+🆔 Review: ${reviewId}
+💭 ${job.error || 'לא ידוע'}
+
+ההחלטה הקודמת נשמרה.`, group);
+                continue;
+            }
+            
+            await this.notifyAdmins(`🔄 **תוצאת ניתוח מחדש**
+
+🆔 Review: ${reviewId}
+🏷️ **סיווג קודם:** ${job.previous_classification} → **חדש:** ${job.classification}
+📊 **ביטחון:** ${(job.confidence * 100).toFixed(1)}%
+💭 **נימוק:** ${job.reasoning}${job.hint ? `\n💡 **רמז המנהל:** ${job.hint}` : ''}
+
+📝 **תוכן ההודעה:**
+"${content.substring(0, 300)}${content.length > 300 ? '...' : ''}"
+
+**ניתן להגיב שוב עם ✅❌⚠️🔄**`, group);
+            
+            // The review is open again for the new verdict
+            if (reviewData && reviewData.reviewKey) {
+                this.pendingReviews.set(reviewData.reviewKey, {
+                    ...reviewData,
+                    result: job,
+                    timestamp: new Date()
+                });
+            }
+        }
+    }
+    
     getFeedbackDescription(reaction) {
         const descriptions = {
             '✅': 'הסוכן טעה - ההודעה תקינה',
@@ -477,14 +675,15 @@ class WhatsAppModerationBot {
     }
     
     async handleGroupJoin(notification) {
-        if (notification.chatId !== this.targetGroupId) {
+        const group = this.groups.get(notification.chatId);
+        if (!group) {
             return;
         }
         
         // Add new members to tracking
         const newMembers = notification.recipientIds;
         for (const memberId of newMembers) {
-            this.allMembers.add(memberId._serialized);
+            group.members.add(memberId._serialized);
             console.log(`New member added to tracking: ${memberId.user}`);
         }
         
@@ -494,7 +693,7 @@ class WhatsAppModerationBot {
 
 🆕 חברים: ${newMemberNames.join(', ')}
 ⏰ זמן: ${new Date().toLocaleString('he-IL')}
-📊 סה"כ חברים: ${this.allMembers.size}
+📊 סה"כ חברים: ${group.members.size}
 
 💡 **תזכורת לחברים החדשים:**
 • קראו את תקנון הקבוצה
@@ -503,24 +702,26 @@ class WhatsAppModerationBot {
 
 🤖 הבוט יתחיל לפקח על הודעותיהם`;
 
-        await this.notifyAdmins(joinMsg);
+        await this.notifyAdmins(joinMsg, group);
         console.log(`New members: ${newMemberNames.join(', ')}`);
     }
     
     // FIX: Add handler for members leaving
     async handleGroupLeave(notification) {
-        if (notification.chatId !== this.targetGroupId) {
+        const group = this.groups.get(notification.chatId);
+        if (!group) {
             return;
         }
         
         const leftMembers = notification.recipientIds;
         for (const memberId of leftMembers) {
-            this.allMembers.delete(memberId._serialized);
-            this.adminIds.delete(memberId._serialized); // Remove from admins too if needed
+            group.members.delete(memberId._serialized);
+            group.admins.delete(memberId._serialized); // Remove from admins too if needed
             console.log(`Member removed from tracking: ${memberId.user}`);
         }
+        this.adminIds = new Set([...this.groups.values()].flatMap(g => [...g.admins]));
         
-        console.log(`Active members ${this.allMembers.size}`);
+        console.log(`Active members ${group.members.size}`);
     }
     
     needsMediaWarning(content) {
@@ -550,8 +751,10 @@ class WhatsAppModerationBot {
         }
     }
     
-    async notifyAdmins(message) {
-        for (const adminId of this.adminIds) {
+    async notifyAdmins(message, group = null) {
+        // A group's own admins, or every group's admins for bot-wide notices
+        const adminIds = group ? group.admins : this.adminIds;
+        for (const adminId of adminIds) {
             try {
                 await this.client.sendMessage(adminId, message);
             } catch (error) {
@@ -561,9 +764,15 @@ class WhatsAppModerationBot {
     }
     
     async sendDailyReport() {
+        for (const group of this.groups.values()) {
+            await this.sendGroupDailyReport(group);
+        }
+    }
+    
+    async sendGroupDailyReport(group) {
         try {
-            // Get stats from Python agent
-            const statsProcess = spawn('python', ['get_daily_stats.py']);
+            // Get stats from Python agent - the group's own database
+            const statsProcess = spawn('python', ['get_daily_stats.py', group.id]);
             
             let statsResult = '';
             statsProcess.stdout.on('data', (data) => {
@@ -574,8 +783,8 @@ class WhatsAppModerationBot {
                 if (code === 0) {
                     try {
                         const stats = JSON.parse(statsResult);
-                        const reportMsg = this.generateDailyReport(stats);
-                        this.notifyAdmins(reportMsg);
+                        const reportMsg = this.generateDailyReport(stats, group);
+                        this.notifyAdmins(reportMsg, group);
                     } catch (e) {
                         console.error('Error in parsing statistics:', e);
                     }
@@ -587,9 +796,9 @@ class WhatsAppModerationBot {
         }
     }
     
-    generateDailyReport(stats) {
+    generateDailyReport(stats, group) {
         return `**דוח יומי - סוכן חמ"ל**
-
+${this.groupLine(group)}
 **סטטיסטיקות היום:**
 • 📨 הודעות שנותחו: ${stats.daily_messages || 0}
 • ✅ הודעות שאושרו: ${stats.approved || 0}
@@ -597,8 +806,8 @@ class WhatsAppModerationBot {
 • 🗑️ הודעות שנמחקו: ${stats.deleted || 0}
 
 👥 **מעקב חברים:**
-• סה"כ חברים פעילים: ${this.allMembers.size}
-• מנהלים: ${this.adminIds.size}
+• סה"כ חברים פעילים: ${group.members.size}
+• מנהלים: ${group.admins.size}
 
  ** ביצועי סוכן חמ"ל:**
 • דיוק כולל: ${stats.accuracy || 0}%
@@ -612,6 +821,7 @@ class WhatsAppModerationBot {
     
     async start() {
         console.log('⬆Uploading WhatsApp Moderation Bot...');
+        this.moderationClient.start();
         await this.client.initialize();
         
         // Schedule daily report (every day at 08:00)
@@ -623,24 +833,35 @@ class WhatsAppModerationBot {
         }, 60000); // Check every minute
         
         console.log('Daily update set to 20:00');
+        
+        // Verdicts of 🔄 re-analysis finished in the background
+        setInterval(() => {
+            this.checkReanalysisResults().catch((error) => {
+                console.error('Error checking re-analysis results:', error);
+            });
+        }, REANALYSIS_POLL_MS);
     }
     
     async stop() {
         console.log('Stopping WhatsApp Bot...');
+        await this.flushFeedback();
+        this.moderationClient.stop();
         await this.client.destroy();
     }
     
     // Utility methods
-    async getGroupInfo() {
-        if (!this.targetGroupId) return null;
+    async getGroupInfo(groupId) {
+        const tracked = this.groupById(groupId);
+        if (!tracked) return null;
         
         try {
-            const group = await this.client.getChatById(this.targetGroupId);
+            const group = await this.client.getChatById(tracked.chatId);
             return {
+                id: tracked.id,
                 name: group.name,
                 participants: group.participants.length,
-                trackedMembers: this.allMembers.size,
-                admins: this.adminIds.size,
+                trackedMembers: tracked.members.size,
+                admins: tracked.admins.size,
                 description: group.description
             };
         } catch (error) {
@@ -652,23 +873,14 @@ class WhatsAppModerationBot {
     // Add method to manually refresh member list
     async refreshMemberList() {
         try {
-            if (!this.targetGroupId) return false;
-            
-            const group = await this.client.getChatById(this.targetGroupId);
+            if (this.groups.size === 0) return false;
             
             // Clear and rebuild member lists
-            this.allMembers.clear();
-            this.adminIds.clear();
-            
-            for (const participant of group.participants) {
-                this.allMembers.add(participant.id._serialized);
-                
-                if (participant.isAdmin || participant.isSuperAdmin) {
-                    this.adminIds.add(participant.id._serialized);
-                }
+            for (const tracked of this.groups.values()) {
+                const group = await this.client.getChatById(tracked.chatId);
+                this.loadParticipants(tracked, group.participants);
+                console.log(`Members list of ${tracked.id} is up-to-date: ${tracked.members.size} Friends, ${tracked.admins.size} Admins`);
             }
-            
-            console.log(`Members list is up-to-date: ${this.allMembers.size} Friends, ${this.adminIds.size} Admins`);
             return true;
             
         } catch (error) {
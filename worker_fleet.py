@@ -0,0 +1,501 @@
+"""
+Process-pool execution of the moderation workflow.
+
+One server process runs the rules, the local classifier, the workflow and
+JSON parsing on a single core. WorkerFleet spreads moderation over worker
+processes, each with its own ModerationGroups (LLM client, scheduler,
+circuit breaker and in-memory tiers) on the same group databases.
+
+Messages are routed by consistent hashing on user_id, so one worker sees
+all of a user's messages, handles them in arrival order and keeps the
+user's history ring buffer in its memory. Resizing the fleet moves only
+about 1/N of the users.
+
+Workers send a heartbeat every second with how long their oldest running
+message has been running. A worker that exits, stops sending heartbeats,
+or has been stuck on one message for task_timeout_s (a wedged thread
+pool keeps the heartbeat thread alive) is killed and restarted in the
+same slot, and the messages it had in flight go to the new worker in
+their original order. A
+message that is still unanswered after max_retries restarts fails with
+WorkerCrashed, so one poison message cannot take the slot down forever.
+
+Admin feedback is applied in the dispatcher's process and forwarded to
+every worker (FeedbackProcessor.on_applied/refresh), so their caches
+forget the same verdicts and their classifiers learn from the same labels.
+Only the dispatcher saves the local classifier: workers keep their online
+updates in memory and send their LLM verdicts back (on_result), so the
+stored model learns from all of them and is never overwritten by a
+worker's partial copy.
+Every process has its own rate-limit scheduler, so the caller splits the
+Groq quota between them.
+"""
+import bisect
+import hashlib
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from multiprocessing.connection import wait
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from group_config import GroupConfig
+from llm_scheduler import DEFAULT_DEADLINE_S
+from moderation_metrics import Histogram
+
+DEFAULT_PROCESSES = 2
+DEFAULT_THREADS = 8
+DEFAULT_VIRTUAL_NODES = 64
+DEFAULT_MAX_RETRIES = 2
+HEARTBEAT_INTERVAL_S = 1.0
+DEFAULT_HEALTH_TIMEOUT_S = 10.0
+# A message takes at most its deadline plus one LLM call
+DEFAULT_TASK_TIMEOUT_S = 30.0
+# Spawned workers import langchain and warm their tiers before the first heartbeat
+DEFAULT_STARTUP_TIMEOUT_S = 60.0
+MONITOR_INTERVAL_S = 0.5
+# Past the deadline, for the worker to save and reply
+REPLY_MARGIN_S = 5.0
+STOP_TIMEOUT_S = 10.0
+
+
+class WorkerCrashed(Exception):
+    """The message's worker died every time it was tried"""
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes, virtual_nodes: int = DEFAULT_VIRTUAL_NODES):
+        points = sorted((_hash(f"{node}#{index}"), node)
+                        for node in nodes for index in range(max(1, virtual_nodes)))
+        if not points:
+            raise ValueError("A hash ring needs at least one node")
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: str):
+        """Node owning key: the first point clockwise from the key's hash"""
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class _WorkerLoop:
+    """Worker side: runs messages on a thread pool, one at a time per user"""
+
+    def __init__(self, conn, groups, threads: int):
+        self.conn = conn
+        self.groups = groups
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads),
+                                           thread_name_prefix="fleet")
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Users with a message running -> their messages waiting behind it
+        self._waiting: Dict[Tuple[str, str], Deque[Tuple[int, Dict]]] = {}
+        # Task id -> when it started running
+        self._running: Dict[int, float] = {}
+        self._stopped = threading.Event()
+
+    def send(self, message: Tuple) -> None:
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _heartbeat(self) -> None:
+        while not self._stopped.wait(HEARTBEAT_INTERVAL_S):
+            with self._lock:
+                started = min(self._running.values(), default=None)
+            oldest = time.monotonic() - started if started is not None else 0.0
+            try:
+                self.send(("heartbeat", oldest))
+            except OSError:
+                return
+
+    def _submit(self, task_id: int, request: Dict) -> None:
+        key = (request.get('group_id') or "", request['user_id'])
+        with self._lock:
+            if key in self._waiting:
+                self._waiting[key].append((task_id, request))
+                return
+            self._waiting[key] = deque()
+        self.executor.submit(self._run_user, key, task_id, request)
+
+    def _run_user(self, key: Tuple[str, str], task_id: int, request: Dict) -> None:
+        """Run a user's message, then the ones that arrived meanwhile"""
+        while True:
+            with self._lock:
+                self._running[task_id] = time.monotonic()
+            try:
+                result = self.groups.process_message(
+                    request.get('group_id'), request['message_id'], request['user_id'],
+                    request['content'], durable=request.get('durable', False),
+                    deadline=request.get('deadline'), envelope=request.get('envelope'))
+                reply = ("result", task_id, result, None)
+            except Exception as e:
+                reply = ("result", task_id, None, str(e))
+            finally:
+                with self._lock:
+                    del self._running[task_id]
+            try:
+                self.send(reply)
+            except OSError:
+                return  # Dispatcher gone
+
+            with self._lock:
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                    return
+                task_id, request = self._waiting[key].popleft()
+
+    def _refresh(self, group_id: str, message_id: str, message: Dict, label: str) -> None:
+        try:
+            self.groups.agent(group_id).feedback.refresh(message_id, message, label)
+        except Exception as e:
+            print(f"Worker {os.getpid()}: feedback refresh failed: {e}", file=sys.stderr)
+
+    def serve(self) -> None:
+        threading.Thread(target=self._heartbeat, name="fleet-heartbeat", daemon=True).start()
+        self.send(("ready", os.getpid()))
+        try:
+            while True:
+                try:
+                    message = self.conn.recv()
+                except (EOFError, OSError):
+                    break  # Dispatcher gone
+                if message[0] == "moderate":
+                    self._submit(message[1], message[2])
+                elif message[0] == "feedback":
+                    self.executor.submit(self._refresh, *message[1:])
+                elif message[0] == "stop":
+                    break
+        finally:
+            # Finish the messages already taken, then flush pending writes
+            self.executor.shutdown(wait=True)
+            self._stopped.set()
+            self.groups.close()
+
+
+def _worker_main(conn, groq_api_key: str, configs: List[GroupConfig], threads: int,
+                 llm_factory: Optional[Callable], options: Dict) -> None:
+    """Entry point of a worker process"""
+    # Ctrl-C reaches the whole process group; the dispatcher decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from moderation_groups import ModerationGroups
+
+    groups = ModerationGroups(groq_api_key, configs,
+                              llm=llm_factory() if llm_factory is not None else None,
+                              persist_local_classifier=False, **options)
+    _WorkerLoop(conn, groups, threads).serve()
+
+
+class _Task:
+    __slots__ = ("task_id", "request", "future", "attempts", "sent_at")
+
+    def __init__(self, task_id: int, request: Dict):
+        self.task_id = task_id
+        self.request = request
+        self.future: Future = Future()
+        self.attempts = 0
+        self.sent_at = 0.0
+
+
+class _Slot:
+    """Dispatcher-side state of one worker process"""
+
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.started = time.monotonic()
+        self.last_seen = self.started
+        self.pid: Optional[int] = None
+        self.ready = False
+        # Seconds the worker's oldest running message had run at its last heartbeat
+        self.oldest_task_s = 0.0
+        # Task id -> task, in the order they were sent
+        self.in_flight: "OrderedDict[int, _Task]" = OrderedDict()
+        self.restarts = 0
+        self.processed = 0
+        self.errors = 0
+        # Send to reply, including the wait behind the user's earlier messages
+        self.latency = Histogram()
+
+
+class WorkerFleet:
+    """Dispatches moderation to worker processes by user affinity"""
+
+    def __init__(self, groq_api_key: str, groups: List[GroupConfig],
+                 processes: int = DEFAULT_PROCESSES, threads: int = DEFAULT_THREADS,
+                 llm_factory: Optional[Callable] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 health_timeout_s: float = DEFAULT_HEALTH_TIMEOUT_S,
+                 task_timeout_s: float = DEFAULT_TASK_TIMEOUT_S,
+                 startup_timeout_s: float = DEFAULT_STARTUP_TIMEOUT_S,
+                 virtual_nodes: int = DEFAULT_VIRTUAL_NODES, **group_options):
+        if processes < 1:
+            raise ValueError("A worker fleet needs at least one process")
+        self.groq_api_key = groq_api_key
+        self.configs = list(groups)
+        self.threads = threads
+        # Called in each worker to build its LLM client (None = ChatGroq)
+        self.llm_factory = llm_factory
+        self.group_options = group_options
+        self.max_retries = max(0, max_retries)
+        self.health_timeout_s = health_timeout_s
+        self.task_timeout_s = task_timeout_s
+        self.startup_timeout_s = startup_timeout_s
+        self.ring = HashRing(range(processes), virtual_nodes)
+
+        # Workers start fresh instead of forking a process that already runs threads
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._next_task = 0
+        self._closed = False
+        self._stopped = threading.Event()
+        self._reader_stopped = threading.Event()
+
+        self.retried = 0
+        self.crashed = 0
+        # Called with (request, result) for every answered message, on the reader thread
+        self.on_result: Optional[Callable[[Dict, Dict], None]] = None
+
+        self._slots = [self._spawn(index) for index in range(processes)]
+        self._reader = threading.Thread(target=self._read, name="fleet-reader", daemon=True)
+        self._reader.start()
+        self._monitor = threading.Thread(target=self._watch, name="fleet-monitor", daemon=True)
+        self._monitor.start()
+
+    def _spawn(self, index: int) -> _Slot:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, name=f"moderation-worker-{index}", daemon=True,
+            args=(child_conn, self.groq_api_key, self.configs, self.threads,
+                  self.llm_factory, self.group_options))
+        process.start()
+        child_conn.close()
+        return _Slot(index, process, parent_conn)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until every worker has started; False on timeout"""
+        with self._ready:
+            return self._ready.wait_for(lambda: all(s.ready for s in self._slots), timeout)
+
+    def _send(self, index: int, task: _Task) -> None:
+        """Hand a task to a worker; a dead worker's tasks are resent by the monitor"""
+        with self._lock:
+            # Looked up under the lock, so a restart either sees the task or replaces the slot first
+            slot = self._slots[index]
+            slot.in_flight[task.task_id] = task
+        task.sent_at = time.monotonic()
+        try:
+            with slot.send_lock:
+                slot.conn.send(("moderate", task.task_id, task.request))
+        except (OSError, ValueError):
+            pass
+
+    def submit(self, request: Dict) -> Future:
+        """Queue a moderate request (message_id, user_id, content, ...) on its user's worker"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker fleet is closed")
+            self._next_task += 1
+            task = _Task(self._next_task, request)
+        self._send(self.ring.node(str(request['user_id'])), task)
+        return task.future
+
+    def process_message(self, group_id: Optional[str], message_id: str, user_id: str,
+                        content: str, durable: bool = False, deadline: Optional[float] = None,
+                        envelope: Optional[Dict] = None) -> Dict:
+        """Moderate a message on its user's worker (same result as ModerationGroups).
+
+        Raises TimeoutError when the worker has not replied REPLY_MARGIN_S
+        after the deadline (DEFAULT_DEADLINE_S from now when there is none).
+        """
+        # time.monotonic() is system-wide, so the deadline means the same in the worker
+        future = self.submit({
+            'group_id': group_id, 'message_id': message_id, 'user_id': user_id,
+            'content': content, 'durable': durable, 'deadline': deadline, 'envelope': envelope,
+        })
+        if deadline is None:
+            deadline = time.monotonic() + DEFAULT_DEADLINE_S
+        timeout = max(0.0, deadline - time.monotonic()) + REPLY_MARGIN_S
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise TimeoutError(f"No reply from the worker for message {message_id} "
+                               f"within {timeout:.1f}s") from None
+
+    def forward_feedback(self, group_id: str, message_id: str, message: Dict, label: str) -> None:
+        """Replay an applied admin reaction in every worker's tiers"""
+        for slot in list(self._slots):
+            try:
+                with slot.send_lock:
+                    slot.conn.send(("feedback", group_id, message_id, message, label))
+            except (OSError, ValueError):
+                pass  # A restarted worker loads the updated tiers from the database
+
+    def _read(self) -> None:
+        """Collect replies and heartbeats from every worker"""
+        while not self._reader_stopped.is_set():
+            with self._lock:
+                by_conn = {slot.conn: slot for slot in self._slots if not slot.conn.closed}
+            if not by_conn:
+                self._reader_stopped.wait(MONITOR_INTERVAL_S)
+                continue
+            try:
+                ready = wait(list(by_conn), timeout=MONITOR_INTERVAL_S)
+            except (OSError, ValueError):
+                continue  # A connection was closed by a restart
+            for conn in ready:
+                slot = by_conn[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError, ValueError):
+                    # Worker died - the monitor restarts it
+                    conn.close()
+                    continue
+                self._handle(slot, message)
+
+    def _handle(self, slot: _Slot, message: Tuple) -> None:
+        now = time.monotonic()
+        with self._lock:
+            slot.last_seen = now
+            if message[0] == "ready":
+                slot.pid = message[1]
+                slot.ready = True
+                self._ready.notify_all()
+                return
+            if message[0] == "heartbeat":
+                slot.oldest_task_s = message[1]
+                return
+            if message[0] != "result":
+                return
+            _, task_id, result, error = message
+            task = slot.in_flight.pop(task_id, None)
+            if task is None:
+                return  # Already answered by an earlier attempt
+            slot.processed += 1
+            slot.latency.observe(now - task.sent_at)
+            if error is not None:
+                slot.errors += 1
+        if task.future.done():
+            return
+        if error is not None:
+            task.future.set_exception(RuntimeError(error))
+            return
+        task.future.set_result(result)
+        if self.on_result is not None:
+            try:
+                self.on_result(task.request, result)
+            except Exception as e:
+                print(f"Worker fleet: result hook failed: {e}", file=sys.stderr)
+
+    def _watch(self) -> None:
+        """Restart workers that exited, stopped sending heartbeats or are stuck"""
+        while not self._stopped.wait(MONITOR_INTERVAL_S):
+            now = time.monotonic()
+            for slot in list(self._slots):
+                if self._stopped.is_set():
+                    return
+                timeout = self.health_timeout_s if slot.ready else self.startup_timeout_s
+                if not slot.process.is_alive():
+                    self._restart(slot, f"exited with code {slot.process.exitcode}")
+                elif now - slot.last_seen > timeout:
+                    self._restart(slot, f"sent no heartbeat for {now - slot.last_seen:.0f}s")
+                elif slot.oldest_task_s > self.task_timeout_s:
+                    self._restart(slot, f"has run one message for {slot.oldest_task_s:.0f}s")
+
+    def _restart(self, slot: _Slot, reason: str) -> None:
+        if slot.process.is_alive():
+            slot.process.kill()
+        slot.process.join(STOP_TIMEOUT_S)
+        slot.conn.close()
+
+        replacement = self._spawn(slot.index)
+        with self._lock:
+            if self._closed:
+                replacement.process.kill()
+                return
+            replacement.restarts = slot.restarts + 1
+            replacement.processed = slot.processed
+            replacement.errors = slot.errors
+            replacement.latency = slot.latency
+            self._slots[slot.index] = replacement
+            tasks = list(slot.in_flight.values())
+            slot.in_flight.clear()
+        print(f"Worker {slot.index} (pid {slot.pid}) {reason}; restarted, "
+              f"retrying {len(tasks)} messages", file=sys.stderr)
+
+        # Same order as before, so each user's messages stay in sequence
+        for task in tasks:
+            task.attempts += 1
+            if task.attempts > self.max_retries:
+                with self._lock:
+                    self.crashed += 1
+                task.future.set_exception(WorkerCrashed(
+                    f"Worker crashed {task.attempts} times on message "
+                    f"{task.request.get('message_id')}"))
+                continue
+            with self._lock:
+                self.retried += 1
+            self._send(slot.index, task)
+
+    def stats(self) -> Dict:
+        """Queue depth and restarts of the fleet, latency per worker"""
+        with self._lock:
+            workers = [{
+                'slot': slot.index,
+                'pid': slot.pid,
+                'alive': slot.process.is_alive(),
+                'ready': slot.ready,
+                'in_flight': len(slot.in_flight),
+                'oldest_task_s': round(slot.oldest_task_s, 1),
+                'processed': slot.processed,
+                'errors': slot.errors,
+                'restarts': slot.restarts,
+                'latency': slot.latency.summary(),
+            } for slot in self._slots]
+            return {
+                'processes': len(self._slots),
+                'queue_depth': sum(w['in_flight'] for w in workers),
+                'processed': sum(w['processed'] for w in workers),
+                'restarts': sum(w['restarts'] for w in workers),
+                'retried': self.retried,
+                'crashed': self.crashed,
+                'workers': workers,
+            }
+
+    def close(self) -> None:
+        """Let every worker finish its messages and flush its writes, then stop"""
+        with self._lock:
+            self._closed = True
+        self._stopped.set()
+        self._monitor.join()
+        for slot in self._slots:
+            try:
+                with slot.send_lock:
+                    slot.conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+        # The reader keeps collecting the replies of the last messages until the workers exit
+        for slot in self._slots:
+            slot.process.join(STOP_TIMEOUT_S)
+            if slot.process.is_alive():
+                slot.process.kill()
+                slot.process.join()
+        self._reader_stopped.set()
+        self._reader.join()
+        for slot in self._slots:
+            slot.conn.close()
+            for task in slot.in_flight.values():
+                if not task.future.done():
+                    task.future.set_exception(RuntimeError("Worker fleet closed"))
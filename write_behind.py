@@ -0,0 +1,147 @@
+"""
+Write-behind persistence for moderation results.
+
+Decisions are put on a bounded in-process queue and a background thread
+writes them in batched transactions, every batch_size rows or every
+flush_interval_ms, whichever comes first. The verdict is returned to the
+bot without waiting for the commit, unless the caller asks for a durable
+write, in which case submit() blocks until the row's batch is committed.
+"""
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from moderation_storage import ModerationStorage
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_MAX_QUEUE = 10000
+
+_STOP = object()
+
+
+class _Ticket:
+    """Completion signal for one queued write"""
+
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class WriteBehindWriter:
+    """Bounded queue + background batch writer for saved messages"""
+
+    def __init__(self, storage: ModerationStorage, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval_ms: float = DEFAULT_FLUSH_INTERVAL_MS,
+                 max_queue: int = DEFAULT_MAX_QUEUE):
+        self.storage = storage
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, item) -> bool:
+        """Put item on the queue unless closed; False once close() has started"""
+        # Held while putting, so nothing can land behind the stop marker
+        with self._close_lock:
+            if self._closed:
+                return False
+            # Blocks when the queue is full - backpressure instead of unbounded memory
+            self._queue.put(item)
+            return True
+
+    def submit(self, message: Dict, durable: bool = False) -> None:
+        """Queue a message for saving; durable=True waits for the commit"""
+        ticket = _Ticket() if durable else None
+        if not self._enqueue((dict(message), ticket)):
+            # After shutdown fall back to a direct write
+            self.storage.save_message(message)
+            return
+
+        if ticket is not None:
+            ticket.done.wait()
+            if ticket.error is not None:
+                raise ticket.error
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is committed"""
+        ticket = _Ticket()
+        if not self._enqueue((None, ticket)):
+            return True
+        return ticket.done.wait(timeout)
+
+    def close(self) -> None:
+        """Flush remaining rows and stop the writer thread"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict:
+        return {
+            'pending': self.pending(),
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'write_errors': self.write_errors,
+        }
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            # A durable write or flush() closes the batch right away
+            while len(batch) < self.batch_size and batch[-1][1] is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+
+    def _write(self, batch: List) -> None:
+        messages = [message for message, _ in batch if message is not None]
+        error: Optional[BaseException] = None
+
+        if messages:
+            try:
+                self.storage.save_messages(messages)
+                self.rows_written += len(messages)
+                self.batches_written += 1
+            except Exception as e:
+                error = e
+                self.write_errors += 1
+                print(f"Write-behind batch failed ({len(messages)} rows): {e}", file=sys.stderr)
+
+        for message, ticket in batch:
+            if ticket is not None:
+                ticket.error = error if message is not None else None
+                ticket.done.set()